@@ -0,0 +1,155 @@
+"""
+详情导出压测：生成一个虚拟组别 (选手 x 裁判 x 点击)，分别用改动前的实现 (benchmarks/baseline_exporter.py)、
+串行和进程池导出 TXT+SRT，对比耗时 (含冷启动与已解析事件缓存命中两种情况)，
+并校验串行与进程池的压缩包内容完全一致、每个文件与旧实现的输出逐字节相同。
+
+用法:
+  python benchmarks/bench_export.py --players 20 --refs 3 --events 2000 --workers 4
+  python benchmarks/bench_export.py --srt-mode SPLIT --workers 8
+  python benchmarks/bench_export.py --srt-mode ALL          # TXT + 三种 SRT 一次遍历生成
+"""
+import argparse
+import hashlib
+import io
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import utils.storage as storage  # noqa: E402
+from utils.exporter import ExportManager, srt_modes_of  # noqa: E402
+from benchmarks.baseline_exporter import ExportManager as BaselineExportManager  # noqa: E402
+
+GROUP = "Bench"
+
+
+def build_group(mgr, players, refs, events, seed):
+  """
+  按真实 CSV 格式写入虚拟点击记录 (时间戳均匀分布在一场 10 分钟的比赛内)
+  约 5% 的记录只有重点扣分变化 (双机模式的副机 Minus)，用于校验连击划分与旧实现一致
+  """
+  rng = random.Random(seed)
+  t0 = datetime(2025, 1, 1, 12, 0, 0)
+  for p in range(players):
+    name = f"Player{p + 1:03}"
+    for ref in range(1, refs + 1):
+      plus = minus = penalty = 0
+      t = t0
+      for _ in range(events):
+        t += timedelta(milliseconds=rng.expovariate(1 / 300))
+        r = rng.random()
+        if r < 0.05: penalty += 1
+        elif r < 0.9: plus += 1
+        else: minus += 1
+        # 与 StorageManager.log_data 写入的列一致 (见 CSV_HEADER)
+        row = [t.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3], 0, "PRIMARY",
+               plus - minus, 1, plus, minus, penalty]
+        mgr.writer.submit(mgr._get_contestant_filepath(GROUP, name, ref), row)
+  mgr.flush(close=True)
+  return [f"Player{p + 1:03}" for p in range(players)]
+
+
+def run_export(mgr, workers, players, options, rounds=1):
+  """
+  返回每一轮的耗时和最后一轮的压缩包 (同一个 ExportManager：第一轮包含工作进程启动时间)
+  开始前清空已解析事件缓存，各轮之间保留
+  """
+  mgr.events.invalidate_prefix(storage.BASE_DIR)
+  exporter = ExportManager(mgr, workers=workers)
+  # 压测时允许超过 CPU 核数，便于观察进程池本身的开销
+  exporter._pool_size = lambda: workers
+  timings = []
+  try:
+    for _ in range(rounds):
+      t = time.perf_counter()
+      data = exporter.generate_zip(GROUP, players, options).getvalue()
+      timings.append(time.perf_counter() - t)
+  finally:
+    exporter.shutdown()
+  return timings, data
+
+
+def run_baseline(mgr, players, options):
+  """
+  旧实现：每个 SRT 模式各导出一次 (旧版只支持单个 srt_mode)
+  返回 (总耗时, {压缩包内路径: 内容})
+  """
+  exporter = BaselineExportManager(mgr)
+  contents = {}
+  t = time.perf_counter()
+  for mode in srt_modes_of(options):
+    contents.update(entry_contents(exporter.generate_zip(GROUP, players, dict(options, srt_mode=mode)).getvalue()))
+  return time.perf_counter() - t, contents
+
+
+def entry_contents(data):
+  with zipfile.ZipFile(io.BytesIO(data)) as zf:
+    return {info.filename: zf.read(info) for info in zf.infolist()}
+
+
+def entry_digest(data):
+  """压缩包内每个条目的 (路径, 内容哈希)，按写入顺序 (ZIP 条目时间戳不参与比较)"""
+  with zipfile.ZipFile(io.BytesIO(data)) as zf:
+    return [(info.filename, hashlib.sha256(zf.read(info)).hexdigest()) for info in zf.infolist()]
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serial vs process-pool detail export benchmark")
+  parser.add_argument("--players", type=int, default=20)
+  parser.add_argument("--refs", type=int, default=3)
+  parser.add_argument("--events", type=int, default=2000, help="clicks per (player, referee)")
+  parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+  parser.add_argument("--srt-mode", default="REALTIME", choices=["TOTAL", "SPLIT", "REALTIME", "ALL"],
+                      help="ALL exports all three SRT modes in one pass")
+  parser.add_argument("--seed", type=int, default=1)
+  args = parser.parse_args()
+
+  tmp = tempfile.mkdtemp(prefix="ft_bench_export_")
+  storage.BASE_DIR = tmp
+  try:
+    mgr = storage.StorageManager()
+    mgr.create_project("BenchExport", "TOURNAMENT")
+    t = time.perf_counter()
+    players = build_group(mgr, args.players, args.refs, args.events, args.seed)
+    print(f"[Bench] {args.players} players x {args.refs} refs x {args.events} events "
+          f"written in {time.perf_counter() - t:.2f}s")
+
+    options = {"txt": True, "srt": True, "srt_mode": args.srt_mode}
+    if args.srt_mode == "ALL":
+      options = {"txt": True, "srt": True, "srt_modes": ["TOTAL", "SPLIT", "REALTIME"]}
+    print(f"[Bench] {os.cpu_count()} CPUs available")
+    baseline_s, baseline_files = run_baseline(mgr, players, options)
+    print(f"[Bench] baseline           {baseline_s:7.3f}s  (previous exporter)")
+    (serial_s, cached_s), serial_zip = run_export(mgr, 0, players, options, rounds=2)
+    print(f"[Bench] serial             {serial_s:7.3f}s  {len(serial_zip) / 1024:.0f} KB  "
+          f"x{baseline_s / serial_s:.2f} vs baseline")
+    print(f"[Bench] serial (cached)    {cached_s:7.3f}s  x{serial_s / cached_s:.2f} (parsed events reused)")
+    (cold_s, warm_s), pool_zip = run_export(mgr, args.workers, players, options, rounds=2)
+    print(f"[Bench] pool ({args.workers:>2} workers)  {cold_s:7.3f}s  cold (incl. worker start-up) "
+          f"x{serial_s / cold_s:.2f}")
+    print(f"[Bench] pool ({args.workers:>2} workers)  {warm_s:7.3f}s  warm (cached) x{serial_s / warm_s:.2f}")
+
+    if entry_digest(serial_zip) != entry_digest(pool_zip):
+      print("[Bench] MISMATCH: pool export differs from serial export")
+      sys.exit(1)
+    # 旧实现的条目顺序取决于 os.listdir，按路径逐个比较内容
+    serial_files = entry_contents(serial_zip)
+    diff = sorted(n for n in serial_files.keys() | baseline_files.keys()
+                  if serial_files.get(n) != baseline_files.get(n))
+    if diff:
+      print(f"[Bench] MISMATCH: {len(diff)} entries differ from the baseline exporter, e.g. {diff[0]}")
+      sys.exit(1)
+    print(f"[Bench] {len(serial_files)} entries identical (serial, pool and baseline)")
+  finally:
+    shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,113 @@
+"""
+WebSocket 分数帧格式压测：对比 JSON (broadcast_json 当前的 json.dumps) 与二进制帧 (utils/ws_binary.py)
+的单条编码耗时与每次更新的字节数，并校验二进制帧解码后与 JSON 内容一致。
+
+用法:
+  python benchmarks/bench_ws_protocol.py --referees 8 --updates 20000
+  python benchmarks/bench_ws_protocol.py --referees 16 --batch 4     # 每帧 4 个裁判 (score_batch)
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.ws_binary import BinaryScoreEncoder, decode_frame  # noqa: E402
+
+
+def build_messages(referees, updates, batch, seed):
+  """生成与 HeadlessReferee.snapshot() 结构相同的分数更新序列"""
+  rng = random.Random(seed)
+  state = {
+    i: {"index": i, "name": f"裁判 {i}", "score": {"total": 0, "plus": 0, "minus": 0, "penalty": 0},
+        "status": {"pri": "connected", "sec": "connected" if i % 2 else "n/a"}}
+    for i in range(1, referees + 1)
+  }
+  messages = []
+  for _ in range(updates):
+    payloads = []
+    for i in rng.sample(range(1, referees + 1), min(batch, referees)):
+      s = state[i]["score"]
+      if rng.random() < 0.9:
+        s["plus"] += 1
+      else:
+        s["minus"] += 1
+      s["total"] = s["plus"] - s["minus"]
+      payloads.append({"index": i, "name": state[i]["name"], "score": dict(s), "status": dict(state[i]["status"])})
+    # 与 broadcast_json 一样每条消息带全局序号
+    seq = len(messages) + 1
+    if batch == 1:
+      messages.append({"type": "score_update", "seq": seq, "payload": payloads[0]})
+    else:
+      messages.append({"type": "score_batch", "seq": seq, "payload": payloads})
+  return messages
+
+
+def bench(label, make_encoder, messages, rounds):
+  """make_encoder() 每轮返回新的 encode 函数 (二进制编码器带名称状态，每轮从头开始)"""
+  best = None
+  total_bytes = 0
+  for _ in range(rounds):
+    encode = make_encoder()
+    t0 = time.perf_counter()
+    total_bytes = 0
+    for m in messages:
+      total_bytes += len(encode(m))
+    elapsed = time.perf_counter() - t0
+    best = elapsed if best is None else min(best, elapsed)
+  per_msg_us = best / len(messages) * 1e6
+  per_update = total_bytes / sum(len(m["payload"]) if m["type"] == "score_batch" else 1 for m in messages)
+  print(f"[Bench] {label:<8} encode {per_msg_us:6.2f} us/frame   {total_bytes / len(messages):7.1f} B/frame   "
+        f"{per_update:6.1f} B/update")
+  return per_msg_us, per_update
+
+
+def main():
+  parser = argparse.ArgumentParser(description="JSON vs binary WebSocket score frames")
+  parser.add_argument("--referees", type=int, default=8)
+  parser.add_argument("--updates", type=int, default=20000)
+  parser.add_argument("--batch", type=int, default=1, help="referees per frame (1 = score_update)")
+  parser.add_argument("--rounds", type=int, default=3)
+  parser.add_argument("--seed", type=int, default=1)
+  args = parser.parse_args()
+
+  messages = build_messages(args.referees, args.updates, args.batch, args.seed)
+  print(f"[Bench] {len(messages)} frames, {args.referees} referees, {args.batch} referee(s) per frame")
+
+  # JSON 按 WebSocket 实际发送的 UTF-8 字节计
+  json_us, json_bytes = bench("json", lambda: lambda m: json.dumps(m, ensure_ascii=False).encode("utf-8"),
+                              messages, args.rounds)
+  bin_us, bin_bytes = bench("binary", lambda: BinaryScoreEncoder().encode, messages, args.rounds)
+  print(f"[Bench] binary is x{json_us / bin_us:.2f} faster to encode and {json_bytes / bin_bytes:.1f}x smaller per update")
+
+  # 校验：解码后与 JSON 内容一致
+  enc = BinaryScoreEncoder()
+  names = {}
+  for m in messages:
+    if decode_frame(enc.encode(m), names) != json.loads(json.dumps(m)):
+      print("[Bench] MISMATCH: decoded binary frame differs from JSON message")
+      sys.exit(1)
+  print(f"[Bench] {len(messages)} frames decoded identically")
+
+  # 中途加入的客户端：共用编码器已发送过的名称不会再发送，名称以连接时的 JSON 快照为基准 (与前端 applySnapshot 一致)
+  enc = BinaryScoreEncoder()
+  half = len(messages) // 2
+  snapshot = {}
+  for m in messages[:half]:
+    enc.encode(m)
+    for p in (m["payload"] if m["type"] == "score_batch" else [m["payload"]]):
+      snapshot[p["index"]] = p["name"]
+  names = dict(snapshot)
+  for m in messages[half:]:
+    if decode_frame(enc.encode(m), names) != json.loads(json.dumps(m)):
+      print("[Bench] MISMATCH: late-joining client decoded a frame differently (missing names?)")
+      sys.exit(1)
+  print(f"[Bench] {len(messages) - half} frames decoded identically by a client that joined mid-session")
+
+
+if __name__ == "__main__":
+  main()
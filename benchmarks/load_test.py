@@ -0,0 +1,193 @@
+"""
+虚拟计数器压测：在没有蓝牙硬件的机器上走一遍 /scan -> /setup -> 通知 -> 广播 全链路，
+统计吞吐量与端到端延迟 (虚拟设备生成数据包 -> WebSocket 客户端收到该分数)。
+
+用法:
+  python benchmarks/load_test.py --referees 16 --rate 10 --duration 20
+  python benchmarks/load_test.py --referees 16 --burst 8 --disconnects 2 --storage
+  python benchmarks/load_test.py --referees 32 --workers 4 --kill-worker 5   # BLE 工作进程 + 崩溃重启
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 必须在导入 server 之前启用虚拟 BLE 后端
+os.environ.setdefault("FT_BLE_SIMULATOR", "16")
+
+import server  # noqa: E402
+from utils.ble_simulator import SimProfile, configure_fleet  # noqa: E402
+from utils.ble_workers import STATS_INTERVAL  # noqa: E402
+
+
+class ProbeClient:
+  """伪 WebSocket 客户端：注册到 ws_hub，记录每条分数更新的端到端延迟"""
+
+  def __init__(self, fleet, addr_by_index):
+    self.fleet = fleet
+    self.addr_by_index = addr_by_index
+    self.recording = False
+    self.messages = 0
+    self.latencies_ms = []
+
+  async def close(self, code=1000):
+    pass
+
+  async def send_text(self, text):
+    if not self.recording: return
+    self.messages += 1
+    data = json.loads(text)
+    if data.get("type") == "score_update":
+      self._observe(data["payload"])
+    elif data.get("type") == "score_batch":
+      for payload in data["payload"]:
+        self._observe(payload)
+
+  def _observe(self, payload):
+    addr = self.addr_by_index.get(payload["index"])
+    score = payload["score"]
+    sent = self.fleet.sent_time_ns(addr, score["plus"], score["minus"])
+    if sent:
+      self.latencies_ms.append((time.perf_counter_ns() - sent) / 1e6)
+
+
+def device_stats(key):
+  """合并主进程与各 BLE 工作进程的每设备统计 (connections / heartbeat)"""
+  local = {"connections": server.connect_scheduler, "heartbeat": server.heartbeat_monitor}[key]
+  devices = dict(local.get_stats()["devices"])
+  for w in server.ble_pool.get_stats()["workers"]:
+    devices.update((w["stats"].get(key) or {}).get("devices") or {})
+  return devices
+
+
+def percentile(values, p):
+  if not values: return 0.0
+  values = sorted(values)
+  k = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+  return values[k]
+
+
+async def run(args):
+  profile = SimProfile(click_rate=args.rate, burst_size=args.burst, minus_ratio=args.minus_ratio,
+                       disconnect_per_min=args.disconnects, heartbeat_fail_ratio=args.heartbeat_fail,
+                       discovery_delay=args.discovery_delay)
+  fleet = configure_fleet(args.referees, profile, args.seed)
+  if args.workers:
+    # 工作进程按相同参数创建同一批虚拟设备 (地址一致)
+    server.ble_pool.count = args.workers
+    server.ble_pool.options["simulator"] = dict(server.sim_config, enabled=True, devices=args.referees,
+                                                seed=args.seed, profile=dataclasses.asdict(profile))
+
+  if args.storage:
+    await server.create_project({"name": "LoadTest", "mode": "FREE"})
+    await server.set_context({"group": "LoadTest", "contestant": "Simulated"})
+
+  # 1. 通过 /scan 发现虚拟设备
+  devices = []
+  deadline = time.monotonic() + 10
+  while len(devices) < args.referees and time.monotonic() < deadline:
+    devices = (await server.scan_devices())["devices"]
+    await asyncio.sleep(0.2)
+  print(f"[LoadTest] /scan found {len(devices)} devices")
+
+  # 2. 通过 /setup 绑定 (每台设备一个 SINGLE 裁判)
+  addr_by_index = {}
+  refs = []
+  for i, d in enumerate(devices[:args.referees]):
+    addr_by_index[i + 1] = d["address"]
+    refs.append({"index": i + 1, "name": f"Referee {i + 1}", "mode": "SINGLE", "pri_addr": d["address"], "sec_addr": ""})
+
+  probe = ProbeClient(fleet, addr_by_index)
+  probe_conn = server.ws_hub.add(probe)
+
+  t0 = time.monotonic()
+  await server.setup({"referees": refs})
+  while time.monotonic() - t0 < 15:
+    if all(r.status["pri"] == "connected" for r in server.referees.values()): break
+    await asyncio.sleep(0.05)
+  print(f"[LoadTest] {len(refs)} referees connected in {time.monotonic() - t0:.2f}s")
+  if args.workers: await asyncio.sleep(STATS_INTERVAL * 1.5)
+  conn = server.connect_scheduler.get_stats()
+  ttcs = sorted(d["last_ttc_ms"] for d in device_stats("connections").values() if d["last_ttc_ms"] is not None)
+  if ttcs:
+    print(f"[LoadTest] time-to-connected ms: min={ttcs[0]:.0f} p50={percentile(ttcs, 50):.0f} max={ttcs[-1]:.0f} "
+          f"(max_concurrent={conn['max_concurrent']} stagger={conn['stagger']}s)")
+
+  # 3. 采样
+  # 工作进程模式下虚拟设备在子进程中，以主进程收到的事件数计
+  def sent():
+    return server.ingest_pipeline.stats["received"] if args.workers else fleet.stats["packets"]
+  packets_before = sent()
+  probe.recording = True
+  t1 = time.monotonic()
+  if args.workers and 0 < args.kill_worker < args.duration:
+    await asyncio.sleep(args.kill_worker)
+    print(f"[LoadTest] killing BLE worker 0 ({len(server.ble_pool.get_stats()['workers'][0]['devices'])} devices)")
+    server.ble_pool.kill_worker(0)
+    await asyncio.sleep(args.duration - args.kill_worker)
+  else:
+    await asyncio.sleep(args.duration)
+  probe.recording = False
+  elapsed = time.monotonic() - t1
+  packets = sent() - packets_before
+  connected = sum(r.status["pri"] == "connected" for r in server.referees.values())
+  workers = server.ble_pool.get_stats()["workers"]
+  hb = device_stats("heartbeat").values()
+
+  await server.teardown()
+  await server.scanner_manager.stop()
+  server.ws_hub.remove(probe_conn)
+  await asyncio.to_thread(server.ble_pool.stop)
+
+  lat = probe.latencies_ms
+  print(f"[LoadTest] duration        : {elapsed:.1f}s")
+  print(f"[LoadTest] packets sent    : {packets} ({packets / elapsed:.0f}/s)")
+  if args.workers:
+    print(f"[LoadTest] ble workers     : {len(workers)} processes, restarts={sum(w['restarts'] for w in workers)}, "
+          f"devices per worker={[len(w['devices']) for w in workers]}, connected at end={connected}/{len(refs)}")
+  print(f"[LoadTest] ws messages     : {probe.messages} ({probe.messages / elapsed:.0f}/s)")
+  b = server.broadcast_scheduler.get_stats()
+  print(f"[LoadTest] broadcast       : frames={b['frames']} payloads={b['payloads']} coalesced={b['coalesced']} @ {b['rate_hz']}Hz")
+  ing = server.ingest_pipeline.get_stats()
+  st = ing["stages_us"]
+  print(f"[LoadTest] ingest          : batches={ing['batches']} max_batch={ing['max_batch']} "
+        f"dropped={ing['dropped']} malformed={ing['malformed']} callback avg={st['callback']['avg']}us "
+        f"max={st['callback']['max']}us queue avg={st['queue']['avg']}us")
+  print(f"[LoadTest] disconnects     : {fleet.stats['disconnects']}, heartbeat failures: {fleet.stats['heartbeat_failures']}")
+  print(f"[LoadTest] heartbeat       : gatt reads={sum(d['reads'] for d in hb)} "
+        f"skipped={sum(d['skipped_reads'] for d in hb)} dead={sum(d['dead'] for d in hb)} "
+        f"(quiet_period={server.heartbeat_monitor.quiet_period}s)")
+  if args.storage:
+    w = server.storage_manager.writer.get_stats()
+    print(f"[LoadTest] {server.storage_manager.backend + ' writer':<16}: rows={w['rows_written']} max_queue={w['max_queue_depth']} "
+          f"flush avg={w['avg_flush_ms']:.2f}ms max={w['max_flush_ms']:.2f}ms blocked={w['blocked_puts']} overflow={w['overflow_rows']} dropped={w['dropped_rows']}")
+  if lat:
+    print(f"[LoadTest] latency ms      : p50={percentile(lat, 50):.3f} p95={percentile(lat, 95):.3f} "
+          f"p99={percentile(lat, 99):.3f} max={max(lat):.3f} mean={statistics.mean(lat):.3f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Simulated BLE counter load test")
+  parser.add_argument("--referees", type=int, default=16)
+  parser.add_argument("--rate", type=float, default=10.0, help="clicks per second per device")
+  parser.add_argument("--burst", type=int, default=1, help="clicks per burst")
+  parser.add_argument("--minus-ratio", type=float, default=0.1)
+  parser.add_argument("--disconnects", type=float, default=0.0, help="random disconnects per device per minute")
+  parser.add_argument("--heartbeat-fail", type=float, default=0.0, help="heartbeat read failure probability")
+  parser.add_argument("--discovery-delay", type=float, default=0.0, help="seconds until characteristics appear after connect")
+  parser.add_argument("--duration", type=float, default=10.0)
+  parser.add_argument("--seed", type=int, default=1)
+  parser.add_argument("--storage", action="store_true", help="also write CSV logs into match_data/")
+  parser.add_argument("--workers", type=int, default=0, help="BLE worker processes (0 = in-process)")
+  parser.add_argument("--kill-worker", type=float, default=0.0, help="kill BLE worker 0 after this many seconds")
+  asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,114 @@
+"""
+回放 .ftcap 抓包：把原始通知按记录的时间间隔重新送入 parse_notification_data -> HeadlessReferee，
+用于复现现场问题 (例如重连后的 "+8") 以及用真实比赛流量压测计分与存储链路。
+
+用法:
+  python benchmarks/replay.py captures/capture_20250101_120000.ftcap               # 1x 实时
+  python benchmarks/replay.py capture.ftcap --speed 10                             # 10 倍速
+  python benchmarks/replay.py capture.ftcap --speed max --project Replay --export out.zip
+  python benchmarks/replay.py capture.ftcap --pair AA:AA:AA:AA:AA:01,AA:AA:AA:AA:AA:02   # 双机裁判
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# 回放不需要真实蓝牙
+os.environ.setdefault("FT_BLE_SIMULATOR", "0")
+
+import server  # noqa: E402
+from utils.ble_capture import read_capture  # noqa: E402
+
+
+def build_referees(addresses, pairs):
+  """按地址首次出现顺序分配裁判；--pair 指定的地址组成双机裁判"""
+  routes = {}
+  refs = []
+  for pair in pairs:
+    pri, sec = pair.split(",")
+    r = server.HeadlessReferee(len(refs) + 1, f"Referee {len(refs) + 1}", "DUAL", server.broadcast_json)
+    refs.append(r)
+    routes[pri] = (r, "PRIMARY")
+    routes[sec] = (r, "SECONDARY")
+  for addr in addresses:
+    if addr in routes: continue
+    r = server.HeadlessReferee(len(refs) + 1, f"Referee {len(refs) + 1}", "SINGLE", server.broadcast_json)
+    refs.append(r)
+    routes[addr] = (r, "PRIMARY")
+  return refs, routes
+
+
+async def run(args):
+  _, records = read_capture(args.capture)
+  records = list(records)
+  addresses = list(dict.fromkeys(addr for addr, _, _ in records))
+  print(f"[Replay] {len(records)} packets from {len(addresses)} devices")
+
+  refs, routes = build_referees(addresses, args.pair or [])
+  for r in refs:
+    server.referees[r.index] = r
+
+  if args.project:
+    await server.create_project({"name": args.project, "mode": args.mode})
+    await server.set_context({"group": args.group, "contestant": args.contestant})
+
+  speed = None if args.speed == "max" else float(args.speed)
+  pipeline = server.ingest_pipeline
+  t0 = time.monotonic()
+  for i, (addr, rel_us, data) in enumerate(records):
+    if speed:
+      delay = t0 + rel_us / 1e6 / speed - time.monotonic()
+      if delay > 0: await asyncio.sleep(delay)
+    elif i % 256 == 0:
+      # 全速回放：定期让出事件循环，让流水线消费
+      await asyncio.sleep(0)
+    r, role = routes[addr]
+    pipeline.submit(r, role, data)
+
+  while pipeline.get_stats()["pending"]:
+    await asyncio.sleep(0.001)
+  elapsed = time.monotonic() - t0
+  await asyncio.to_thread(server.storage_manager.flush, True)
+  total_elapsed = time.monotonic() - t0
+
+  ing = pipeline.get_stats()
+  print(f"[Replay] replayed in {elapsed:.3f}s ({len(records) / max(elapsed, 1e-9):.0f} packets/s), "
+        f"incl. disk flush {total_elapsed:.3f}s")
+  print(f"[Replay] processed={ing['processed']} malformed={ing['malformed']} dropped={ing['dropped']} "
+        f"max_batch={ing['max_batch']}")
+  for stage, t in ing["stages_us"].items():
+    print(f"[Replay]   {stage:<8} avg={t['avg']}us max={t['max']}us")
+  if args.project:
+    w = server.storage_manager.writer.get_stats()
+    print(f"[Replay] csv rows={w['rows_written']} flush avg={w['avg_flush_ms']:.2f}ms max={w['max_flush_ms']:.2f}ms")
+  for r in refs:
+    print(f"[Replay] Referee {r.index} ({r.mode}): {r.score}")
+
+  if args.project and args.export:
+    zip_io = server.export_manager.generate_zip(args.group, [args.contestant],
+                                                {"txt": True, "srt": True, "srt_mode": args.srt_mode})
+    if zip_io:
+      with open(args.export, 'wb') as f:
+        f.write(zip_io.getvalue())
+      print(f"[Replay] Export written to {args.export}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Replay a raw BLE notification capture (.ftcap)")
+  parser.add_argument("capture")
+  parser.add_argument("--speed", default="1", help="playback speed: 1, N or max")
+  parser.add_argument("--pair", action="append", help="PRI_ADDR,SEC_ADDR for a DUAL referee (repeatable)")
+  parser.add_argument("--project", help="write CSV logs into a new project with this name")
+  parser.add_argument("--mode", default="TOURNAMENT", choices=["TOURNAMENT", "FREE"])
+  parser.add_argument("--group", default="Replay")
+  parser.add_argument("--contestant", default="Replay_Player")
+  parser.add_argument("--export", help="write a TXT+SRT export zip to this path (requires --project)")
+  parser.add_argument("--srt-mode", default="REALTIME", choices=["TOTAL", "SPLIT", "REALTIME"])
+  asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+  main()
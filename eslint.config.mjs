@@ -26,5 +26,11 @@ export default [
       'vue/multi-word-component-names': 'off'
     }
   },
-  eslintConfigPrettier
+  eslintConfigPrettier,
+  {
+    // eslint-config-prettier 会关闭此规则；仓库不写分号，以 ( [ ` 开头的行可能被并入上一行的表达式
+    rules: {
+      'no-unexpected-multiline': 'error'
+    }
+  }
 ]
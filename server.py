@@ -1,48 +1,41 @@
 import asyncio
 import time
 import struct
-from dataclasses import dataclass
 from contextlib import asynccontextmanager
-from fastapi.responses import StreamingResponse
+from fastapi.responses import StreamingResponse, PlainTextResponse
 import json
 import sys
+import multiprocessing
 import os
 import yaml
+from datetime import datetime
 
 import uvicorn
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from bleak import BleakScanner, BleakClient
-import pygetwindow as gw
 
 # 引入配置模块
 from utils.app_settings import app_settings
-from utils.storage import storage_manager
+from utils.storage import storage_manager, PROJECT_ROOT
 from utils.exporter import ExportManager
-# ==========================================================
-# 配置与协议
-# ==========================================================
-SERVICE_UUID = "025018d0-6951-4a81-de4f-453d8dae9128"
-CHARACTERISTIC_UUID = "025018d0-6951-4a81-de4f-453d8dae9128"
-# 标准设备名称特征值 UUID (Generic Access -> Device Name)
-# 用于心跳检测，因为所有 BLE 设备都有这个，且读取它不会影响业务逻辑
-STANDARD_DEVICE_NAME_UUID = "00002a00-0000-1000-8000-00805f9b34fb"
-
-DEVICE_NAME_PREFIX = "Counter-"
-
-# ==========================================================
-# 全局比赛状态 (State Management)
-# ==========================================================
-match_state = {
-    "current_group": "Free Mode", # 默认为自由模式，防止空指针
-    "current_contestant": "",
-    "config": {}
-}
-
-
-def load_config():
-  port = 8000  # 默认端口
-
+from utils.broadcast import BroadcastScheduler
+from utils.ws_hub import WebSocketHub
+from utils.ingest import IngestPipeline
+from utils.ble_capture import CaptureWriter, new_capture_path
+from utils.window_tracker import WindowTrackerService, bounds_message
+from utils.device_registry import DeviceRegistry
+from utils import ble_node
+from utils.ble_node import (CHARACTERISTIC_UUID, DEVICE_NAME_PREFIX, PACKET_FORMAT, ClickerEvent,
+                            HeadlessDeviceNode, connect_scheduler, heartbeat_monitor, parse_notification_data)
+from utils.ble_workers import BleWorkerPool, RemoteDeviceNode
+from utils.metrics import metrics, SLOW_BUCKETS
+from utils.ws_binary import BinaryScoreEncoder
+from utils.bursts import LiveBursts
+from utils.event_cache import to_ms
+
+
+def read_config_file():
+  """读取 config.yaml，失败或不存在时返回空字典"""
   # 判断路径 (兼容开发环境和打包环境)
   if getattr(sys, 'frozen', False):
     base_path = os.path.dirname(sys.executable)
@@ -54,62 +47,108 @@ def load_config():
   if os.path.exists(config_path):
     try:
       with open(config_path, 'r', encoding='utf-8') as f:
-        config = yaml.safe_load(f)
-        if config and 'server_port' in config:
-          port = int(config['server_port'])
-          print(f"[Config] Loaded port from config.yaml: {port}")
+        return yaml.safe_load(f) or {}
     except Exception as e:
       print(f"[Config] Failed to load config.yaml, using default: {e}")
   else:
     print(f"[Config] config.yaml not found at {config_path}, using default port 8000")
+  return {}
 
-  return port
 
-@dataclass
-class ClickerEvent:
-  current_total: int
-  event_type: int
-  total_plus: int
-  total_minus: int
-  timestamp_ms: int
+server_config = read_config_file()
+
+# ==========================================================
+# BLE 后端 (真实蓝牙 / 虚拟计数器)
+# ==========================================================
+# 环境变量 FT_BLE_SIMULATOR=<设备数> 可在不修改 config.yaml 的情况下启用虚拟设备 (CI 压测)
+sim_config = dict(server_config.get("ble_simulator") or {})
+if os.environ.get("FT_BLE_SIMULATOR"):
+  sim_config["enabled"] = True
+  sim_config["devices"] = int(os.environ["FT_BLE_SIMULATOR"])
+
+ble_node.use_backend(sim_config)
+BleakScanner = ble_node.BleakScanner
+if sim_config.get("enabled"):
+  print(f"[BLE] Simulator enabled with {sim_config.get('devices', 16)} virtual counters")
+
+# BLE 工作进程 (count = 0 时所有设备在本进程中连接)；环境变量 FT_BLE_WORKERS=<进程数> 可覆盖
+ble_worker_config = dict(server_config.get("ble_workers") or {})
+if os.environ.get("FT_BLE_WORKERS"):
+  ble_worker_config["count"] = int(os.environ["FT_BLE_WORKERS"])
+
+# 存储后端：csv (默认) 或 sqlite (每个项目一个 events.db)；环境变量 FT_STORAGE_BACKEND 可覆盖
+storage_manager.set_backend(os.environ.get("FT_STORAGE_BACKEND") or server_config.get("storage_backend", "csv"))
+# 后台写入线程参数 (队列长度、刷新间隔/行数、最大打开文件数)
+storage_manager.writer.configure(**(server_config.get("storage_writer") or {}))
+# 导出/报表共用的已解析事件缓存上限 (MB)
+storage_manager.events.configure(max_mb=server_config.get("event_cache_mb"))
+storage_manager.waveforms.configure(**(server_config.get("waveform") or {}))
+
+# 原始通知抓包目录 (.ftcap，回放见 benchmarks/replay.py)
+CAPTURE_DIR = os.path.join(PROJECT_ROOT, "captures")
+packet_capture = None  # 正在进行的抓包 (CaptureWriter)
 
+# ==========================================================
+# 全局比赛状态 (State Management)
+# ==========================================================
+match_state = {
+    "current_group": "Free Mode", # 默认为自由模式，防止空指针
+    "current_contestant": "",
+    "config": {}
+}
 
-def parse_notification_data(data: bytes) -> ClickerEvent:
-  STRUCT_FORMAT = "<ibiiI"
-  if len(data) != 17: raise ValueError("Data mismatch")
-  return ClickerEvent(*struct.unpack(STRUCT_FORMAT, data))
 
+def load_config():
+  port = 8000  # 默认端口
+  if 'server_port' in server_config:
+    try:
+      port = int(server_config['server_port'])
+      print(f"[Config] Loaded port from config.yaml: {port}")
+    except Exception as e:
+      print(f"[Config] Invalid server_port, using default: {e}")
+  return port
 
 # ==========================================================
 # 扫描管理器
 # ==========================================================
+def is_target_device(name, adv):
+  """名称前缀或服务 UUID 匹配即为目标计数器"""
+  if name.startswith(DEVICE_NAME_PREFIX): return True
+  for u in adv.service_uuids or ():
+    if str(u).lower() == CHARACTERISTIC_UUID.lower(): return True
+  return False
+
+
 class ScannerManager:
   def __init__(self):
     self.scanner = None
     self.is_scanning = False
-    self.found_devices = {}
-    self.device_ttl = 8.0
     self.init_error = None
+    # 目标设备索引：广播回调中增量维护，变化通过 /ws/devices 推送
+    self.registry = DeviceRegistry(is_target_device, on_change=self._on_registry_change)
+    self.registry.set_remarks(app_settings.remarks)
 
   def _detection_callback(self, device, advertisement_data):
-    self.found_devices[device.address] = {
-      "device": device, "adv": advertisement_data, "ts": time.time()
-    }
+    self.registry.on_advertisement(device, advertisement_data)
+
+  def _on_registry_change(self, event, payload):
+    device_hub.broadcast_text(json.dumps({"type": event, "payload": payload}, ensure_ascii=False))
 
   async def start(self):
     if self.is_scanning: return
     print("[Scanner] Starting background scan...")
-    self.get_active_devices()
 
     try:
       self.init_error = None
       self.scanner = BleakScanner(detection_callback=self._detection_callback)
       await self.scanner.start()
       self.is_scanning = True
+      self.registry.start()
     except Exception as e:
       print(f"[Scanner] Start failed (Bluetooth might be off): {e}")
       self.init_error = str(e)
       self.is_scanning = False
+    self.publish_state()
 
   async def stop(self):
     if not self.is_scanning: return
@@ -120,225 +159,51 @@ class ScannerManager:
       pass
     self.scanner = None
     self.is_scanning = False
+    # 停止扫描后保留已发现的设备 (setup 需要用它们连接)，不再过期淘汰
+    self.registry.stop()
+    self.publish_state()
 
   def get_active_devices(self):
-    now = time.time()
-    expired = [k for k, v in self.found_devices.items() if now - v['ts'] > self.device_ttl]
-    for k in expired: del self.found_devices[k]
-
-    # 【新增】获取备注配置
-    remarks = app_settings.get("device_remarks") or {}
-
-    results = []
-    for entry in self.found_devices.values():
-      d, adv = entry['device'], entry['adv']
-      real_name = adv.local_name or d.name or "Unknown"
-      is_target = False
-
-      if real_name.startswith(DEVICE_NAME_PREFIX):
-        is_target = True
-      elif adv.service_uuids:
-        for u in adv.service_uuids:
-          if str(u).lower() == CHARACTERISTIC_UUID.lower():
-            is_target = True;
-            break
-
-      if is_target:
-        # 【新增】如果有备注，附加到返回数据中
-        remark = remarks.get(d.address, "")
-        results.append({
-            "name": real_name,
-            "address": d.address,
-            "rssi": adv.rssi,
-            "remark": remark  # 返回备注
-        })
-
-    results.sort(key=lambda x: x['rssi'], reverse=True)
-    return results
-
-  def clear_cache(self):
-    self.found_devices.clear()
+    return self.registry.snapshot()
 
+  def get_device(self, address):
+    return self.registry.get_device(address)
 
-scanner_manager = ScannerManager()
-
-
-# ==========================================================
-# 核心业务类 (修复心跳与重连)
-# ==========================================================
-class HeadlessDeviceNode:
-  def __init__(self, ble_device, on_data_callback, on_status_callback):
-    self.ble_device = ble_device
-    self.client = None
-    self.on_data_callback = on_data_callback
-    self.on_status_callback = on_status_callback
-
-    self.intentional_disconnect = False
-    self.is_reconnecting = False
-    self._heartbeat_task = None
-
-  async def connect(self):
-    self.intentional_disconnect = False
-    return await self._do_connect()
-
-  async def _do_connect(self):
-    self._emit_status("connecting")
-    print(f"Connecting to {self.ble_device.name}...")
-
-    try:
-      self.client = BleakClient(self.ble_device, disconnected_callback=self._on_disconnect)
-      await self.client.connect()
-      print(f"Connected: {self.ble_device.name}")
-
-      # 【修复 1】等待服务发现，解决 Windows 缓存问题
-      await asyncio.sleep(1.5)
-
-      # 【关键修复】如果在等待期间连接被断开(self.client变为None)，则中止后续操作，防止 AttributeError
-      if not self.client:
-          print(f"Connection aborted for {self.ble_device.name} during setup.")
-          return False
-
-      # 【修复 2】检查特征值是否存在
-      # 如果不存在，尝试读取标准设备名来"激活"服务列表
-      try:
-        await self.client.read_gatt_char(STANDARD_DEVICE_NAME_UUID)
-      except Exception:
-        pass  # 忽略错误，只是为了刷新缓存
-
-      # 再次检查，防止 read_gatt_char 期间断开
-      if not self.client:
-          return False
-
-      # 开启通知
-      await self.client.start_notify(CHARACTERISTIC_UUID, self._on_notify)
-
-      self._emit_status("connected")
-
-      # 开启心跳
-      if self._heartbeat_task: self._heartbeat_task.cancel()
-      self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
-
-      return True
-
-    except Exception as e:
-      print(f"Conn failed: {e}")
-
-      # 打印调试信息
-      try:
-        if self.client and self.client.services:
-          print("--- Debug: Services Found ---")
-          for s in self.client.services:
-            print(f"   Service: {s.uuid}")
-          print("-----------------------------")
-      except:
-        pass
+  def clear_cache(self):
+    self.registry.clear()
 
-      # 【关键】失败必须断开，否则设备卡死不广播
-      await self._ensure_disconnect()
+  def build_snapshot(self):
+    """/ws/devices 的全量快照 (新连接与慢客户端折叠时下发)"""
+    return json.dumps({
+      "type": "devices_snapshot",
+      "payload": {
+        "devices": self.registry.snapshot(),
+        "scanning": self.is_scanning,
+        "error": self.init_error
+      }
+    }, ensure_ascii=False)
 
-      if not self.intentional_disconnect:
-        self._trigger_reconnect()
-      else:
-        self._emit_status("disconnected")
-      return False
+  def publish_state(self):
+    device_hub.broadcast_text(json.dumps({
+      "type": "scan_state",
+      "payload": {"scanning": self.is_scanning, "error": self.init_error}
+    }))
 
-  async def disconnect(self):
-    """用户主动断开"""
-    self.intentional_disconnect = True
-    if self._heartbeat_task:
-      self._heartbeat_task.cancel()
-      self._heartbeat_task = None
 
-    await self._ensure_disconnect()
-    self._emit_status("disconnected")
+scanner_manager = ScannerManager()
+scanner_manager.registry.configure(**(server_config.get("device_registry") or {}))
+# 设备扫描结果推送通道 (/ws/devices)
+device_hub = WebSocketHub(snapshot_func=scanner_manager.build_snapshot)
 
-  async def _ensure_disconnect(self):
-    """确保底层连接断开的辅助函数"""
-    if self.client:
-      try:
-        # 只有连接状态才需要断开
-        if self.client.is_connected:
-          print(f"Terminating connection to {self.ble_device.name}...")
-          await self.client.disconnect()
-      except Exception as e:
-        print(f"Disconnect error (ignored): {e}")
-      finally:
-        # 无论如何，清空 client 对象，防止残留
-        self.client = None
-
-  def _on_disconnect(self, client):
-    print(f"Disconnected callback: {self.ble_device.name}")
-    if self._heartbeat_task: self._heartbeat_task.cancel()
-
-    if not self.intentional_disconnect:
-      self._trigger_reconnect()
-    else:
-      self._emit_status("disconnected")
-
-  def _trigger_reconnect(self):
-    if self.is_reconnecting: return
-    self._emit_status("error")
-    print(f"Connection lost! Auto-reconnect {self.ble_device.name}...")
-    asyncio.create_task(self._reconnect_loop())
-
-  async def _reconnect_loop(self):
-    self.is_reconnecting = True
-    while not self.intentional_disconnect:
-      print(f"Retrying {self.ble_device.name} in 3s...")
-      await asyncio.sleep(3.0)  # 稍微放慢重连频率
-
-      # 如果用户在重连期间点了 Stop，立即停止
-      if self.intentional_disconnect: break
-
-      if await self._do_connect():
-        print(f"Reconnected: {self.ble_device.name}")
-        self.is_reconnecting = False
-        return
-    self.is_reconnecting = False
-
-  async def _heartbeat_loop(self):
-    """心跳检测：每3秒读取一次设备名称"""
-    try:
-      while True:
-        await asyncio.sleep(3)
-        if self.client:  # 只要 client 还在就尝试检查
-          try:
-            # 【修复 3】用读取标准特征值代替 get_rssi
-            await self.client.read_gatt_char(STANDARD_DEVICE_NAME_UUID)
-          except Exception as e:
-            print(f"Heartbeat failed ({e}), active disconnect...")
-            # 心跳失败，说明链路已死，主动断开触发重连逻辑
-            await self._ensure_disconnect()
-            # _ensure_disconnect 可能会触发 _on_disconnect 回调
-            # 如果没触发，我们需要手动确保进入重连流程
-            if not self.intentional_disconnect:
-              self._trigger_reconnect()
-            break
-        else:
-          break
-    except asyncio.CancelledError:
-      pass
 
-  def _emit_status(self, status):
-    if self.on_status_callback:
-      self.on_status_callback(status)
-
-  async def send_reset(self):
-    if self.client:  # 不检查 is_connected，让 bleak 自己抛异常
-      try:
-        await self.client.write_gatt_char(CHARACTERISTIC_UUID, b'\x01', response=True)
-      except:
-        pass
-
-  def _on_notify(self, sender, data):
-    try:
-      evt = parse_notification_data(data)
-      if self.on_data_callback:
-        self.on_data_callback(evt.current_total, evt.event_type, evt.total_plus, evt.total_minus, evt.timestamp_ms)
-    except:
-      pass
+# 连接调度与心跳参数 (工作进程使用相同配置)
+connect_scheduler.configure(**(server_config.get("connection") or {}))
+heartbeat_monitor.configure(**(server_config.get("heartbeat") or {}))
 
 
+# ==========================================================
+# 核心业务类 (单台设备的连接/心跳/重连见 utils/ble_node.py)
+# ==========================================================
 class HeadlessReferee:
   def __init__(self, index, name, mode, broadcast_func):
     self.index = index
@@ -356,12 +221,12 @@ class HeadlessReferee:
   def set_devices(self, pri, sec=None):
     self.pri_dev = pri
     if pri:
-      pri.on_data_callback = self._on_pri_data
+      pri.sink, pri.role = self, "PRIMARY"
       pri.on_status_callback = lambda s: self._on_status_change("pri", s)
 
     self.sec_dev = sec
     if sec:
-      sec.on_data_callback = self._on_sec_data
+      sec.sink, sec.role = self, "SECONDARY"
       sec.on_status_callback = lambda s: self._on_status_change("sec", s)
 
   async def reset(self):
@@ -379,21 +244,28 @@ class HeadlessReferee:
     self.status[role] = status
     self._broadcast_update("status_update")
 
-  def _on_pri_data(self, cur, typ, p, m, ts):
-    self.pri_cache = [p, m]
-    # 1. 先计算最新的比赛得分
+  # --- 摄取流水线的三个阶段 (见 utils/ingest.py) ---
+  def fuse(self, role, evt):
+    """1. 更新对应设备的缓存并计算最新的比赛得分"""
+    if role == "PRIMARY":
+      self.pri_cache = [evt.total_plus, evt.total_minus]
+    else:
+      self.sec_cache = [evt.total_plus, evt.total_minus]
     self._update_score_state()
-    # 2. 再将计算好的得分写入日志 (Event Type 和 Timestamp 用当前的)
-    self._record_log("PRIMARY", typ, ts)
-    # 3. 广播给前端
-    self._broadcast_update("score_update")
 
-  def _on_sec_data(self, cur, typ, p, m, ts):
-    self.sec_cache = [p, m]
-    # 同上：副设备数据进来，先融合计算，再保存融合后的状态
-    self._update_score_state()
-    self._record_log("SECONDARY", typ, ts)
-    self._broadcast_update("score_update")
+  def persist(self, role, evt):
+    """
+    2. 将融合后的得分写入日志 (Event Type 和 Timestamp 用当前的)，并驱动连击检测 (与日志使用同一时间戳)
+    只有实际写入日志的记录才参与连击检测，与导出的 REALTIME 字幕读到的事件一致
+    """
+    now = datetime.now()
+    if self._record_log(role, evt.event_type, evt.timestamp_ms, now):
+      live_bursts.feed(self.index, to_ms(now), self.score)
+
+  def publish(self, recv_ns=None):
+    """3. 广播给前端 (同一批数据只发布一次)"""
+    # 分数更新：交给调度器按帧合并，连击时每帧只发送一次最新值
+    broadcast_scheduler.mark_dirty(self.index, self.snapshot, recv_ns)
 
   def _update_score_state(self):
     """仅计算分数，不广播，不存储"""
@@ -420,9 +292,9 @@ class HeadlessReferee:
         "penalty": major_penalty
       }
 
-  def _record_log(self, role, event_type, ble_timestamp):
+  def _record_log(self, role, event_type, ble_timestamp, now=None):
     """
-    统一日志记录
+    统一日志记录，返回是否写入 (被过滤的记录返回 False)
     """
     # 1. 获取当前比赛上下文
     group = match_state.get("current_group")
@@ -431,7 +303,7 @@ class HeadlessReferee:
     # 【修复 1】如果选手名为空或为默认占位符，直接丢弃数据
     # 这解决了 Unknown_Player_Ref1.csv 的生成问题
     if not contestant or contestant == "Unknown_Player":
-      return
+      return False
 
     # 2. 获取当前模式 (默认为 FREE)
     config = match_state.get("config") or {}
@@ -443,7 +315,7 @@ class HeadlessReferee:
     is_zero_score = (self.score['total'] == 0 and self.score['plus'] == 0 and self.score['minus'] == 0)
 
     if mode == 'FREE' and is_zero_score:
-      return
+      return False
 
     # 注意：赛事模式 (TOURNAMENT) 下不拦截 0 分
     # 这样如果该选手真实存在但没有得分，依然会生成一个包含 0 分记录的 CSV，证明该选手已参赛。
@@ -455,16 +327,80 @@ class HeadlessReferee:
     }
 
     # 调用 Storage Manager 写入数据
-    storage_manager.log_data(group, self.index, contestant, self.score, event_details)
+    return storage_manager.log_data(group, self.index, contestant, self.score, event_details, now)
 
-  def _broadcast_update(self, msg_type):
-    payload = {
+  def snapshot(self):
+    return {
       "index": self.index,
       "name": self.name,
       "score": self.score,
-      "status": self.status
+      "status": dict(self.status)
     }
-    asyncio.create_task(self.broadcast({"type": msg_type, "payload": payload}))
+
+  def _broadcast_update(self, msg_type):
+    if msg_type == "score_update":
+      # 分数更新：交给调度器按帧合并，连击时每帧只发送一次最新值
+      broadcast_scheduler.mark_dirty(self.index, self.snapshot)
+    else:
+      # 状态变化：立即发送
+      asyncio.create_task(self.broadcast({"type": msg_type, "payload": self.snapshot()}))
+
+
+# BLE 回调 -> 解析/融合/存储/发布 的分阶段流水线
+ingest_pipeline = IngestPipeline(parse_notification_data)
+ingest_pipeline.configure(**(server_config.get("ingest") or {}))
+
+
+def on_local_packet(node, data):
+  """本进程中连接的设备收到通知 (BLE 回调中执行)"""
+  if packet_capture:
+    packet_capture.record(node.address, data)
+  # 回调中只打时间戳入队，解析/融合/存储/广播由摄取流水线完成
+  if node.sink:
+    ingest_pipeline.submit(node.sink, node.role, data)
+
+
+def on_worker_event(node, fields):
+  """工作进程已解码的事件 (fields 见 ble_node.event_fields)"""
+  if packet_capture:
+    # 工作进程只转发解码结果，按协议格式还原原始数据包 (时间戳为主进程收到的时间)
+    packet_capture.record(node.address, struct.pack(PACKET_FORMAT, *fields))
+  if node.sink:
+    ingest_pipeline.submit_event(node.sink, node.role, ClickerEvent(*fields))
+
+
+ble_pool = BleWorkerPool(ble_worker_config.get("count", 0), ble_worker_config.get("adapters"), options={
+  "simulator": sim_config,
+  "connection": server_config.get("connection"),
+  "heartbeat": server_config.get("heartbeat"),
+  "ingest": server_config.get("ingest")
+}, on_event=on_worker_event)
+
+
+def create_device_node(ble_device):
+  if ble_pool.enabled:
+    return RemoteDeviceNode(ble_pool, ble_device)
+  node = HeadlessDeviceNode(ble_device)
+  node.on_packet = on_local_packet
+  return node
+
+
+def start_packet_capture():
+  global packet_capture
+  if packet_capture is None:
+    packet_capture = CaptureWriter(new_capture_path(CAPTURE_DIR))
+    print(f"[Capture] Recording raw notifications to {packet_capture.path}")
+  return packet_capture.get_info()
+
+
+def stop_packet_capture():
+  global packet_capture
+  if packet_capture is None: return None
+  info = packet_capture.get_info()
+  packet_capture.close()
+  packet_capture = None
+  print(f"[Capture] Stopped, {info['packets']} packets saved to {info['path']}")
+  return info
 
 
 # ==========================================================
@@ -473,41 +409,135 @@ class HeadlessReferee:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
   await scanner_manager.start()
+  if server_config.get("ble_capture"):
+    start_packet_capture()
   yield
   await scanner_manager.stop()
+  stop_packet_capture()
+  await asyncio.to_thread(ble_pool.stop)
+  await asyncio.to_thread(storage_manager.flush, True)
+  await asyncio.to_thread(app_settings.flush)
+  export_manager.shutdown()
 
 
 app = FastAPI(lifespan=lifespan)
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"],
                    allow_headers=["*"])
 
-active_ws = []
 referees = {}
-export_manager = ExportManager(storage_manager)
+# 导出进程池大小 (0/1 = 串行)
+export_manager = ExportManager(storage_manager, workers=int(server_config.get("export_workers", 0)))
+
+
+def current_scored():
+  """当前组别的已打分选手 (存储层的内存集合)"""
+  group = match_state["current_group"]
+  return storage_manager.get_scored_players(group) if group else []
+
+
+def build_snapshot():
+  """全量状态快照 (慢客户端队列折叠、新连接或无法补发的重连时下发)；seq 为快照已包含的最后一条消息序号"""
+  log = ws_hub.resume_log
+  return json.dumps({
+    "type": "snapshot",
+    "seq": log.seq,
+    "epoch": log.epoch,
+    "payload": {
+      "referees": [r.snapshot() for r in referees.values()],
+      "context": {
+        "group": match_state["current_group"],
+        "contestant": match_state["current_contestant"]
+      },
+      "scored": current_scored(),
+      "groups": (match_state.get("config") or {}).get("groups", [])
+    }
+  }, ensure_ascii=False)
+
+
+# 每个客户端独立的发送队列与发送任务
+ws_hub = WebSocketHub(snapshot_func=build_snapshot)
+ws_hub.configure(**(server_config.get("websocket") or {}))
+
+JSON_ENCODE_SECONDS = metrics.histogram("ft_json_encode_seconds", "Time to JSON-encode one broadcast message")
+BINARY_ENCODE_SECONDS = metrics.histogram("ft_binary_encode_seconds", "Time to encode one binary score frame")
+REPORT_SECONDS = metrics.histogram("ft_report_seconds", "Time to build /api/project/report", SLOW_BUCKETS)
+
+
+# 二进制分数帧编码器 (/ws?format=binary 的客户端共用)
+binary_encoder = BinaryScoreEncoder()
+
 
 async def broadcast_json(data):
-  for ws in active_ws:
-    try:
-      await ws.send_json(data)
-    except:
-      pass
+  # 每条消息带全局序号并写入补发缓冲；每种格式只编码一次，所有客户端共用；只入队，不等待任何客户端
+  # 补发缓冲保存广播时编码好的 JSON 文本 (payload 中的对象之后可能被原地修改，不能保留引用)
+  log = ws_hub.resume_log
+  data = dict(data, seq=log.next_seq())
+  frame = None
+  if ws_hub.binary_clients:
+    t0 = time.perf_counter()
+    frame = binary_encoder.encode(data)
+    if frame is not None: BINARY_ENCODE_SECONDS.observe(time.perf_counter() - t0)
+  t0 = time.perf_counter()
+  text = json.dumps(data, ensure_ascii=False)
+  JSON_ENCODE_SECONDS.observe(time.perf_counter() - t0)
+  log.append(data["seq"], text, frame)
+  ws_hub.broadcast_text(text, frame)
+
+
+def resume_client(client, seq=None, epoch=None):
+  """
+  补发 seq 之后客户端缺失的消息 (按客户端格式编码，缓存到补发缓冲中)；无法补发时下发一条快照
+  同步执行，期间不会插入新的广播，补发内容与之后的实时消息首尾相接
+  """
+  entries = ws_hub.resume_log.since(seq, epoch)
+  # 补发条数超过发送队列上限时一样会被折叠，直接发快照
+  if entries is None or len(entries) >= ws_hub.max_queue:
+    client.enqueue(build_snapshot())
+    return
+  # 广播时没有二进制客户端的消息补发时由 JSON 文本再编码 (独立编码器，名称随帧完整携带)
+  encoder = BinaryScoreEncoder() if client.binary else None
+  for _, text, frame in entries:
+    if client.binary:
+      if frame is None: frame = encoder.encode(json.loads(text))
+      if frame is not None:
+        client.enqueue(frame)
+        continue
+    client.enqueue(text)
+
+# 实时连击检测 (与导出的 REALTIME 字幕共用 BurstDetector)，推送 burst_start / burst_update / burst_end
+live_bursts = LiveBursts(lambda msg: asyncio.create_task(broadcast_json(msg)))
+
+# 选手的第一条记录写入时推送 mark_scored (与前端手动标记同一消息)，各窗口无需重新查询打分状态
+storage_manager.on_scored = lambda group, contestant: asyncio.create_task(broadcast_json(
+  {"type": "mark_scored", "payload": {"name": contestant, "group": group}}))
+
+# 分数广播帧率 (Hz)，例如悬浮窗使用 60
+broadcast_scheduler = BroadcastScheduler(broadcast_json, rate_hz=server_config.get("broadcast_hz", 60))
+
+# 悬浮窗目标窗口跟踪 (每个标题一个共享轮询任务)
+window_tracker = WindowTrackerService()
+window_tracker.configure(**(server_config.get("window_tracker") or {}))
 
 # 1. 获取全局设置
 @app.get("/api/settings")
 async def get_settings():
     return app_settings.settings
 
-# 2. 更新全局设置
+# 2. 更新全局设置 (请求中的所有键作为一次变更应用，由后台线程延迟写盘)
 @app.post("/api/settings/update")
 async def update_settings(data: dict):
-    for k, v in data.items():
-        app_settings.set(k, v)
+    changed = app_settings.update(data)
+    if "device_remarks" in changed:
+        scanner_manager.registry.set_remarks(app_settings.remarks)
     return {"status": "ok", "settings": app_settings.settings}
 
 @app.websocket("/ws")
-async def ws_endpoint(websocket: WebSocket):
+async def ws_endpoint(websocket: WebSocket, format: str = "json", resume: int = None, epoch: str = None):
   await websocket.accept()
-  active_ws.append(websocket)
+  binary = format == "binary"
+  client = ws_hub.add(websocket, binary=binary)
+  # 重连时 ?resume=<最后收到的 seq>&epoch=<服务端 epoch> 补发缺失的消息；新连接 (或缺口过大) 先收到快照
+  resume_client(client, resume, epoch)
   try:
     while True:
       # 【修改】监听并处理前端发送的消息
@@ -517,30 +547,75 @@ async def ws_endpoint(websocket: WebSocket):
         # 如果收到“标记已打分”的消息，广播给所有连接的客户端（包括主窗口和悬浮窗）
         if msg.get("type") == "mark_scored":
             await broadcast_json(msg)
+        # 客户端发现序号缺口时请求补发
+        elif msg.get("type") == "resume":
+            resume_client(client, msg.get("seq"), msg.get("epoch"))
       except:
         pass
   except:
-    if websocket in active_ws: active_ws.remove(websocket)
+    pass
+  finally:
+    ws_hub.remove(client)
+
+
+# 摄取流水线统计 (丢包、畸形包、各阶段耗时)
+@app.get("/api/ingest/stats")
+async def get_ingest_stats():
+  return {"status": "ok", "ingest": ingest_pipeline.get_stats()}
+
+
+# 原始通知抓包 (用于复现现场问题)
+@app.post("/api/capture/start")
+async def capture_start():
+  return {"status": "ok", "capture": start_packet_capture()}
+
+
+@app.post("/api/capture/stop")
+async def capture_stop():
+  info = stop_packet_capture()
+  if info is None:
+    return {"status": "error", "msg": "No capture running"}
+  return {"status": "ok", "capture": info}
+
+
+# 各 WebSocket 客户端的发送队列与延迟统计
+@app.get("/api/ws/clients")
+async def get_ws_clients():
+  return {"status": "ok", "clients": ws_hub.get_stats(), "broadcast": broadcast_scheduler.get_stats(),
+          "resume": ws_hub.resume_log.get_stats(), "bursts": live_bursts.get_stats(), "window_trackers": window_tracker.get_stats()}
 
 
 @app.websocket("/ws/tracking")
 async def tracking_endpoint(websocket: WebSocket):
   await websocket.accept()
+  target = None
+  sub = None
+  closed = None
   try:
     target = await websocket.receive_text()
+    # 同一标题的所有连接共享一个轮询任务，只在位置/大小变化时推送
+    sub = window_tracker.subscribe(target)
+    # 窗口不动时没有推送，同时读取客户端消息以便及时发现断开 (否则订阅会一直占用轮询任务)
+    closed = asyncio.create_task(_wait_disconnect(websocket))
     while True:
-      try:
-        wins = await asyncio.to_thread(gw.getWindowsWithTitle, target)
-        if wins:
-          w = wins[0]
-          await websocket.send_json({"found": True, "x": w.left, "y": w.top, "width": w.width, "height": w.height})
-        else:
-          await websocket.send_json({"found": False})
-      except:
-        pass
-      await asyncio.sleep(0.05)
+      update = asyncio.create_task(sub.next())
+      await asyncio.wait({update, closed}, return_when=asyncio.FIRST_COMPLETED)
+      if not update.done():
+        update.cancel()
+        break
+      await websocket.send_json(bounds_message(update.result()))
   except:
     pass
+  finally:
+    if closed: closed.cancel()
+    if sub: window_tracker.unsubscribe(target, sub)
+
+
+async def _wait_disconnect(websocket: WebSocket):
+  """忽略客户端发来的消息，直到连接断开"""
+  while True:
+    message = await websocket.receive()
+    if message["type"] == "websocket.disconnect": return
 
 
 @app.get("/scan")
@@ -559,6 +634,83 @@ async def scan_devices(flush: bool = False):
   return {"devices": scanner_manager.get_active_devices()}
 
 
+@app.websocket("/ws/devices")
+async def devices_endpoint(websocket: WebSocket):
+  """扫描结果推送：连接后先下发 devices_snapshot，之后只推送 device_added / device_updated / device_removed"""
+  await websocket.accept()
+  if not scanner_manager.is_scanning:
+    await scanner_manager.start()
+  client = device_hub.add(websocket)
+  client.enqueue(scanner_manager.build_snapshot())
+  try:
+    while True:
+      await websocket.receive_text()
+  except:
+    pass
+  finally:
+    device_hub.remove(client)
+
+
+@app.get("/api/devices/stats")
+async def get_device_stats():
+  return {"status": "ok", "registry": scanner_manager.registry.get_stats(),
+          "connections": connect_scheduler.get_stats(), "heartbeat": heartbeat_monitor.get_stats(),
+          "workers": ble_pool.get_stats()}
+
+
+def collect_metrics():
+  """/metrics 抓取时现算的 gauge / counter"""
+  devices = []
+  for r in referees.values():
+    for role, node in (("pri", r.pri_dev), ("sec", r.sec_dev)):
+      if node is None: continue
+      labels = {"referee": r.index, "role": role, "name": node.name}
+      devices.append((dict(labels, status=r.status.get(role)), 1))
+
+  # 连接统计：本进程 + 各 BLE 工作进程
+  conn_devices = dict(connect_scheduler.get_stats()["devices"])
+  workers = ble_pool.get_stats()["workers"]
+  for w in workers:
+    conn_devices.update((w["stats"].get("connections") or {}).get("devices") or {})
+
+  ing = ingest_pipeline.stats
+  resume = ws_hub.resume_log.stats
+  return [
+    ("ft_ws_clients", "gauge", "Connected WebSocket clients",
+     [({"channel": "scores"}, len(ws_hub.clients)), ({"channel": "devices"}, len(device_hub.clients))]),
+    ("ft_referee_device_status", "gauge", "Current connection status of each referee device (value is always 1)",
+     devices),
+    ("ft_referee_device_up", "gauge", "1 if the referee device is connected",
+     [({k: v for k, v in labels.items() if k != "status"}, int(labels["status"] == "connected"))
+      for labels, _ in devices]),
+    ("ft_device_reconnects_total", "counter", "Reconnect attempts started after a device dropped",
+     [({"address": addr, "name": d["name"]}, d.get("reconnects", 0)) for addr, d in conn_devices.items()]),
+    ("ft_device_connects_total", "counter", "Successful device connections",
+     [({"address": addr, "name": d["name"]}, d["connects"]) for addr, d in conn_devices.items()]),
+    ("ft_ingest_packets_total", "counter", "Notifications seen by the ingest pipeline",
+     [({"result": k}, ing[k]) for k in ("received", "processed", "dropped", "malformed", "errors")]),
+    ("ft_ws_resumes_total", "counter", "WebSocket resume requests by outcome",
+     [({"result": "replay"}, resume["replays"]), ({"result": "snapshot"}, resume["snapshots"])]),
+    ("ft_broadcast_frames_total", "counter", "Score frames sent by the broadcast scheduler",
+     [({}, broadcast_scheduler.stats["frames"])]),
+    ("ft_storage_rows_written_total", "counter", "CSV rows written by the background writer",
+     [({}, storage_manager.writer.stats["rows_written"])]),
+    ("ft_ble_worker_up", "gauge", "1 if the BLE worker process is running",
+     [({"worker": w["worker_id"]}, int(w["alive"])) for w in workers]),
+    ("ft_ble_worker_restarts_total", "counter", "BLE worker process restarts after a crash",
+     [({"worker": w["worker_id"]}, w["restarts"]) for w in workers]),
+  ]
+
+
+metrics.register_collector(collect_metrics)
+
+
+@app.get("/metrics")
+async def get_metrics():
+  """Prometheus 文本格式指标"""
+  return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
 @app.post("/setup")
 async def setup(config: dict):
   await scanner_manager.stop()
@@ -572,23 +724,23 @@ async def setup(config: dict):
     await asyncio.gather(*cleanup_tasks, return_exceptions=True)
 
   referees.clear()
+  live_bursts.reset()
 
-  cached_map = {k: v['device'] for k, v in scanner_manager.found_devices.items()}
   connect_tasks = []
 
   for item in config.get("referees", []):
     idx = item.get("index")
     r = HeadlessReferee(idx, item.get("name"), item.get("mode"), broadcast_json)
 
-    pri_dev = cached_map.get(item.get("pri_addr"))
-    sec_dev = cached_map.get(item.get("sec_addr"))
+    pri_dev = scanner_manager.get_device(item.get("pri_addr"))
+    sec_dev = scanner_manager.get_device(item.get("sec_addr"))
 
     node_pri = None;
     node_sec = None
     if pri_dev:
-      node_pri = HeadlessDeviceNode(pri_dev, None, None)
+      node_pri = create_device_node(pri_dev)
     if sec_dev and item.get("mode") == "DUAL":
-      node_sec = HeadlessDeviceNode(sec_dev, None, None)
+      node_sec = create_device_node(sec_dev)
 
     r.set_devices(node_pri, node_sec)
     referees[idx] = r
@@ -615,6 +767,9 @@ async def teardown():
     await asyncio.gather(*tasks, return_exceptions=True)
 
   referees.clear()
+  live_bursts.reset()
+  # 停止比赛时把缓冲中的记录全部写盘并关闭文件
+  await asyncio.to_thread(storage_manager.flush, True)
   await scanner_manager.start()
   return {"status": "ok"}
 
@@ -629,7 +784,7 @@ async def reset():
 @app.post("/api/project/create")
 async def create_project(data: dict):
   # data: { "name": "xxx", "mode": "TOURNAMENT" | "FREE" }
-  config = storage_manager.create_project(data.get("name"), data.get("mode"))
+  config = await asyncio.to_thread(storage_manager.create_project, data.get("name"), data.get("mode"))
   match_state["config"] = config
   return {"status": "ok", "config": config}
 
@@ -661,16 +816,21 @@ async def update_groups(data: dict):
 @app.post("/api/match/set_context")
 async def set_context(data: dict):
   # data: { "group": "GroupA", "contestant": "Player1" }
+  # 切换选手前先让上一位选手的记录落盘
+  await asyncio.to_thread(storage_manager.flush)
   match_state["current_group"] = data.get("group")
   match_state["current_contestant"] = data.get("contestant")
   print(f"Context updated: {match_state['current_contestant']}")
+  # 每位选手的连击从头计算 (与导出时每个 CSV 单独计算一致)
+  live_bursts.reset()
 
   # 广播给前端，确保多端同步
   await broadcast_json({
     "type": "context_update",
     "payload": {
       "group": match_state["current_group"],
-      "contestant": match_state["current_contestant"]
+      "contestant": match_state["current_contestant"],
+      "scored": current_scored()
     }
   })
   return {"status": "ok"}
@@ -683,11 +843,9 @@ async def get_current_project():
 
 @app.get("/api/windows")
 async def get_windows():
-    """获取所有可见窗口的标题"""
+    """获取所有可见窗口的标题 (短时缓存)"""
     try:
-        # 过滤掉空标题和 default IME 等系统窗口
-        titles = [t for t in gw.getAllTitles() if t.strip()]
-        return {"windows": titles}
+        return {"windows": await window_tracker.list_titles()}
     except Exception as e:
         print(f"List windows error: {e}")
         return {"windows": []}
@@ -697,28 +855,29 @@ async def get_window_bounds(data: dict):
     """获取指定标题窗口的坐标和大小"""
     title = data.get("title")
     try:
-        wins = gw.getWindowsWithTitle(title)
-        if wins:
-            w = wins[0]
+        bounds = await window_tracker.get_bounds(title)
+        if bounds:
+            x, y, width, height = bounds
             # 返回 Electron setBounds 需要的格式
             return {
                 "found": True,
-                "bounds": {"x": w.left, "y": w.top, "width": w.width, "height": w.height}
+                "bounds": {"x": x, "y": y, "width": width, "height": height}
             }
         return {"found": False}
     except Exception as e:
         return {"found": False}
 
-# 5. 获取项目列表
+# 5. 获取项目列表 (按修改时间倒序；offset / limit 分页，不传 limit 时返回全部)
 @app.get("/api/projects/list")
-async def get_projects_list():
-    return {"projects": storage_manager.list_projects()}
+async def get_projects_list(offset: int = 0, limit: int = None):
+    projects, total = await asyncio.to_thread(storage_manager.list_projects, offset, limit)
+    return {"projects": projects, "total": total, "offset": offset}
 
 # 6. 加载历史项目 (用于 Continue Match)
 @app.post("/api/project/load")
 async def load_project(data: dict):
   dir_name = data.get("dir_name")
-  config = storage_manager.load_project_config(dir_name)
+  config = await asyncio.to_thread(storage_manager.load_project_config, dir_name)
 
   if config:
     match_state["config"] = config
@@ -740,24 +899,46 @@ async def load_project(data: dict):
 @app.post("/api/project/report")
 async def get_project_report(data: dict):
     dir_name = data.get("dir_name")
-    # 1. 加载配置以获取组别结构
-    config = storage_manager.load_project_config(dir_name)
-    # 2. 加载分数数据
-    scores = storage_manager.load_report_data(dir_name)
+    with REPORT_SECONDS.time():
+      # 1. 加载配置以获取组别结构
+      config = await asyncio.to_thread(storage_manager.load_project_config, dir_name)
+      # 2. 加载分数数据
+      scores = await asyncio.to_thread(storage_manager.load_report_data, dir_name)
     return {"status": "ok", "config": config, "scores": scores}
 
-# 8. 获取当前组打分状态
+# 8. 获取当前组打分状态 (内存集合；新增的已打分选手另经 WebSocket mark_scored 推送)
 @app.post("/api/group/status")
 async def get_group_status(data: dict):
     group_name = data.get("group")
     scored_list = storage_manager.get_scored_players(group_name)
     return {"status": "ok", "scored": scored_list}
 
-# 9. 删除项目
+# 9. 存储写入状态 (队列深度、刷新耗时)
+@app.get("/api/storage/stats")
+async def get_storage_stats():
+    return {"status": "ok", "backend": storage_manager.backend, "writer": storage_manager.writer.get_stats(),
+            "event_cache": storage_manager.events.get_stats(), "waveform": storage_manager.waveforms.get_stats(),
+            "catalog": storage_manager.catalog.get_stats()}
+
+# 9.1 分数曲线 (服务端降采样，按像素宽度返回点数)
+@app.get("/api/waveform")
+async def get_waveform(group: str, contestant: str, dir_name: str = None, start: int = None, end: int = None,
+                       last: int = None, width: int = 800):
+    """
+    某个选手各裁判的分数曲线，每个点为 [t, min, max, last] (t 为相对 t0 的毫秒)
+    start / end: 相对 t0 的毫秒范围；last: 只取最后 last 毫秒；dir_name 为空时查询当前项目
+    """
+    width = max(1, min(width, 10000))
+    data = await asyncio.to_thread(storage_manager.load_waveform, dir_name, group, contestant, start, end, last, width)
+    if data is None:
+        return {"status": "error", "msg": "No project loaded"}
+    return {"status": "ok", **data}
+
+# 10. 删除项目
 @app.post("/api/project/delete")
 async def delete_project(data: dict):
     dir_name = data.get("dir_name")
-    success = storage_manager.delete_project(dir_name)
+    success = await asyncio.to_thread(storage_manager.delete_project, dir_name)
     if success:
         return {"status": "ok"}
     else:
@@ -778,20 +959,20 @@ async def export_details(data: dict):
   players = data.get("players", [])
   options = data.get("options", {})
 
-  # 在后台生成 ZIP
-  zip_io = await asyncio.to_thread(export_manager.generate_zip, group_name, players, options)
-
-  if not zip_io:
+  if not await asyncio.to_thread(export_manager.has_data, group_name, players):
     return {"status": "error", "msg": "No data found"}
 
-  # 返回流式响应
+  # 返回流式响应：ZIP 边生成边发送 (同步生成器由 Starlette 在线程池中迭代，不阻塞事件循环)
   safe_name = "".join([c for c in group_name if c.isalnum() or c in (' ', '_', '-')]).strip()
   headers = {
     'Content-Disposition': f'attachment; filename="Details_{safe_name}.zip"'
   }
-  return StreamingResponse(zip_io, media_type="application/zip", headers=headers)
+  return StreamingResponse(export_manager.iter_zip(group_name, players, options),
+                           media_type="application/zip", headers=headers)
 
 if __name__ == "__main__":
+    # 打包后的可执行文件中启动导出工作进程所需
+    multiprocessing.freeze_support()
     # 获取端口
     SERVER_PORT = load_config()
     # 使用动态端口启动
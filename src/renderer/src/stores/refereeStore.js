@@ -1,6 +1,57 @@
 import {defineStore} from 'pinia'
 import axios from 'axios'
 
+// 二进制分数帧 (/ws?format=binary，格式见 utils/ws_binary.py)
+const BINARY_MAGIC = 0xF7
+const BINARY_TYPES = {1: 'score_update', 2: 'status_update', 3: 'score_batch'}
+const BINARY_STATUS = ['disconnected', 'connecting', 'connected', 'error', 'n/a']
+const textDecoder = new TextDecoder('utf-8')
+// 二进制帧中已知的裁判名称 (跨重连保留，补发的帧只携带变化的名称)
+const binaryNames = {}
+
+// 快照是二进制帧名称的基准：共用编码器只在名称变化时发送，中途加入或重连后收到快照的客户端以快照中的名称为准
+function resetBinaryNames(referees) {
+  for (const key of Object.keys(binaryNames)) delete binaryNames[key]
+  referees.forEach(p => {
+    if (p.name) binaryNames[p.index] = p.name
+  })
+}
+
+// 解码为与 JSON 消息相同的结构；names 跨帧保存已知名称 (名称只在变化时发送)
+function decodeBinaryFrame(buffer, names) {
+  const view = new DataView(buffer)
+  if (view.getUint8(0) !== BINARY_MAGIC) throw new Error('Bad frame magic')
+  const kind = view.getUint8(1)
+  const count = view.getUint16(2, true)
+  const seq = view.getUint32(4, true)
+  let offset = 8
+  const payloads = []
+  for (let i = 0; i < count; i++) {
+    const index = view.getUint16(offset, true)
+    const nameLen = view.getUint8(offset + 20)
+    if (nameLen) {
+      names[index] = textDecoder.decode(new Uint8Array(buffer, offset + 21, nameLen))
+    }
+    payloads.push({
+      index,
+      name: names[index],
+      score: {
+        total: view.getInt32(offset + 2, true),
+        plus: view.getInt32(offset + 6, true),
+        minus: view.getInt32(offset + 10, true),
+        penalty: view.getInt32(offset + 14, true)
+      },
+      status: {
+        pri: BINARY_STATUS[view.getUint8(offset + 18)] || 'disconnected',
+        sec: BINARY_STATUS[view.getUint8(offset + 19)] || 'n/a'
+      }
+    })
+    offset += 21 + nameLen
+  }
+  const type = BINARY_TYPES[kind]
+  return {type, seq, payload: type === 'score_batch' ? payloads : payloads[0]}
+}
+
 export const useRefereeStore = defineStore('referee', {
   state: () => ({
     // --- 动态配置 ---
@@ -9,6 +60,10 @@ export const useRefereeStore = defineStore('referee', {
     referees: {},
     isConnected: false,
     ws: null,
+    // 最后应用的广播序号与服务端 epoch (重连时据此补发缺失的消息)
+    lastSeq: null,
+    wsEpoch: null,
+    resumePending: false,
     projectConfig: {name: '', mode: 'FREE', groups: []},
     currentContext: {groupName: '', contestantName: ''},
     appSettings: {
@@ -17,7 +72,10 @@ export const useRefereeStore = defineStore('referee', {
       suppress_zero_confirm: false,
       device_remarks: {}
     },
-    scoredPlayers: new Set()
+    scoredPlayers: new Set(),
+    scoredGroup: null, // scoredPlayers 所属的组别
+    // 各裁判当前显示的连击 (index -> {start, last, plus, minus, penalty, until?})
+    bursts: {}
   }),
 
   actions: {
@@ -41,11 +99,23 @@ export const useRefereeStore = defineStore('referee', {
     },
 
     // --- 1. WebSocket 连接 ---
-    async connectWebSocket() {
+    // options.binary: 请求紧凑二进制分数帧 (高帧率悬浮窗使用)，其它消息仍为 JSON
+    async connectWebSocket(options = {}) {
       await this.initConfig()
       if (this.ws) return
 
-      this.ws = new WebSocket(this.wsUrl)
+      const binary = !!options.binary
+      const params = new URLSearchParams()
+      if (binary) params.set('format', 'binary')
+      // 重连：带上最后收到的序号，后端补发缺失的消息 (缺口过大时下发快照)；首次连接直接收到快照
+      if (this.lastSeq !== null && this.wsEpoch) {
+        params.set('resume', this.lastSeq)
+        params.set('epoch', this.wsEpoch)
+      }
+      this.resumePending = false
+      const query = params.toString()
+      this.ws = new WebSocket(query ? `${this.wsUrl}?${query}` : this.wsUrl)
+      if (binary) this.ws.binaryType = 'arraybuffer'
 
       this.ws.onopen = () => {
         this.isConnected = true;
@@ -54,20 +124,34 @@ export const useRefereeStore = defineStore('referee', {
 
       this.ws.onmessage = (event) => {
         try {
-          const msg = JSON.parse(event.data)
+          const msg = typeof event.data === 'string'
+            ? JSON.parse(event.data)
+            : decodeBinaryFrame(event.data, binaryNames)
+          if (!this.acceptSequenced(msg)) return
           if (msg.type === 'score_update' || msg.type === 'status_update') {
             this.updateScore(msg.payload)
+          } else if (msg.type === 'score_batch') {
+            // 后端按帧合并的分数更新 (一帧内包含多个裁判)
+            msg.payload.forEach(p => this.updateScore(p))
+          } else if (msg.type === 'burst_start' || msg.type === 'burst_update' || msg.type === 'burst_end') {
+            this.applyBurst(msg.type, msg.payload)
+          } else if (msg.type === 'snapshot') {
+            this.applySnapshot(msg.payload)
           } else if (msg.type === 'context_update') {
             this.currentContext.groupName = msg.payload.group
             this.currentContext.contestantName = msg.payload.contestant
+            this.applyScored(msg.payload.group, msg.payload.scored)
           } else if (msg.type === 'groups_update') {
             if (this.projectConfig) {
               this.projectConfig.groups = msg.payload.groups
             }
           }
           // 【新增】监听选手已打分广播，同步多端状态
+          // (后端在选手第一条记录写入时也会推送，带 group)
           else if (msg.type === 'mark_scored') {
-            this.markAsScored(msg.payload.name)
+            if (!msg.payload.group || msg.payload.group === this.currentContext.groupName) {
+              this.markAsScored(msg.payload.name)
+            }
           }
         } catch (e) {
           console.error("WS Message Parse Error", e)
@@ -77,7 +161,62 @@ export const useRefereeStore = defineStore('referee', {
       this.ws.onclose = () => {
         this.isConnected = false
         this.ws = null
-        setTimeout(() => this.connectWebSocket(), 3000)
+        setTimeout(() => this.connectWebSocket(options), 3000)
+      }
+    },
+
+    // 按序号过滤消息：重复的丢弃；出现缺口时请求补发，补发到达前跳过后续消息 (补发内容包含它们)
+    acceptSequenced(msg) {
+      if (msg.type === 'snapshot') {
+        if (msg.seq !== undefined) {
+          this.lastSeq = msg.seq
+          this.wsEpoch = msg.epoch
+          this.resumePending = false
+        }
+        return true
+      }
+      if (msg.seq === undefined || this.lastSeq === null) {
+        if (msg.seq !== undefined) this.lastSeq = msg.seq
+        return true
+      }
+      if (msg.seq <= this.lastSeq) return false
+      if (msg.seq > this.lastSeq + 1) {
+        if (!this.resumePending && this.ws && this.ws.readyState === WebSocket.OPEN) {
+          this.resumePending = true
+          this.ws.send(JSON.stringify({type: 'resume', seq: this.lastSeq, epoch: this.wsEpoch}))
+        }
+        return false
+      }
+      this.lastSeq = msg.seq
+      this.resumePending = false
+      return true
+    },
+
+    // 后端推送的连击：结束后显示到 until (后端时间，与本机同源) 再清除
+    applyBurst(type, payload) {
+      const index = payload.index
+      this.bursts[index] = payload
+      if (type !== 'burst_end') return
+      setTimeout(() => {
+        // 期间已开始新的连击则保留 (state 中保存的是响应式代理，按 start/until 比较)
+        const current = this.bursts[index]
+        if (current && current.start === payload.start && current.until === payload.until) delete this.bursts[index]
+      }, Math.max(0, payload.until - Date.now()))
+    },
+
+    // 全量状态快照 (连接时、客户端积压过多或缺口过大时，后端用快照代替未发送的增量)
+    applySnapshot(snapshot) {
+      const referees = snapshot.referees || []
+      resetBinaryNames(referees)
+      this.bursts = {}
+      referees.forEach(p => this.updateScore(p))
+      if (snapshot.context) {
+        this.currentContext.groupName = snapshot.context.group
+        this.currentContext.contestantName = snapshot.context.contestant
+        this.applyScored(snapshot.context.group, snapshot.scored)
+      }
+      if (snapshot.groups && this.projectConfig) {
+        this.projectConfig.groups = snapshot.groups
       }
     },
 
@@ -123,11 +262,14 @@ export const useRefereeStore = defineStore('referee', {
     },
 
     async updateSetting(key, value) {
+      await this.updateSettings({[key]: value})
+    },
+
+    // 批量更新设置 (一次请求，后端作为一次变更应用)
+    async updateSettings(changes) {
       try {
-        const payload = {}
-        payload[key] = value
-        this.appSettings[key] = value
-        await axios.post(`${this.apiBase}/api/settings/update`, payload)
+        Object.assign(this.appSettings, changes)
+        await axios.post(`${this.apiBase}/api/settings/update`, changes)
       } catch (e) {
         console.error("Failed to update setting:", e)
       }
@@ -135,13 +277,13 @@ export const useRefereeStore = defineStore('referee', {
 
     // 【新增】保存设备备注
     async saveDeviceRemark(address, remark) {
-      if (!this.appSettings.device_remarks) {
-        this.appSettings.device_remarks = {}
-      }
-      // 更新本地状态
-      this.appSettings.device_remarks[address] = remark
-      // 同步到后端
-      await this.updateSetting('device_remarks', this.appSettings.device_remarks)
+      await this.saveDeviceRemarks({[address]: remark})
+    },
+
+    // 批量保存设备备注 {address: remark}，只发送一次请求
+    async saveDeviceRemarks(remarks) {
+      const merged = {...(this.appSettings.device_remarks || {}), ...remarks}
+      await this.updateSettings({device_remarks: merged})
     },
 
     // --- 3. 项目与组别管理 API ---
@@ -151,6 +293,7 @@ export const useRefereeStore = defineStore('referee', {
       this.projectConfig = {name: '', mode: 'FREE', groups: []}
       this.currentContext = {groupName: '', contestantName: ''}
       this.scoredPlayers = new Set()
+      this.scoredGroup = null
       this.referees = {}
       // 注意：不重置 appSettings 和 ws 连接
     },
@@ -212,6 +355,33 @@ export const useRefereeStore = defineStore('referee', {
       }
     },
 
+    // 订阅扫描结果推送 (/ws/devices)：先收到 devices_snapshot，之后只推送增量
+    // 返回取消订阅函数；连接断开时自动重连
+    async subscribeDevices(onMessage) {
+      await this.initConfig()
+      const url = this.wsUrl.replace(/\/ws$/, '/ws/devices')
+      let ws = null
+      let closed = false
+      const open = () => {
+        ws = new WebSocket(url)
+        ws.onmessage = (event) => {
+          try {
+            onMessage(JSON.parse(event.data))
+          } catch (e) {
+            console.error("Device WS Parse Error", e)
+          }
+        }
+        ws.onclose = () => {
+          if (!closed) setTimeout(open, 3000)
+        }
+      }
+      open()
+      return () => {
+        closed = true
+        if (ws) ws.close()
+      }
+    },
+
     // 启动比赛：发送设备绑定信息
     async startMatch(config) {
       try {
@@ -285,13 +455,14 @@ export const useRefereeStore = defineStore('referee', {
 
     // --- 7. 历史记录与报表 ---
 
-    async fetchHistoryProjects() {
+    // 分页获取历史项目 (按修改时间倒序)，返回 { projects, total }
+    async fetchHistoryProjects(offset = 0, limit = 50) {
       try {
-        const res = await axios.get(`${this.apiBase}/api/projects/list`)
-        return res.data.projects || []
+        const res = await axios.get(`${this.apiBase}/api/projects/list`, {params: {offset, limit}})
+        return {projects: res.data.projects || [], total: res.data.total ?? 0}
       } catch (e) {
         console.error("Fetch projects failed", e)
-        return []
+        return {projects: [], total: 0}
       }
     },
 
@@ -328,12 +499,24 @@ export const useRefereeStore = defineStore('referee', {
         const res = await axios.post(`${this.apiBase}/api/group/status`, {group: groupName})
         if (res.data.scored) {
           this.scoredPlayers = new Set(res.data.scored)
+          this.scoredGroup = groupName
         }
       } catch (e) {
         console.error("Fetch status failed", e)
       }
     },
 
+    // 后端推送的已打分选手：切换组别时替换，同组时合并 (保留本地手动标记)
+    applyScored(group, names) {
+      if (!Array.isArray(names)) return
+      if (group !== this.scoredGroup) {
+        this.scoredPlayers = new Set(names)
+        this.scoredGroup = group
+      } else {
+        names.forEach(n => this.scoredPlayers.add(n))
+      }
+    },
+
     broadcastPlayerScored(name) {
       // 1. 本地乐观更新
       this.markAsScored(name)
@@ -1,9 +1,14 @@
 # utils/app_settings.py
 import json
 import os
+import threading
+import time
 
 SETTINGS_FILE = "app_settings.json"
 
+# 修改后延迟写盘的时间 (秒)：窗口内的多次修改合并为一次写入
+SAVE_DELAY = 0.5
+
 # 默认配置
 DEFAULT_SETTINGS = {
     "language": "zh",
@@ -13,35 +18,107 @@ DEFAULT_SETTINGS = {
 }
 
 class AppSettings:
-    def __init__(self):
+    """
+    全局设置
+    修改在内存中立即生效 (整体替换 settings 字典，读取无需加锁)，由后台线程延迟批量写盘 (临时文件 + 原子替换)
+    """
+
+    def __init__(self, path=SETTINGS_FILE, save_delay=SAVE_DELAY):
+        self.path = path
+        self.save_delay = save_delay
         self.settings = DEFAULT_SETTINGS.copy()
+        self._remarks = {}
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._changed = threading.Event()
+        self._thread = None
+        self._version = 0        # 每次修改 +1
+        self._saved_version = 0  # 已写盘的版本
+        self.stats = {"updates": 0, "saves": 0, "errors": 0}
         self.load()
 
     def load(self):
         """加载配置文件，如果不存在则使用默认值"""
-        if os.path.exists(SETTINGS_FILE):
+        if os.path.exists(self.path):
             try:
-                with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                with open(self.path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
                     self.settings.update(data)
             except Exception as e:
                 print(f"Failed to load settings: {e}")
+        self._rebuild_views()
 
-    def save(self):
-        """保存当前配置到文件"""
-        try:
-            with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
-                json.dump(self.settings, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            print(f"Failed to save settings: {e}")
+    def _rebuild_views(self):
+        # 扫描热路径读取的派生数据，只在对应键变化时重建
+        self._remarks = dict(self.settings.get("device_remarks") or {})
+
+    @property
+    def remarks(self):
+        """设备备注 {address: remark} (只读，缓存)"""
+        return self._remarks
 
     def get(self, key):
         """获取配置项"""
         return self.settings.get(key, DEFAULT_SETTINGS.get(key))
 
+    def update(self, changes):
+        """
+        批量修改 (作为一次变更应用)，返回实际发生变化的键
+        只在内存中生效并安排后台写盘，不阻塞调用方
+        """
+        with self._lock:
+            changed = {k for k, v in changes.items() if self.settings.get(k) != v or k not in self.settings}
+            if not changed: return changed
+            self.settings = {**self.settings, **{k: changes[k] for k in changed}}
+            if "device_remarks" in changed:
+                self._rebuild_views()
+            self._version += 1
+            self.stats["updates"] += 1
+        self._schedule_save()
+        return changed
+
     def set(self, key, value):
-        """设置配置项并立即保存"""
-        self.settings[key] = value
+        """设置单个配置项 (延迟保存)"""
+        self.update({key: value})
+
+    def _schedule_save(self):
+        if not self._thread or not self._thread.is_alive():
+            with self._thread_lock:
+                if not self._thread or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="app-settings-writer", daemon=True)
+                    self._thread.start()
+        self._changed.set()
+
+    def _run(self):
+        while True:
+            self._changed.wait()
+            # 去抖：save_delay 内没有新的修改才写盘
+            while True:
+                self._changed.clear()
+                time.sleep(self.save_delay)
+                if not self._changed.is_set(): break
+            self.save()
+
+    def save(self):
+        """把当前配置写入文件 (临时文件 + 原子替换)；已是最新时不写"""
+        with self._save_lock:
+            with self._lock:
+                if self._version == self._saved_version: return
+                settings, version = self.settings, self._version
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(settings, f, indent=4, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+                self._saved_version = version
+                self.stats["saves"] += 1
+            except Exception as e:
+                self.stats["errors"] += 1
+                print(f"Failed to save settings: {e}")
+
+    def flush(self):
+        """立即写入尚未保存的修改 (退出前调用)"""
         self.save()
 
 # 全局单例
@@ -0,0 +1,100 @@
+# utils/ble_capture.py
+"""
+BLE 原始通知抓包 (.ftcap)
+
+按设备地址记录每一条原始通知及主机接收时间戳，用于复现现场问题和离线压测
+(回放工具见 benchmarks/replay.py)。
+
+文件格式 (小端序):
+  文件头   b"FTCAP\\x02" + <q 抓包开始时间 (Unix 纪元微秒)
+  设备定义 <BHB  type=1, 设备编号, 地址长度 + 地址 (utf-8)
+  通知包   <BHQH type=2, 设备编号, 相对开始时间 (微秒), 数据长度 + 原始数据
+"""
+import os
+import struct
+import time
+from datetime import datetime
+
+MAGIC = b"FTCAP\x02"
+REC_DEVICE = 1
+REC_PACKET = 2
+
+_HEADER = struct.Struct("<q")
+_DEVICE = struct.Struct("<BHB")
+_PACKET = struct.Struct("<BHQH")
+
+
+class CaptureWriter:
+  """抓包写入器 (在 BLE 回调中调用 record，仅追加到大缓冲区)"""
+
+  def __init__(self, path):
+    self.path = path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # 64KB 缓冲：每条记录约 28 字节，约两千多条才触发一次系统调用
+    self._f = open(path, 'wb', buffering=1 << 16)
+    self._start_ns = time.time_ns()
+    self._start_perf = time.perf_counter_ns()
+    self._ids = {}
+    self.packets = 0
+    self._f.write(MAGIC)
+    self._f.write(_HEADER.pack(self._start_ns // 1000))
+
+  def record(self, address, data):
+    dev_id = self._ids.get(address)
+    if dev_id is None:
+      dev_id = len(self._ids)
+      self._ids[address] = dev_id
+      addr_bytes = address.encode('utf-8')
+      self._f.write(_DEVICE.pack(REC_DEVICE, dev_id, len(addr_bytes)) + addr_bytes)
+    rel_us = (time.perf_counter_ns() - self._start_perf) // 1000
+    self._f.write(_PACKET.pack(REC_PACKET, dev_id, rel_us, len(data)) + bytes(data))
+    self.packets += 1
+
+  def close(self):
+    try:
+      self._f.close()
+    except Exception:
+      pass
+
+  def get_info(self):
+    return {"path": self.path, "packets": self.packets, "devices": list(self._ids)}
+
+
+def read_capture(path):
+  """
+  读取抓包文件
+  返回 (开始时间 datetime, 生成器: (address, rel_us, data))
+  """
+  f = open(path, 'rb')
+  if f.read(len(MAGIC)) != MAGIC:
+    f.close()
+    raise ValueError(f"{path} is not a .ftcap capture file")
+  start_us, = _HEADER.unpack(f.read(_HEADER.size))
+
+  def records():
+    addresses = {}
+    try:
+      while True:
+        head = f.read(1)
+        if not head: break
+        if head[0] == REC_DEVICE:
+          rest = f.read(_DEVICE.size - 1)
+          _, dev_id, n = _DEVICE.unpack(head + rest)
+          addresses[dev_id] = f.read(n).decode('utf-8')
+        elif head[0] == REC_PACKET:
+          rest = f.read(_PACKET.size - 1)
+          if len(rest) < _PACKET.size - 1: break  # 抓包被中断导致的截断记录
+          _, dev_id, rel_us, n = _PACKET.unpack(head + rest)
+          data = f.read(n)
+          if len(data) < n: break
+          yield addresses.get(dev_id, f"dev{dev_id}"), rel_us, data
+        else:
+          raise ValueError(f"Corrupt capture record type {head[0]}")
+    finally:
+      f.close()
+
+  return datetime.fromtimestamp(start_us / 1e6), records()
+
+
+def new_capture_path(base_dir):
+  return os.path.join(base_dir, datetime.now().strftime("capture_%Y%m%d_%H%M%S.ftcap"))
@@ -0,0 +1,305 @@
+# utils/ble_node.py
+"""
+BLE 计数器协议与单台设备连接 (HeadlessDeviceNode)
+
+既在主进程中使用 (ble_workers.count = 0)，也在 BLE 工作进程中使用 (见 utils/ble_workers.py)，
+因此这里不依赖 server.py：BLE 后端、连接调度与心跳都是本模块的全局对象，
+收到的通知通过 node.on_packet(node, data) 交给调用方 (主进程送入摄取流水线，工作进程解码后转发)。
+"""
+import asyncio
+import struct
+import time
+from dataclasses import dataclass
+
+from utils.connect_scheduler import ConnectionScheduler
+from utils.heartbeat import HeartbeatMonitor
+
+# ==========================================================
+# 配置与协议
+# ==========================================================
+SERVICE_UUID = "025018d0-6951-4a81-de4f-453d8dae9128"
+CHARACTERISTIC_UUID = "025018d0-6951-4a81-de4f-453d8dae9128"
+# 标准设备名称特征值 UUID (Generic Access -> Device Name)
+# 用于心跳检测，因为所有 BLE 设备都有这个，且读取它不会影响业务逻辑
+STANDARD_DEVICE_NAME_UUID = "00002a00-0000-1000-8000-00805f9b34fb"
+
+DEVICE_NAME_PREFIX = "Counter-"
+
+PACKET_FORMAT = "<ibiiI"
+PACKET_SIZE = struct.calcsize(PACKET_FORMAT)
+
+# 等待特征值出现时的轮询间隔 (秒)
+READY_POLL_INTERVAL = 0.05
+
+
+@dataclass
+class ClickerEvent:
+  current_total: int
+  event_type: int
+  total_plus: int
+  total_minus: int
+  timestamp_ms: int
+
+
+def parse_notification_data(data: bytes) -> ClickerEvent:
+  if len(data) != PACKET_SIZE: raise ValueError("Data mismatch")
+  return ClickerEvent(*struct.unpack(PACKET_FORMAT, data))
+
+
+def event_fields(evt):
+  """ClickerEvent -> 元组 (跨进程传递)；ClickerEvent(*fields) 还原，struct.pack(PACKET_FORMAT, *fields) 还原原始数据包"""
+  return (evt.current_total, evt.event_type, evt.total_plus, evt.total_minus, evt.timestamp_ms)
+
+
+# ==========================================================
+# BLE 后端 (真实蓝牙 / 虚拟计数器)
+# ==========================================================
+BleakScanner = None
+BleakClient = None
+
+
+def use_backend(sim_config=None):
+  """选择 BLE 后端；sim_config.enabled 为真时使用虚拟计数器 (各进程中按相同参数创建同一批虚拟设备)"""
+  global BleakScanner, BleakClient
+  if sim_config and sim_config.get("enabled"):
+    from utils.ble_simulator import SimulatedScanner, SimulatedClient, configure_fleet
+    configure_fleet(int(sim_config.get("devices", 16)), sim_config.get("profile"), int(sim_config.get("seed", 1)))
+    BleakScanner, BleakClient = SimulatedScanner, SimulatedClient
+  else:
+    from bleak import BleakScanner as _Scanner, BleakClient as _Client
+    BleakScanner, BleakClient = _Scanner, _Client
+
+
+# 连接调度：并发上限、错开启动、带抖动的指数退避重连
+connect_scheduler = ConnectionScheduler()
+# 心跳：通知即存活，安静一段时间后才主动读取
+heartbeat_monitor = HeartbeatMonitor()
+
+
+# ==========================================================
+# 核心业务类 (修复心跳与重连)
+# ==========================================================
+class HeadlessDeviceNode:
+  def __init__(self, ble_device, on_status_callback=None, name=None, client_kwargs=None):
+    # ble_device 可以是扫描得到的 BLEDevice，也可以是地址字符串 (工作进程中由 bleak 自行查找设备)
+    self.ble_device = ble_device
+    self.address = getattr(ble_device, "address", ble_device)
+    self.name = name or getattr(ble_device, "name", None) or self.address
+    self.client_kwargs = client_kwargs or {}  # 例如 {"adapter": "hci1"}
+    self.client = None
+    self.on_status_callback = on_status_callback
+    # 收到通知时调用 on_packet(node, data)
+    self.on_packet = None
+    # 数据接收方 (HeadlessReferee) 与本设备的角色，由 set_devices 设置
+    self.sink = None
+    self.role = None
+
+    self.intentional_disconnect = False
+    self.is_reconnecting = False
+    self._heartbeat_task = None
+    self.liveness = heartbeat_monitor.track(self.address, self.name)
+
+  async def connect(self):
+    self.intentional_disconnect = False
+    # 通过调度器排队：限制并发、错开开始时间
+    connect_scheduler.mark_requested(self.address, self.name)
+    return await connect_scheduler.run(self.address, self.name, self._do_connect)
+
+  async def _wait_ready(self):
+    """
+    等待目标特征值出现在服务列表中 (代替固定等待 1.5 秒)
+    超过一半等待时间仍未出现时读一次标准设备名，促使系统刷新服务缓存 (Windows)
+    """
+    t0 = time.monotonic()
+    refreshed = False
+    while self.client:
+      try:
+        if self.client.services.get_characteristic(CHARACTERISTIC_UUID):
+          connect_scheduler.record_ready(self.address, (time.monotonic() - t0) * 1000)
+          return True
+      except Exception:
+        pass  # 服务发现尚未完成
+      elapsed = time.monotonic() - t0
+      if elapsed >= connect_scheduler.ready_timeout: return False
+      if not refreshed and elapsed >= connect_scheduler.ready_timeout / 2:
+        refreshed = True
+        try:
+          await self.client.read_gatt_char(STANDARD_DEVICE_NAME_UUID)
+        except Exception:
+          pass  # 忽略错误，只是为了刷新缓存
+        continue
+      await asyncio.sleep(READY_POLL_INTERVAL)
+    return False
+
+  async def _do_connect(self):
+    # 排队期间用户已停止比赛
+    if self.intentional_disconnect: return False
+    self._emit_status("connecting")
+    print(f"Connecting to {self.name}...")
+
+    try:
+      self.client = BleakClient(self.ble_device, disconnected_callback=self._on_disconnect, **self.client_kwargs)
+      await self.client.connect()
+      print(f"Connected: {self.name}")
+
+      # 【修复 1】等待服务发现完成 (特征值出现即继续)，解决 Windows 缓存问题
+      if not await self._wait_ready() and self.client:
+        print(f"Characteristic not found on {self.name} after {connect_scheduler.ready_timeout}s, trying anyway")
+
+      # 【关键修复】如果在等待期间连接被断开(self.client变为None)，则中止后续操作，防止 AttributeError
+      if not self.client:
+          print(f"Connection aborted for {self.name} during setup.")
+          return False
+
+      # 开启通知
+      await self.client.start_notify(CHARACTERISTIC_UUID, self._on_notify)
+
+      self._emit_status("connected")
+
+      # 开启心跳
+      self.liveness = heartbeat_monitor.track(self.address, self.name)
+      if self._heartbeat_task: self._heartbeat_task.cancel()
+      self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+      return True
+
+    except Exception as e:
+      print(f"Conn failed: {e}")
+      connect_scheduler.record_error(self.address, e)
+
+      # 打印调试信息
+      try:
+        if self.client and self.client.services:
+          print("--- Debug: Services Found ---")
+          for s in self.client.services:
+            print(f"   Service: {s.uuid}")
+          print("-----------------------------")
+      except:
+        pass
+
+      # 【关键】失败必须断开，否则设备卡死不广播
+      await self._ensure_disconnect()
+
+      if not self.intentional_disconnect:
+        self._trigger_reconnect()
+      else:
+        self._emit_status("disconnected")
+      return False
+
+  async def disconnect(self):
+    """用户主动断开"""
+    self.intentional_disconnect = True
+    connect_scheduler.forget(self.address)
+    if self._heartbeat_task:
+      self._heartbeat_task.cancel()
+      self._heartbeat_task = None
+
+    await self._ensure_disconnect()
+    self._emit_status("disconnected")
+
+  async def _ensure_disconnect(self):
+    """确保底层连接断开的辅助函数"""
+    if self.client:
+      try:
+        # 只有连接状态才需要断开
+        if self.client.is_connected:
+          print(f"Terminating connection to {self.name}...")
+          await self.client.disconnect()
+      except Exception as e:
+        print(f"Disconnect error (ignored): {e}")
+      finally:
+        # 无论如何，清空 client 对象，防止残留
+        self.client = None
+
+  def _on_disconnect(self, client):
+    print(f"Disconnected callback: {self.name}")
+    if self._heartbeat_task: self._heartbeat_task.cancel()
+
+    if not self.intentional_disconnect:
+      self._trigger_reconnect()
+    else:
+      self._emit_status("disconnected")
+
+  def _trigger_reconnect(self):
+    if self.is_reconnecting: return
+    # 同步置位：心跳断开时 _on_disconnect 与心跳循环会先后调用这里
+    self.is_reconnecting = True
+    self._emit_status("error")
+    print(f"Connection lost! Auto-reconnect {self.name}...")
+    asyncio.create_task(self._reconnect_loop())
+
+  async def _reconnect_loop(self):
+    self.is_reconnecting = True
+    address, name = self.address, self.name
+    connect_scheduler.mark_requested(address, name, reconnect=True)
+    attempt = 0
+    while not self.intentional_disconnect:
+      # 指数退避 + 抖动：多台设备同时掉线时错开重连
+      delay = connect_scheduler.backoff_delay(attempt)
+      print(f"Retrying {name} in {delay:.1f}s...")
+      await asyncio.sleep(delay)
+
+      # 如果用户在重连期间点了 Stop，立即停止
+      if self.intentional_disconnect: break
+
+      if await connect_scheduler.run(address, name, self._do_connect):
+        print(f"Reconnected: {name}")
+        self.is_reconnecting = False
+        return
+      attempt += 1
+    self.is_reconnecting = False
+
+  async def _heartbeat_loop(self):
+    """心跳检测：quiet_period 内收到过通知即视为存活，安静时才读取一次设备名称"""
+    lv = self.liveness
+    try:
+      while self.client:
+        wait = heartbeat_monitor.next_probe_in(lv)
+        if wait > 0:
+          await asyncio.sleep(wait)
+          # 等待期间收到过通知：本次读取省掉
+          if heartbeat_monitor.next_probe_in(lv) > 0: lv.skipped += 1
+          continue
+
+        client = self.client
+        if not client: break
+        t0 = time.monotonic()
+        try:
+          # 【修复 3】用读取标准特征值代替 get_rssi
+          await asyncio.wait_for(client.read_gatt_char(STANDARD_DEVICE_NAME_UUID), heartbeat_monitor.read_timeout)
+          heartbeat_monitor.record_read(lv, (time.monotonic() - t0) * 1000)
+          continue
+        except Exception as e:
+          if not heartbeat_monitor.record_failure(lv, e):
+            print(f"Heartbeat failed on {self.name} "
+                  f"({lv.consecutive_failures}/{heartbeat_monitor.fail_threshold}): {e or type(e).__name__}")
+            await asyncio.sleep(heartbeat_monitor.read_timeout)
+            continue
+
+        print(f"Heartbeat failed {lv.consecutive_failures} times ({lv.last_error}), active disconnect...")
+        # 心跳失败，说明链路已死，主动断开触发重连逻辑
+        await self._ensure_disconnect()
+        # _ensure_disconnect 可能会触发 _on_disconnect 回调
+        # 如果没触发，我们需要手动确保进入重连流程
+        if not self.intentional_disconnect:
+          self._trigger_reconnect()
+        break
+    except asyncio.CancelledError:
+      pass
+
+  def _emit_status(self, status):
+    if self.on_status_callback:
+      self.on_status_callback(status)
+
+  async def send_reset(self):
+    if self.client:  # 不检查 is_connected，让 bleak 自己抛异常
+      try:
+        await self.client.write_gatt_char(CHARACTERISTIC_UUID, b'\x01', response=True)
+      except:
+        pass
+
+  def _on_notify(self, sender, data):
+    self.liveness.on_notify()
+    # 回调中不做任何解析，交给 on_packet (摄取流水线) 处理
+    if self.on_packet:
+      self.on_packet(self, data)
@@ -0,0 +1,320 @@
+# utils/ble_simulator.py
+"""
+虚拟 BLE 计数器 (无蓝牙环境下的压测替身)
+
+提供与 bleak 接口兼容的 SimulatedScanner / SimulatedClient，
+可在没有真实 Counter-XXXX 硬件和蓝牙适配器的机器上 (例如 CI) 跑通 /scan -> /setup -> 通知 -> 广播 全链路。
+数据包严格遵循 BLE_PROTOCOL.md 中的 17 字节 <ibiiI 格式。
+"""
+import asyncio
+import math
+import random
+import struct
+import time
+from collections import deque
+from dataclasses import dataclass, fields
+
+# 与 utils/ble_node.py / BLE_PROTOCOL.md 保持一致
+COUNTER_CHAR_UUID = "025018d0-6951-4a81-de4f-453d8dae9128"
+DEVICE_NAME_CHAR_UUID = "00002a00-0000-1000-8000-00805f9b34fb"
+PACKET_FORMAT = "<ibiiI"
+
+# 每台设备保留的发送时间记录条数 (用于计算端到端延迟)
+SENT_HISTORY_SIZE = 4096
+
+
+@dataclass
+class SimProfile:
+  """虚拟设备的行为参数"""
+  click_rate: float = 5.0  # 平均每秒点击次数
+  burst_size: int = 1  # 每次连击包含的点击数 (1 = 均匀随机点击)
+  burst_gap_ms: float = 40.0  # 连击内相邻两次点击的间隔
+  minus_ratio: float = 0.1  # 减分 (Zero Click) 占比
+  disconnect_per_min: float = 0.0  # 每台设备每分钟随机断线次数的期望
+  heartbeat_fail_ratio: float = 0.0  # 读取 Device Name (心跳) 失败的概率
+  connect_delay: float = 0.05  # 模拟建立连接 + 服务发现耗时 (秒)
+  discovery_delay: float = 0.0  # 连接后特征值延迟出现的时间 (模拟 Windows 服务缓存)，读取设备名可立即刷新
+  adv_interval: float = 0.5  # 广播间隔 (秒)
+
+  @classmethod
+  def from_dict(cls, data):
+    names = {f.name for f in fields(cls)}
+    return cls(**{k: v for k, v in (data or {}).items() if k in names})
+
+
+@dataclass
+class SimBLEDevice:
+  """对应 bleak.backends.device.BLEDevice"""
+  address: str
+  name: str
+  details: object = None
+
+
+@dataclass
+class SimAdvertisementData:
+  """对应 bleak.backends.scanner.AdvertisementData"""
+  local_name: str
+  service_uuids: list
+  rssi: int
+
+
+class SimCharacteristic:
+  def __init__(self, uuid):
+    self.uuid = uuid
+
+  def __str__(self):
+    return self.uuid
+
+
+class SimService:
+  def __init__(self, uuid, characteristics):
+    self.uuid = uuid
+    self.characteristics = characteristics
+
+
+class SimServiceCollection:
+  """对应 BleakGATTServiceCollection，仅实现 server.py 用到的部分"""
+
+  def __init__(self):
+    self.ready_at = 0.0  # 此时间之前 get_characteristic 找不到任何特征值
+    self._services = [
+      SimService("015018d0-6951-4a81-de4f-453d8dae9128", [SimCharacteristic(COUNTER_CHAR_UUID)]),
+      SimService("00001800-0000-1000-8000-00805f9b34fb", [SimCharacteristic(DEVICE_NAME_CHAR_UUID)]),
+    ]
+
+  def __iter__(self):
+    return iter(self._services)
+
+  def get_characteristic(self, uuid):
+    if time.monotonic() < self.ready_at: return None
+    for s in self._services:
+      for c in s.characteristics:
+        if c.uuid.lower() == str(uuid).lower():
+          return c
+    return None
+
+
+class VirtualCounter:
+  """单台虚拟计数器：维护累计计数并生成 17 字节通知包"""
+
+  def __init__(self, address, rssi, profile, seed):
+    self.address = address
+    self.name = "Counter-" + address.replace(":", "")[-4:]
+    self.rssi = rssi
+    self.profile = profile
+    self.rng = random.Random(seed)
+    self.plus = 0
+    self.minus = 0
+    self.client = None  # 当前连接的 SimulatedClient (设备同一时间只接受一个连接)
+    self._boot = time.monotonic()
+    # (plus, minus) -> perf_counter_ns，供压测脚本计算端到端延迟
+    self._sent = {}
+    self._sent_order = deque()
+
+  def uptime_ms(self):
+    return int((time.monotonic() - self._boot) * 1000) & 0xFFFFFFFF
+
+  def press(self, event_type):
+    """模拟一次按键，返回对应的通知数据包"""
+    if event_type == 1:
+      self.plus += 1
+    elif event_type == -1:
+      self.minus += 1
+    else:
+      self.plus = 0
+      self.minus = 0
+    packet = struct.pack(PACKET_FORMAT, self.plus - self.minus, event_type, self.plus, self.minus, self.uptime_ms())
+    self._remember((self.plus, self.minus))
+    return packet
+
+  def _remember(self, key):
+    self._sent[key] = time.perf_counter_ns()
+    self._sent_order.append(key)
+    if len(self._sent_order) > SENT_HISTORY_SIZE:
+      old = self._sent_order.popleft()
+      self._sent.pop(old, None)
+
+  def sent_time_ns(self, plus, minus):
+    return self._sent.get((plus, minus))
+
+  def advertisement(self):
+    rssi = self.rssi + self.rng.randint(-3, 3)
+    return SimBLEDevice(self.address, self.name), SimAdvertisementData(self.name, [COUNTER_CHAR_UUID], rssi)
+
+
+class SimulatedFleet:
+  """一组虚拟计数器，按地址索引"""
+
+  def __init__(self, count=16, profile=None, seed=1):
+    self.profile = profile or SimProfile()
+    self.counters = {}
+    self.stats = {"packets": 0, "disconnects": 0, "heartbeat_failures": 0, "connects": 0, "reads": 0}
+    rng = random.Random(seed)
+    for i in range(count):
+      address = "F7:5E:00:00:{:02X}:{:02X}".format((i >> 8) & 0xFF, i & 0xFF)
+      self.counters[address] = VirtualCounter(address, rng.randint(-85, -45), self.profile, seed * 1000 + i)
+
+  def get(self, address):
+    return self.counters.get(address)
+
+  def sent_time_ns(self, address, plus, minus):
+    c = self.counters.get(address)
+    return c.sent_time_ns(plus, minus) if c else None
+
+
+_fleet = None
+
+
+def configure_fleet(count=16, profile=None, seed=1):
+  """(重新) 创建全局虚拟设备舰队"""
+  global _fleet
+  if isinstance(profile, dict):
+    profile = SimProfile.from_dict(profile)
+  _fleet = SimulatedFleet(count, profile, seed)
+  return _fleet
+
+
+def get_fleet():
+  if _fleet is None:
+    configure_fleet()
+  return _fleet
+
+
+class SimulatedScanner:
+  """BleakScanner 替身：周期性地为未连接的虚拟设备触发 detection_callback"""
+
+  def __init__(self, detection_callback=None, fleet=None, **kwargs):
+    self.detection_callback = detection_callback
+    self.fleet = fleet or get_fleet()
+    self._task = None
+
+  async def start(self):
+    if self._task: return
+    self._task = asyncio.create_task(self._advertise_loop())
+
+  async def stop(self):
+    if self._task:
+      self._task.cancel()
+      self._task = None
+
+  async def _advertise_loop(self):
+    try:
+      while True:
+        for counter in self.fleet.counters.values():
+          # 真实设备在被连接后会停止广播
+          if counter.client is None and self.detection_callback:
+            self.detection_callback(*counter.advertisement())
+        await asyncio.sleep(self.fleet.profile.adv_interval)
+    except asyncio.CancelledError:
+      pass
+
+
+class SimulatedClient:
+  """BleakClient 替身：连接后按 SimProfile 推送点击通知，并可注入断线/心跳失败"""
+
+  def __init__(self, address_or_ble_device, disconnected_callback=None, fleet=None, **kwargs):
+    self.fleet = fleet or get_fleet()
+    self.address = getattr(address_or_ble_device, "address", address_or_ble_device)
+    self.disconnected_callback = disconnected_callback
+    self.is_connected = False
+    self.services = SimServiceCollection()
+    self._counter = self.fleet.get(self.address)
+    self._notify_cb = None
+    self._click_task = None
+
+  async def connect(self, **kwargs):
+    await asyncio.sleep(self.fleet.profile.connect_delay)
+    c = self._counter
+    if c is None:
+      raise RuntimeError(f"Device with address {self.address} was not found.")
+    if c.client is not None and c.client is not self:
+      raise RuntimeError(f"Device {self.address} is busy.")
+    c.client = self
+    self.is_connected = True
+    self.services.ready_at = time.monotonic() + self.fleet.profile.discovery_delay
+    self.fleet.stats["connects"] += 1
+    return True
+
+  async def disconnect(self):
+    if not self.is_connected: return True
+    self._drop_link()
+    return True
+
+  def _drop_link(self):
+    self.is_connected = False
+    if self._click_task:
+      self._click_task.cancel()
+      self._click_task = None
+    if self._counter and self._counter.client is self:
+      self._counter.client = None
+    # bleak 在任何断开 (包括主动断开) 时都会回调
+    if self.disconnected_callback:
+      self.disconnected_callback(self)
+
+  def _require_connection(self):
+    if not self.is_connected:
+      raise RuntimeError("Not connected")
+
+  async def read_gatt_char(self, char_specifier, **kwargs):
+    self._require_connection()
+    await asyncio.sleep(0.005)
+    self.fleet.stats["reads"] += 1
+    if self._counter.rng.random() < self.fleet.profile.heartbeat_fail_ratio:
+      self.fleet.stats["heartbeat_failures"] += 1
+      raise asyncio.TimeoutError("Simulated GATT read timeout")
+    if str(char_specifier).lower() == DEVICE_NAME_CHAR_UUID:
+      # 读取设备名会促使系统刷新服务列表
+      self.services.ready_at = min(self.services.ready_at, time.monotonic())
+      return bytearray(self._counter.name.encode())
+    return bytearray(struct.pack(PACKET_FORMAT, self._counter.plus - self._counter.minus, 0,
+                                 self._counter.plus, self._counter.minus, self._counter.uptime_ms()))
+
+  async def write_gatt_char(self, char_specifier, data, response=None):
+    self._require_connection()
+    if bytes(data) == b'\x01':
+      # 远程重置：设备归零后推送一次类型为 0 的数据包
+      self._emit(self._counter.press(0))
+
+  async def start_notify(self, char_specifier, callback, **kwargs):
+    self._require_connection()
+    self._notify_cb = callback
+    if self._click_task is None:
+      self._click_task = asyncio.create_task(self._click_loop())
+
+  async def stop_notify(self, char_specifier):
+    self._notify_cb = None
+    if self._click_task:
+      self._click_task.cancel()
+      self._click_task = None
+
+  def _emit(self, packet):
+    if self._notify_cb:
+      self.fleet.stats["packets"] += 1
+      self._notify_cb(SimCharacteristic(COUNTER_CHAR_UUID), bytearray(packet))
+
+  async def _click_loop(self):
+    p = self.fleet.profile
+    rng = self._counter.rng
+    burst = max(1, int(p.burst_size))
+    # 连击之间的平均间隔，使总体点击频率约等于 click_rate
+    burst_rate = max(p.click_rate, 1e-6) / burst
+    drop_rate = p.disconnect_per_min / 60.0
+    try:
+      while self.is_connected:
+        wait = rng.expovariate(burst_rate)
+        # 在等待窗口内按泊松过程注入随机断线
+        if drop_rate > 0 and rng.random() < 1 - math.exp(-drop_rate * wait):
+          await asyncio.sleep(rng.uniform(0, wait))
+          self.fleet.stats["disconnects"] += 1
+          self._click_task = None
+          self._drop_link()
+          return
+        await asyncio.sleep(wait)
+        for i in range(burst):
+          if not self.is_connected: return
+          event_type = -1 if rng.random() < p.minus_ratio else 1
+          self._emit(self._counter.press(event_type))
+          if i < burst - 1:
+            await asyncio.sleep(p.burst_gap_ms / 1000.0)
+    except asyncio.CancelledError:
+      pass
@@ -0,0 +1,363 @@
+# utils/ble_workers.py
+"""
+BLE 工作进程 (按适配器 / 设备分组分片)
+
+单个 bleak 协议栈 + 单个事件循环能同时维持的连接数有限。启用后 (config.yaml 的 ble_workers)：
+  - 每个工作进程 (每个适配器一个，或按 count 平均分组) 运行自己的事件循环与 bleak，
+    负责连接、心跳、重连，并在进程内完成摄取流水线的解码阶段
+  - 解码后的事件按批通过 multiprocessing.Pipe 发回主进程，主进程只做融合/存储/广播
+  - 主进程负责分配设备 (同一地址固定分给同一个工作进程，新地址分给设备最少的进程)，
+    工作进程崩溃时按退避时间重启，并重新连接分配给它的设备
+主进程中用 RemoteDeviceNode 代替 HeadlessDeviceNode，对 HeadlessReferee 和 /setup 透明。
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+
+from utils import ble_node
+from utils.ingest import IngestPipeline
+
+# 工作进程推送统计信息的间隔 (秒)
+STATS_INTERVAL = 1.0
+# 崩溃重启退避 (秒)：连续崩溃时翻倍
+RESTART_BASE = 0.5
+RESTART_MAX = 10.0
+# 运行超过该时间 (秒) 后再崩溃，退避从头计算
+STABLE_AFTER = 30.0
+
+
+# ==========================================================
+# 工作进程
+# ==========================================================
+class _Forwarder:
+  """工作进程中摄取流水线的 sink：收集解码后的事件，每批发送一次"""
+
+  def __init__(self, conn):
+    self.conn = conn
+    self.outbox = []
+    self.sent = 0
+
+  def fuse(self, role, evt):
+    # role 即设备地址
+    self.outbox.append((role, ble_node.event_fields(evt)))
+
+  def persist(self, role, evt):
+    pass
+
+  def publish(self, recv_ns=None):
+    if not self.outbox: return
+    batch, self.outbox = self.outbox, []
+    self.sent += len(batch)
+    self.conn.send(("events", batch))
+
+
+def _read_commands(conn, loop, inbox):
+  """读取主进程命令 (阻塞读放在线程中)；管道断开说明主进程已退出"""
+  try:
+    while True:
+      msg = conn.recv()
+      loop.call_soon_threadsafe(inbox.put_nowait, msg)
+  except (EOFError, OSError):
+    loop.call_soon_threadsafe(inbox.put_nowait, None)
+
+
+async def _worker(conn, worker_id, options):
+  ble_node.use_backend(options.get("simulator"))
+  ble_node.connect_scheduler.configure(**(options.get("connection") or {}))
+  ble_node.heartbeat_monitor.configure(**(options.get("heartbeat") or {}))
+  client_kwargs = {"adapter": options["adapter"]} if options.get("adapter") else {}
+
+  forwarder = _Forwarder(conn)
+  pipeline = IngestPipeline(ble_node.parse_notification_data)
+  pipeline.configure(**(options.get("ingest") or {}))
+  nodes = {}  # address -> HeadlessDeviceNode
+
+  def on_packet(node, data):
+    pipeline.submit(forwarder, node.address, data)
+
+  def make_node(address, name):
+    node = ble_node.HeadlessDeviceNode(address, name=name, client_kwargs=client_kwargs)
+    node.on_packet = on_packet
+    node.on_status_callback = lambda status: conn.send(("status", address, status))
+    return node
+
+  def get_stats():
+    s = {
+      "events_sent": forwarder.sent,
+      "ingest": pipeline.get_stats(),
+      "connections": ble_node.connect_scheduler.get_stats(),
+      "heartbeat": ble_node.heartbeat_monitor.get_stats()
+    }
+    if options.get("simulator", {}).get("enabled"):
+      from utils.ble_simulator import get_fleet
+      s["simulator"] = dict(get_fleet().stats)
+    return s
+
+  async def push_stats():
+    while True:
+      await asyncio.sleep(STATS_INTERVAL)
+      conn.send(("stats", get_stats()))
+
+  loop = asyncio.get_running_loop()
+  inbox = asyncio.Queue()
+  threading.Thread(target=_read_commands, args=(conn, loop, inbox), daemon=True).start()
+  stats_task = asyncio.create_task(push_stats())
+  conn.send(("hello", os.getpid()))
+
+  try:
+    while True:
+      msg = await inbox.get()
+      if msg is None or msg[0] == "stop": break
+      cmd = msg[0]
+      if cmd == "connect":
+        _, address, name = msg
+        node = nodes.get(address)
+        if node is None:
+          node = nodes[address] = make_node(address, name)
+        asyncio.create_task(node.connect())
+      elif cmd == "disconnect":
+        node = nodes.pop(msg[1], None)
+        if node: asyncio.create_task(node.disconnect())
+      elif cmd == "reset":
+        node = nodes.get(msg[1])
+        if node: asyncio.create_task(node.send_reset())
+  finally:
+    stats_task.cancel()
+    await asyncio.gather(*(n.disconnect() for n in nodes.values()), return_exceptions=True)
+    try:
+      conn.send(("stats", get_stats()))
+    except (OSError, ValueError):
+      pass
+
+
+def worker_main(conn, worker_id, options):
+  """工作进程入口 (spawn)"""
+  try:
+    asyncio.run(_worker(conn, worker_id, options))
+  except KeyboardInterrupt:
+    pass
+  finally:
+    conn.close()
+
+
+# ==========================================================
+# 主进程
+# ==========================================================
+class RemoteDeviceNode:
+  """主进程中代表一台由工作进程负责的设备 (接口与 HeadlessDeviceNode 一致)"""
+
+  def __init__(self, pool, ble_device, on_status_callback=None):
+    self.pool = pool
+    self.ble_device = ble_device
+    self.address = getattr(ble_device, "address", ble_device)
+    self.name = getattr(ble_device, "name", None) or self.address
+    self.on_status_callback = on_status_callback
+    self.sink = None
+    self.role = None
+
+  async def connect(self):
+    self.pool.connect(self)
+    return True
+
+  async def disconnect(self):
+    self.pool.disconnect(self)
+    self._emit_status("disconnected")
+
+  async def send_reset(self):
+    self.pool.send_to(self.address, ("reset", self.address))
+
+  def _emit_status(self, status):
+    if self.on_status_callback:
+      self.on_status_callback(status)
+
+
+class _WorkerHandle:
+  def __init__(self, worker_id, adapter):
+    self.worker_id = worker_id
+    self.adapter = adapter
+    self.process = None
+    self.conn = None
+    self.generation = 0
+    self.pid = None
+    self.alive = False
+    self.started_at = 0.0
+    self.restarts = 0
+    self.crashes_in_row = 0
+    self.addresses = set()  # 分配给该进程的设备
+    self.stats = {}
+
+  def send(self, msg):
+    if not self.alive: return False
+    try:
+      self.conn.send(msg)
+      return True
+    except (OSError, ValueError):
+      # 进程刚退出：由读线程触发重启
+      return False
+
+
+class BleWorkerPool:
+  def __init__(self, count=0, adapters=None, options=None, on_event=None):
+    self.adapters = list(adapters or [])
+    # 指定了适配器时每个适配器一个进程，否则 count 个进程共用默认适配器
+    self.count = len(self.adapters) if self.adapters else max(0, int(count))
+    self.options = dict(options or {})
+    self.on_event = on_event  # (node, fields)
+    self._workers = []
+    self._assigned = {}  # address -> _WorkerHandle (固定分配)
+    self._nodes = {}     # address -> RemoteDeviceNode (当前使用中的设备)
+    self._loop = None
+    self._stopping = False
+
+  @property
+  def enabled(self):
+    return self.count > 0
+
+  # --- 进程管理 ---
+  def _ensure_started(self):
+    if self._workers: return
+    self._loop = asyncio.get_running_loop()
+    self._stopping = False
+    for i in range(self.count):
+      handle = _WorkerHandle(i, self.adapters[i] if self.adapters else None)
+      self._workers.append(handle)
+      self._spawn(handle)
+
+  def _spawn(self, handle):
+    ctx = multiprocessing.get_context("spawn")
+    parent_conn, child_conn = ctx.Pipe()
+    options = dict(self.options, adapter=handle.adapter)
+    handle.process = ctx.Process(target=worker_main, args=(child_conn, handle.worker_id, options),
+                                 name=f"ble-worker-{handle.worker_id}", daemon=True)
+    handle.process.start()
+    child_conn.close()
+    handle.conn = parent_conn
+    handle.generation += 1
+    handle.alive = True
+    handle.started_at = time.monotonic()
+    threading.Thread(target=self._read_loop, args=(handle, handle.process, parent_conn, handle.generation),
+                     name=f"ble-worker-{handle.worker_id}-reader", daemon=True).start()
+    print(f"[Workers] Started BLE worker {handle.worker_id} (pid {handle.process.pid}"
+          f"{', adapter ' + handle.adapter if handle.adapter else ''})")
+
+  def _read_loop(self, handle, process, conn, generation):
+    try:
+      while True:
+        msg = conn.recv()
+        self._loop.call_soon_threadsafe(self._on_message, handle, msg)
+    except (EOFError, OSError):
+      pass
+    except Exception as e:
+      print(f"[Workers] Worker {handle.worker_id} sent bad message: {e!r}")
+    # 管道关闭后等待进程真正退出 (在读线程中等待，不阻塞事件循环)
+    process.join(timeout=2)
+    try:
+      self._loop.call_soon_threadsafe(self._on_exit, handle, generation)
+    except RuntimeError:
+      pass  # 事件循环已关闭
+
+  def _on_message(self, handle, msg):
+    kind = msg[0]
+    if kind == "events":
+      nodes = self._nodes
+      for address, fields in msg[1]:
+        node = nodes.get(address)
+        if node is not None and self.on_event:
+          self.on_event(node, fields)
+    elif kind == "status":
+      node = self._nodes.get(msg[1])
+      if node is not None: node._emit_status(msg[2])
+    elif kind == "stats":
+      handle.stats = msg[1]
+    elif kind == "hello":
+      handle.pid = msg[1]
+
+  def _on_exit(self, handle, generation):
+    if generation != handle.generation or not handle.alive: return
+    handle.alive = False
+    if self._stopping: return
+
+    code = handle.process.exitcode if handle.process is not None else None
+    if time.monotonic() - handle.started_at > STABLE_AFTER: handle.crashes_in_row = 0
+    delay = min(RESTART_MAX, RESTART_BASE * (2 ** handle.crashes_in_row))
+    handle.crashes_in_row += 1
+    print(f"[Workers] BLE worker {handle.worker_id} exited (code {code}), restarting in {delay:.1f}s")
+    for address in handle.addresses:
+      node = self._nodes.get(address)
+      if node is not None: node._emit_status("error")
+    self._loop.call_later(delay, self._restart, handle)
+
+  def _restart(self, handle):
+    if self._stopping or handle.alive: return
+    handle.restarts += 1
+    self._spawn(handle)
+    # 重新连接仍在使用中的设备
+    for address in handle.addresses:
+      node = self._nodes.get(address)
+      if node is not None: handle.send(("connect", address, node.name))
+
+  # --- 设备分配 ---
+  def _worker_for(self, address):
+    handle = self._assigned.get(address)
+    if handle is None:
+      handle = min(self._workers, key=lambda w: (len(w.addresses), w.worker_id))
+      self._assigned[address] = handle
+    handle.addresses.add(address)
+    return handle
+
+  def connect(self, node):
+    self._ensure_started()
+    self._nodes[node.address] = node
+    self._worker_for(node.address).send(("connect", node.address, node.name))
+
+  def disconnect(self, node):
+    if self._nodes.get(node.address) is node:
+      del self._nodes[node.address]
+    handle = self._assigned.get(node.address)
+    if handle is not None:
+      handle.addresses.discard(node.address)
+      handle.send(("disconnect", node.address))
+
+  def send_to(self, address, msg):
+    handle = self._assigned.get(address)
+    if handle is not None: handle.send(msg)
+
+  def kill_worker(self, worker_id):
+    """强制结束一个工作进程 (用于测试崩溃重启)"""
+    handle = self._workers[worker_id]
+    if handle.process is not None and handle.process.is_alive():
+      handle.process.kill()
+
+  def stop(self):
+    self._stopping = True
+    for handle in self._workers:
+      handle.send(("stop",))
+    for handle in self._workers:
+      if handle.process is None: continue
+      handle.process.join(timeout=3)
+      if handle.process.is_alive():
+        handle.process.terminate()
+        handle.process.join(timeout=1)
+      handle.alive = False
+    self._workers = []
+    self._assigned.clear()
+    self._nodes.clear()
+
+  def get_stats(self):
+    return {
+      "count": self.count,
+      "workers": [
+        {
+          "worker_id": w.worker_id,
+          "adapter": w.adapter,
+          "pid": w.pid,
+          "alive": w.alive,
+          "restarts": w.restarts,
+          "devices": sorted(w.addresses),
+          "stats": w.stats
+        }
+        for w in self._workers
+      ]
+    }
@@ -0,0 +1,70 @@
+# utils/broadcast.py
+"""
+分数广播合帧调度器
+
+每次通知只把对应裁判标记为 "脏"，调度器按固定帧率 (例如 60 Hz) 把所有脏裁判的最新状态
+合并成一帧 score_batch 发出。空闲后的第一次更新立即发送，连击期间的更新被合并，
+但一次连击的最终数值总会在下一帧发出，不会丢失。
+标记时可带上数据包的接收时间 (perf_counter_ns)，帧发送完成后记录 通知 -> 广播 延迟。
+"""
+import asyncio
+import time
+
+from utils.metrics import metrics
+
+SCORE_LATENCY = metrics.histogram("ft_notify_to_broadcast_seconds",
+                                  "Time from BLE notification receipt to the score frame being queued to clients")
+
+
+class BroadcastScheduler:
+  def __init__(self, send_func, rate_hz=60):
+    self.send = send_func  # async send_func(message: dict)
+    self.interval = 1.0 / max(float(rate_hz), 1.0)
+    self._dirty = {}  # key -> payload 提供函数 (发送时才取最新值)
+    self._since = []  # 本帧内各次标记对应的数据包接收时间 (ns)
+    self._handle = None
+    self._last_flush = 0.0
+    self.stats = {"marks": 0, "frames": 0, "payloads": 0}
+
+  def set_rate(self, rate_hz):
+    self.interval = 1.0 / max(float(rate_hz), 1.0)
+
+  def mark_dirty(self, key, payload_func, since_ns=None):
+    """标记某个裁判需要在下一帧发送 (同一帧内多次标记只发送一次)"""
+    self.stats["marks"] += 1
+    self._dirty[key] = payload_func
+    if since_ns is not None: self._since.append(since_ns)
+    if self._handle is not None: return
+
+    loop = asyncio.get_running_loop()
+    delay = self._last_flush + self.interval - time.monotonic()
+    if delay <= 0:
+      self._handle = loop.call_soon(self._flush)
+    else:
+      self._handle = loop.call_later(delay, self._flush)
+
+  def _flush(self):
+    self._handle = None
+    if not self._dirty: return
+    dirty, self._dirty = self._dirty, {}
+    since, self._since = self._since, []
+    self._last_flush = time.monotonic()
+
+    payloads = [fn() for fn in dirty.values()]
+    self.stats["frames"] += 1
+    self.stats["payloads"] += len(payloads)
+    asyncio.create_task(self._send_frame({"type": "score_batch", "payload": payloads}, since))
+
+  async def _send_frame(self, message, since):
+    await self.send(message)
+    if since:
+      now = time.perf_counter_ns()
+      for ns in since:
+        SCORE_LATENCY.observe((now - ns) / 1e9)
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["rate_hz"] = round(1.0 / self.interval, 2)
+    s["pending"] = len(self._dirty)
+    s["coalesced"] = s["marks"] - s["payloads"] - len(self._dirty)
+    return s
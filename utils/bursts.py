@@ -0,0 +1,159 @@
+# utils/bursts.py
+"""
+连击 (burst) 检测状态机
+
+同一裁判相邻两次加减分变化 (BURST_FIELDS) 间隔小于 threshold (300ms) 时合并为一次连击，累计本次连击内各字段的增量。
+重点扣分 (CARRY_FIELDS) 不参与连击划分 (与旧版导出一致)，只累计到仍在进行的连击中供悬浮窗显示。
+实时推送 (LiveBursts：burst_start / burst_update / burst_end) 与导出的 REALTIME 字幕 (utils/subtitles.py)
+共用 BurstDetector，时间统一为毫秒时间戳 (与 CSV SystemTime 精度相同)；
+实时检测只输入实际写入日志的记录，因此与导出时读到的事件序列相同，两者的连击划分一致。
+"""
+import asyncio
+from datetime import datetime
+
+from utils.event_cache import to_ms
+
+BURST_THRESHOLD_MS = 300
+# 连击结束后 (最后一次变化之后) 的显示时间
+DISPLAY_DURATION_MS = 1000
+BURST_FIELDS = ("plus", "minus")
+CARRY_FIELDS = ("penalty",)
+
+
+class BurstDetector:
+  """单个裁判的连击状态机 (单调输入，每次 O(1))"""
+
+  def __init__(self, threshold_ms=BURST_THRESHOLD_MS, fields=BURST_FIELDS, carry=CARRY_FIELDS):
+    self.threshold_ms = threshold_ms
+    self.fields = tuple(fields)
+    self.carry = tuple(carry)  # 只累计、不参与划分的字段
+    self.prev = None
+    self.prev_carry = None
+    self.burst = None  # {"start", "last", 各字段在本次连击内的累计增量}
+
+  def feed(self, t_ms, score):
+    """
+    输入一次分数 (含 fields / carry 中各字段的 dict)，返回 [(事件, burst), ...]
+    事件为 burst_start / burst_update / burst_end；burst 为内部状态，调用方需要保存时应复制
+    """
+    values = tuple(score.get(f) or 0 for f in self.fields)
+    carried = tuple(score.get(f) or 0 for f in self.carry)
+    if self.prev is None:
+      # 默认从 0 开始，第一下点击 (+1) 会被正确记录；
+      # 第一条数据的绝对值大于 1 (例如 +8) 说明是中途接入或重连的数据，以它为基准，避免产生巨大的 "+8"
+      self.prev = values if any(abs(v) > 1 for v in values) else (0,) * len(values)
+      self.prev_carry = tuple(v if abs(v) > 1 else 0 for v in carried)
+
+    deltas = [v - p for v, p in zip(values, self.prev)]
+    carry_deltas = [v - p for v, p in zip(carried, self.prev_carry)]
+    self.prev = values
+    self.prev_carry = carried
+
+    burst = self.burst
+    in_burst = burst is not None and t_ms - burst["last"] < self.threshold_ms
+    if not any(deltas):
+      # 只有 carry 字段变化：计入仍在进行的连击，不延长、不开启连击
+      if not (in_burst and any(carry_deltas)): return []
+      for f, d in zip(self.carry, carry_deltas):
+        burst[f] += d
+      return [("burst_update", burst)]
+
+    if in_burst:
+      # 属于当前连击：累加
+      burst["last"] = t_ms
+      for f, d in zip(self.fields + self.carry, deltas + carry_deltas):
+        burst[f] += d
+      return [("burst_update", burst)]
+
+    # 结算上一个连击，开启新连击
+    out = [("burst_end", burst)] if burst is not None else []
+    self.burst = {"start": t_ms, "last": t_ms}
+    self.burst.update(zip(self.fields + self.carry, deltas + carry_deltas))
+    out.append(("burst_start", self.burst))
+    return out
+
+  def expire(self, now_ms):
+    """超过阈值没有新的变化时结束当前连击，返回结束的 burst (否则 None)"""
+    burst = self.burst
+    if burst is None or now_ms - burst["last"] < self.threshold_ms: return None
+    self.burst = None
+    return burst
+
+  def close(self):
+    """输入结束：返回未结束的 burst (或 None)"""
+    burst, self.burst = self.burst, None
+    return burst
+
+  def reset(self):
+    """切换选手：下一条数据重新按基准规则开始"""
+    self.prev = None
+    self.prev_carry = None
+    self.burst = None
+
+
+class LiveBursts:
+  """
+  实时连击：每个裁判一个 BurstDetector，变化时调用 send(message) 推送
+  连击在最后一次变化 threshold 毫秒后由事件循环定时结束 (burst_end 附带 until = 显示截止时间)
+  """
+
+  def __init__(self, send, threshold_ms=BURST_THRESHOLD_MS, display_ms=DISPLAY_DURATION_MS):
+    self.send = send
+    self.threshold_ms = threshold_ms
+    self.display_ms = display_ms
+    self._detectors = {}  # index -> BurstDetector
+    self._timers = {}     # index -> TimerHandle
+    self.stats = {"bursts": 0, "updates": 0}
+
+  def feed(self, index, t_ms, score):
+    d = self._detectors.get(index)
+    if d is None:
+      d = self._detectors[index] = BurstDetector(self.threshold_ms)
+    for kind, burst in d.feed(t_ms, score):
+      self._emit(kind, index, burst)
+    if d.burst is not None: self._arm(index, self.threshold_ms / 1000)
+
+  def reset(self, index=None):
+    """结束并清空指定裁判 (默认全部) 的连击状态 (切换选手 / 重新配置时调用)"""
+    for i in ([index] if index is not None else list(self._detectors)):
+      d = self._detectors.get(i)
+      if d is None: continue
+      burst = d.close()
+      if burst is not None: self._emit("burst_end", i, burst)
+      d.reset()
+      timer = self._timers.pop(i, None)
+      if timer: timer.cancel()
+
+  def _arm(self, index, delay):
+    timer = self._timers.get(index)
+    if timer: timer.cancel()
+    self._timers[index] = asyncio.get_running_loop().call_later(delay, self._expire, index)
+
+  def _expire(self, index):
+    self._timers.pop(index, None)
+    d = self._detectors.get(index)
+    if d is None or d.burst is None: return
+    now_ms = to_ms(datetime.now())
+    burst = d.expire(now_ms)
+    if burst is not None:
+      self._emit("burst_end", index, burst)
+    else:
+      # 定时器比墙上时钟早到：按剩余时间重新计时
+      self._arm(index, max(0.01, (d.burst["last"] + self.threshold_ms - now_ms) / 1000))
+
+  def _emit(self, kind, index, burst):
+    payload = dict(burst, index=index)
+    if kind == "burst_start":
+      self.stats["bursts"] += 1
+    elif kind == "burst_update":
+      self.stats["updates"] += 1
+    else:
+      payload["until"] = burst["last"] + self.display_ms
+    self.send({"type": kind, "payload": payload})
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["open"] = sum(1 for d in self._detectors.values() if d.burst is not None)
+    s["threshold_ms"] = self.threshold_ms
+    s["display_ms"] = self.display_ms
+    return s
@@ -0,0 +1,154 @@
+# utils/connect_scheduler.py
+"""
+BLE 连接调度
+
+/setup 与断线重连都通过这里排队：
+  - 同时进行的连接数有上限 (多数蓝牙适配器同时建立连接的能力很有限)
+  - 相邻两次连接开始之间至少间隔 stagger 秒，避免同一时刻挤占射频
+  - 重连使用带抖动的指数退避：现场射频抖动导致多台设备同时掉线时，重连时间会被打散
+并记录每台设备从发起到连接成功 (开启通知) 的耗时。
+"""
+import asyncio
+import random
+import time
+
+
+class _DeviceStats:
+  __slots__ = ("name", "attempts", "failures", "connects", "requested_at", "last_ttc_ms", "total_ttc_ms",
+               "max_ttc_ms", "last_queue_ms", "last_ready_ms", "last_error", "connected_at", "reconnects")
+
+  def __init__(self, name):
+    self.name = name
+    self.attempts = 0
+    self.failures = 0
+    self.connects = 0
+    self.requested_at = None  # 本轮 (首次连接或一次掉线后) 开始时间
+    self.last_ttc_ms = None
+    self.total_ttc_ms = 0.0
+    self.max_ttc_ms = 0.0
+    self.last_queue_ms = None
+    self.last_ready_ms = None
+    self.last_error = None
+    self.connected_at = None
+    self.reconnects = 0  # 掉线后发起重连的次数
+
+  def to_dict(self):
+    return {
+      "name": self.name,
+      "attempts": self.attempts,
+      "failures": self.failures,
+      "connects": self.connects,
+      "reconnects": self.reconnects,
+      "last_ttc_ms": self.last_ttc_ms,
+      "avg_ttc_ms": round(self.total_ttc_ms / self.connects, 1) if self.connects else None,
+      "max_ttc_ms": round(self.max_ttc_ms, 1),
+      "last_queue_ms": self.last_queue_ms,
+      "last_ready_ms": self.last_ready_ms,
+      "last_error": self.last_error,
+      "connected": self.connected_at is not None
+    }
+
+
+class ConnectionScheduler:
+  def __init__(self, max_concurrent=3, stagger=0.25, backoff_base=1.0, backoff_max=30.0, jitter=0.5,
+               ready_timeout=5.0):
+    self.max_concurrent = max_concurrent
+    self.stagger = stagger
+    self.backoff_base = backoff_base
+    self.backoff_max = backoff_max
+    self.jitter = jitter
+    self.ready_timeout = ready_timeout  # 等待特征值出现的最长时间
+    self._sem = None
+    self._next_start = 0.0
+    self._devices = {}  # address -> _DeviceStats
+
+  def configure(self, max_concurrent=None, stagger=None, backoff_base=None, backoff_max=None, jitter=None,
+                ready_timeout=None):
+    if max_concurrent is not None:
+      self.max_concurrent = max(1, int(max_concurrent))
+      self._sem = None
+    if stagger is not None: self.stagger = float(stagger)
+    if backoff_base is not None: self.backoff_base = float(backoff_base)
+    if backoff_max is not None: self.backoff_max = float(backoff_max)
+    if jitter is not None: self.jitter = min(1.0, max(0.0, float(jitter)))
+    if ready_timeout is not None: self.ready_timeout = float(ready_timeout)
+
+  def backoff_delay(self, attempt):
+    """第 attempt 次重试 (从 0 开始) 前的等待时间：指数增长，上限 backoff_max，再乘以 [1 - jitter, 1] 的随机系数"""
+    delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+    return delay * (1.0 - self.jitter * random.random())
+
+  def _stats(self, address, name):
+    st = self._devices.get(address)
+    if st is None:
+      st = _DeviceStats(name)
+      self._devices[address] = st
+    return st
+
+  def mark_requested(self, address, name, reconnect=False):
+    """开始一轮连接 (首次连接或掉线后)，time-to-connected 从这里开始计时"""
+    st = self._stats(address, name)
+    if reconnect: st.reconnects += 1
+    st.connected_at = None
+    if st.requested_at is None:
+      st.requested_at = time.monotonic()
+
+  async def run(self, address, name, connect_func):
+    """排队执行一次连接尝试；connect_func() 返回是否成功"""
+    if self._sem is None:
+      self._sem = asyncio.Semaphore(self.max_concurrent)
+    st = self._stats(address, name)
+    if st.requested_at is None: st.requested_at = time.monotonic()
+
+    queued_at = time.monotonic()
+    async with self._sem:
+      # 相邻连接之间错开 stagger 秒
+      now = time.monotonic()
+      start = max(now, self._next_start)
+      self._next_start = start + self.stagger
+      if start > now: await asyncio.sleep(start - now)
+
+      st.last_queue_ms = round((time.monotonic() - queued_at) * 1000, 1)
+      st.attempts += 1
+      ok = False
+      try:
+        ok = await connect_func()
+      except Exception as e:
+        st.last_error = str(e)
+      if ok:
+        ttc = (time.monotonic() - st.requested_at) * 1000
+        st.connects += 1
+        st.last_ttc_ms = round(ttc, 1)
+        st.total_ttc_ms += ttc
+        st.max_ttc_ms = max(st.max_ttc_ms, ttc)
+        st.requested_at = None
+        st.connected_at = time.monotonic()
+      else:
+        st.failures += 1
+      return ok
+
+  def record_error(self, address, error):
+    st = self._devices.get(address)
+    if st: st.last_error = str(error)
+
+  def record_ready(self, address, ms):
+    st = self._devices.get(address)
+    if st: st.last_ready_ms = round(ms, 1)
+
+  def forget(self, address):
+    """用户主动断开：停止计时"""
+    st = self._devices.get(address)
+    if st:
+      st.requested_at = None
+      st.connected_at = None
+
+  def get_stats(self):
+    devices = {addr: st.to_dict() for addr, st in self._devices.items()}
+    ttcs = [st.last_ttc_ms for st in self._devices.values() if st.last_ttc_ms is not None]
+    return {
+      "max_concurrent": self.max_concurrent,
+      "stagger": self.stagger,
+      "in_flight": (self.max_concurrent - self._sem._value) if self._sem else 0,
+      "devices": devices,
+      "slowest_ttc_ms": max(ttcs) if ttcs else None
+    }
@@ -0,0 +1,168 @@
+# utils/device_registry.py
+"""
+目标设备索引 (扫描结果)
+
+扫描回调中直接维护 "地址 -> 设备" 索引，只收录目标计数器：
+  - 非目标设备按 (名称, UUID 列表) 记住判定结果，广播内容不变时不再重复匹配
+  - 过期淘汰由最小堆 + 定时器驱动 (每个设备在堆中只有一项，到期时若期间又收到广播则顺延)，
+    不需要在每次查询时遍历全部设备
+  - 设备出现 / 消失 / 信号强度变化超过阈值 / 备注变化时通过 on_change 推送增量
+"""
+import asyncio
+import heapq
+import time
+
+# 非目标设备判定缓存上限 (比赛现场附近可能有大量手机、耳机等蓝牙设备)
+MAX_IGNORED = 1024
+
+
+class _Entry:
+  __slots__ = ("device", "name", "rssi", "pushed_rssi", "seen")
+
+  def __init__(self, device, name, rssi, seen):
+    self.device = device
+    self.name = name
+    self.rssi = rssi
+    self.pushed_rssi = rssi
+    self.seen = seen
+
+
+class DeviceRegistry:
+  def __init__(self, is_target, ttl=8.0, rssi_delta=4, on_change=None):
+    self.is_target = is_target    # (name, advertisement_data) -> bool
+    self.ttl = ttl
+    self.rssi_delta = rssi_delta  # RSSI 变化达到该值 (dBm) 才推送
+    self.on_change = on_change    # (event_type, payload)
+    self.active = False           # 只在扫描期间做过期淘汰
+    self._devices = {}            # address -> _Entry
+    self._heap = []               # (到期时间, address)
+    self._ignored = {}            # address -> 判定为非目标时的 (名称, UUID 列表)
+    self._remarks = {}
+    self._timer = None
+    self.stats = {"adverts": 0, "ignored": 0, "added": 0, "updated": 0, "removed": 0}
+
+  def configure(self, ttl=None, rssi_delta=None):
+    if ttl is not None: self.ttl = float(ttl)
+    if rssi_delta is not None: self.rssi_delta = int(rssi_delta)
+
+  # --- 扫描回调 ---
+  def on_advertisement(self, device, adv):
+    self.stats["adverts"] += 1
+    now = time.monotonic()
+    entry = self._devices.get(device.address)
+    name = adv.local_name or device.name or "Unknown"
+
+    if entry is None:
+      sig = (name, tuple(adv.service_uuids or ()))
+      if self._ignored.get(device.address) == sig:
+        self.stats["ignored"] += 1
+        return
+      if not self.is_target(name, adv):
+        if len(self._ignored) >= MAX_IGNORED: self._ignored.clear()
+        self._ignored[device.address] = sig
+        return
+      self._ignored.pop(device.address, None)
+      entry = _Entry(device, name, adv.rssi, now)
+      self._devices[device.address] = entry
+      heapq.heappush(self._heap, (now + self.ttl, device.address))
+      self.stats["added"] += 1
+      self._emit("device_added", self._describe(device.address, entry))
+      self._arm()
+      return
+
+    entry.device = device
+    entry.seen = now
+    entry.rssi = adv.rssi
+    changed = False
+    # 扫描响应中可能才带上完整名称
+    if name != entry.name and name != "Unknown":
+      entry.name = name
+      changed = True
+    if abs(adv.rssi - entry.pushed_rssi) >= self.rssi_delta:
+      changed = True
+    if changed:
+      entry.pushed_rssi = adv.rssi
+      self.stats["updated"] += 1
+      self._emit("device_updated", self._describe(device.address, entry))
+
+  # --- 过期淘汰 ---
+  def start(self):
+    self.active = True
+    self._expire()
+
+  def stop(self):
+    self.active = False
+    if self._timer:
+      self._timer.cancel()
+      self._timer = None
+
+  def _arm(self):
+    if not self.active or not self._heap or self._timer is not None: return
+    delay = max(0.0, self._heap[0][0] - time.monotonic())
+    self._timer = asyncio.get_running_loop().call_later(delay, self._expire)
+
+  def _expire(self):
+    self._timer = None
+    now = time.monotonic()
+    heap = self._heap
+    while heap and heap[0][0] <= now:
+      _, address = heapq.heappop(heap)
+      entry = self._devices.get(address)
+      if entry is None: continue
+      expires = entry.seen + self.ttl
+      if expires > now:
+        # 期间又收到过广播：顺延
+        heapq.heappush(heap, (expires, address))
+        continue
+      del self._devices[address]
+      self.stats["removed"] += 1
+      self._emit("device_removed", {"address": address})
+    self._arm()
+
+  def clear(self):
+    """清空索引 (重新扫描)，通知订阅者"""
+    for address in list(self._devices):
+      self._emit("device_removed", {"address": address})
+    self._devices.clear()
+    self._heap.clear()
+    self._ignored.clear()
+
+  # --- 备注 ---
+  def set_remarks(self, remarks):
+    old, self._remarks = self._remarks, dict(remarks or {})
+    for address, entry in self._devices.items():
+      if old.get(address, "") != self._remarks.get(address, ""):
+        self._emit("device_updated", self._describe(address, entry))
+
+  # --- 查询 ---
+  def _describe(self, address, entry):
+    return {
+      "name": entry.name,
+      "address": address,
+      "rssi": entry.rssi,
+      "remark": self._remarks.get(address, "")
+    }
+
+  def snapshot(self):
+    """按信号强度排序的目标设备列表"""
+    results = [self._describe(a, e) for a, e in self._devices.items()]
+    results.sort(key=lambda x: x['rssi'], reverse=True)
+    return results
+
+  def get_device(self, address):
+    entry = self._devices.get(address)
+    return entry.device if entry else None
+
+  def _emit(self, event, payload):
+    if self.on_change:
+      try:
+        self.on_change(event, payload)
+      except Exception as e:
+        print(f"[Registry] on_change error: {e}")
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["devices"] = len(self._devices)
+    s["heap"] = len(self._heap)
+    s["ignored_cache"] = len(self._ignored)
+    return s
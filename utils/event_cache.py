@@ -0,0 +1,206 @@
+# utils/event_cache.py
+"""
+已解析事件缓存 (按 CSV 文件版本)
+
+导出与报表反复读取同一批 CSV，每次都要对每一行做 strptime。
+这里按文件路径缓存解析后的事件列表：
+  - size/mtime(ns) 未变化直接命中
+  - 文件只是变长 (比赛进行中追加)：从上次解析结束的偏移量继续解析新增的行
+  - 文件被改写/截断 (大小未增长，或上次结束位置之前的字节不一致)：整体重新解析
+  - LRU 淘汰，按估算内存占用设上限
+缓存中的事件列表与 dict 在多个导出之间共享，使用方不得修改。
+"""
+import os
+import csv
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+# 单个事件 (dict + datetime + 4 个 int + 列表槽位) 的估算内存占用
+EVENT_BYTES = 352
+# 增量解析前校验的、上次结束位置之前的字节数
+TAIL_CHECK_BYTES = 64
+
+
+def parse_time(time_str):
+  try: return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S.%f")
+  except: return datetime.now()
+
+
+def to_ms(dt):
+  """本地时间 datetime -> 毫秒时间戳 (与 CSV SystemTime 的毫秒精度一致)"""
+  return int(dt.timestamp()) * 1000 + dt.microsecond // 1000
+
+
+class ParsedCsv:
+  """单个 CSV 的解析结果 (可在进程间传递)"""
+  __slots__ = ("size", "mtime_ns", "offset", "tail", "header", "events", "last_row")
+
+  def __init__(self, size, mtime_ns, offset, tail, header, events, last_row):
+    self.size = size
+    self.mtime_ns = mtime_ns
+    self.offset = offset        # 已解析到的字节位置 (总是停在完整行之后)
+    self.tail = tail            # offset 之前的若干字节，用于识别文件是否被改写
+    self.header = header
+    self.events = events        # 按时间排序的 [{dt, plus, minus, total, penalty}]
+    self.last_row = last_row    # 文件中最后一条数据行 (dict)，供报表使用
+
+  @property
+  def nbytes(self):
+    return len(self.events) * EVENT_BYTES + 512
+
+
+def _col(row, i):
+  # 与 csv.DictReader 一致：缺失的列为 None
+  return row[i] if i is not None and i < len(row) else None
+
+
+def _parse_rows(lines, header, events):
+  """解析数据行追加到 events，返回最后一条数据行 (dict) 或 None"""
+  idx = {name: i for i, name in enumerate(header)}
+  i_time = idx.get("SystemTime")
+  i_plus, i_minus, i_total = idx.get("TotalPlus"), idx.get("TotalMinus"), idx.get("CurrentTotal")
+  i_penalty = idx.get("MajorPenalty")  # 旧文件没有该列
+  last = None
+  for row in csv.reader(lines):
+    if not row: continue
+    last = row
+    if i_time is None: continue
+    try:
+      dt = parse_time(_col(row, i_time))
+      events.append({
+        "dt": dt,
+        "plus": int(_col(row, i_plus) or 0),
+        "minus": int(_col(row, i_minus) or 0),
+        "total": int(_col(row, i_total) or 0),
+        "penalty": int(_col(row, i_penalty) or 0)
+      })
+    except: pass
+  return dict(zip(header, last)) if last is not None else None
+
+
+def parse_csv(path, prev=None):
+  """
+  解析 CSV 为 ParsedCsv
+  prev 不为空时尝试从 prev.offset 增量解析；文件被改写则退回全量解析
+  """
+  st = os.stat(path)
+  with open(path, 'rb') as f:
+    # 只追加的文件大小必然增长；大小不变但 mtime 变化说明被改写
+    if prev is not None and prev.header is not None and st.st_size > prev.size and st.st_size >= prev.offset:
+      f.seek(prev.offset - len(prev.tail))
+      if f.read(len(prev.tail)) != prev.tail:
+        prev = None
+    else:
+      prev = None
+    start = prev.offset if prev is not None else 0
+    f.seek(start)
+    data = f.read()
+
+  # 只解析到最后一个完整行 (写入线程可能正在追加)
+  end = data.rfind(b"\n") + 1
+  data = data[:end]
+
+  if prev is None:
+    header_end = data.find(b"\n") + 1
+    if not header_end:
+      return ParsedCsv(st.st_size, st.st_mtime_ns, 0, b"", None, [], None)
+    header = next(csv.reader([data[:header_end].decode('utf-8-sig')]), [])
+    events = []
+    last_row = _parse_rows(data[header_end:].decode('utf-8', errors='replace').splitlines(), header, events)
+    events.sort(key=lambda x: x['dt'])
+    tail = data[-TAIL_CHECK_BYTES:]
+  else:
+    header, events, last_row = prev.header, prev.events, prev.last_row
+    if data:
+      # 不修改旧列表：其它线程可能正在用它导出
+      events = list(events)
+      n_before = len(events)
+      row = _parse_rows(data.decode('utf-8', errors='replace').splitlines(), header, events)
+      if row is not None: last_row = row
+      # 追加的行通常已按时间有序，timsort 在这种情况下是线性的
+      if len(events) != n_before: events.sort(key=lambda x: x['dt'])
+    tail = (prev.tail + data)[-TAIL_CHECK_BYTES:]
+
+  return ParsedCsv(st.st_size, st.st_mtime_ns, start + end, tail, header, events, last_row)
+
+
+class EventCache:
+  """按 CSV 路径缓存 ParsedCsv (线程安全，LRU + 内存上限)"""
+
+  def __init__(self, max_mb=64):
+    self.max_bytes = int(max_mb * 1024 * 1024)
+    self._entries = OrderedDict()  # path -> ParsedCsv
+    self._bytes = 0
+    self._lock = threading.Lock()
+    self.stats = {"hits": 0, "misses": 0, "refreshes": 0, "stores": 0, "evictions": 0}
+
+  def configure(self, max_mb=None):
+    if max_mb is not None:
+      with self._lock:
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self._evict()
+
+  def get(self, path, parse_missing=True):
+    """
+    返回最新的 ParsedCsv；文件变长时增量解析
+    parse_missing=False 时，缓存中完全没有该文件则返回 None (由调用方决定如何读取)
+    """
+    try:
+      st = os.stat(path)
+    except OSError:
+      self.invalidate(path)
+      return None
+
+    with self._lock:
+      entry = self._entries.get(path)
+      if entry is not None and entry.size == st.st_size and entry.mtime_ns == st.st_mtime_ns:
+        self._entries.move_to_end(path)
+        self.stats["hits"] += 1
+        return entry
+    if entry is None and not parse_missing:
+      return None
+
+    with self._lock:
+      self.stats["refreshes" if entry is not None else "misses"] += 1
+    parsed = parse_csv(path, entry)
+    self.store(path, parsed)
+    return parsed
+
+  def store(self, path, parsed):
+    """写入解析结果 (也用于接收导出工作进程解析好的数据)"""
+    with self._lock:
+      old = self._entries.pop(path, None)
+      if old is not None: self._bytes -= old.nbytes
+      self.stats["stores"] += 1
+      if parsed.nbytes > self.max_bytes: return
+      self._entries[path] = parsed
+      self._bytes += parsed.nbytes
+      self._evict()
+
+  def _evict(self):
+    while self._bytes > self.max_bytes and self._entries:
+      _, old = self._entries.popitem(last=False)
+      self._bytes -= old.nbytes
+      self.stats["evictions"] += 1
+
+  def invalidate(self, path):
+    with self._lock:
+      old = self._entries.pop(path, None)
+      if old is not None: self._bytes -= old.nbytes
+
+  def invalidate_prefix(self, prefix):
+    """删除某个目录 (例如整个项目) 下的所有缓存"""
+    prefix = os.path.join(prefix, "")
+    with self._lock:
+      for path in [p for p in self._entries if p.startswith(prefix)]:
+        self._bytes -= self._entries.pop(path).nbytes
+
+  def get_stats(self):
+    with self._lock:
+      s = dict(self.stats)
+      s["entries"] = len(self._entries)
+      s["events"] = sum(len(e.events) for e in self._entries.values())
+      s["mb"] = round(self._bytes / 1024 / 1024, 2)
+      s["max_mb"] = round(self.max_bytes / 1024 / 1024, 2)
+    return s
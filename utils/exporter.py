@@ -1,237 +1,277 @@
 # utils/exporter.py
 import os
-import csv
 import zipfile
 import io
-from datetime import datetime, timedelta
-
-
-def parse_time(time_str):
-    try: return datetime.strptime(time_str, "%Y-%m-%d %H:%M:%S.%f")
-    except: return datetime.now()
-
-
-def format_srt_time(td):
-    total_seconds = int(td.total_seconds())
-    hours = total_seconds // 3600
-    minutes = (total_seconds % 3600) // 60
-    seconds = total_seconds % 60
-    millis = int(td.microseconds / 1000)
-    return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
+import tempfile
+import threading
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from utils.event_cache import parse_csv
+from utils.subtitles import iter_export_text
+from utils.metrics import metrics, SLOW_BUCKETS
+
+
+# 流式导出时每累计这么多压缩后的字节就向客户端发送一次
+STREAM_CHUNK_SIZE = 64 * 1024
+# 写入 ZIP 条目时每次写入的字节数
+WRITE_BLOCK_BYTES = 256 * 1024
+# 生成 TXT/SRT 时每累计这么多字符编码写入一次临时文件
+SPOOL_BLOCK_CHARS = 64 * 1024
+# 单个导出文件在内存中缓冲的上限，超出后落到临时文件
+SPOOL_MAX_BYTES = 1024 * 1024
+
+EXPORT_SECONDS = metrics.histogram("ft_export_seconds", "Time to generate a complete details ZIP", SLOW_BUCKETS)
+
+
+def srt_modes_of(options):
+    """导出选项中的 SRT 模式列表：srt_modes (可多选) 或单个 srt_mode"""
+    modes = options.get('srt_modes') or [options.get('srt_mode', 'TOTAL')]
+    return list(dict.fromkeys(modes))
+
+
+class _SpoolWriter:
+    """把文本片段分块编码写入临时文件：to_disk 时写入命名临时文件 (可跨进程传递路径)，否则先缓冲在内存"""
+
+    def __init__(self, to_disk):
+        if to_disk:
+            fd, self.path = tempfile.mkstemp(prefix="ft_export_")
+            self.file = os.fdopen(fd, 'wb')
+        else:
+            self.path = None
+            self.file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+        self._parts = []
+        self._chars = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._chars += len(text)
+        if self._chars >= SPOOL_BLOCK_CHARS: self._flush()
+
+    def _flush(self):
+        if self._parts:
+            self.file.write("".join(self._parts).encode('utf-8'))
+            self._parts.clear()
+            self._chars = 0
+
+    def finish(self):
+        """返回临时文件路径 (to_disk) 或已写完的文件对象"""
+        self._flush()
+        if self.path is None: return self.file
+        self.file.close()
+        return self.path
+
+
+def _open_output(content):
+    if isinstance(content, str): return open(content, 'rb')
+    content.seek(0)
+    return content
+
+
+def _discard_outputs(outputs):
+    """释放 render_ref_files 生成的临时文件"""
+    for _, content in outputs:
+        try:
+            if isinstance(content, str): os.remove(content)
+            else: content.close()
+        except OSError:
+            pass
+
+
+def _discard_future(fut):
+    if not fut.cancelled() and fut.exception() is None:
+        _discard_outputs(fut.result()[0])
+
+
+def render_ref_files(group_name, player, ref_idx, source, options, to_disk=False):
+    """
+    单个 (选手, 裁判) 的导出任务；模块级函数，可直接提交到进程池
+    source 为已解析的事件列表，或 CSV 路径 (缓存中没有时由工作进程自行解析)
+    TXT 与所有 SRT 模式在同一次遍历中生成，逐块写入临时文件 (工作进程中 to_disk=True，返回文件路径)
+    返回 ([(压缩包内路径, 临时文件)], 新解析出的 ParsedCsv 或 None)
+    """
+    parsed = None
+    if isinstance(source, str):
+        parsed = parse_csv(source)
+        events = parsed.events
+    else:
+        events = source
+    if not events: return [], parsed
+
+    targets = []
+    # 导出 TXT
+    if options.get('txt'):
+        targets.append(('TXT', f"{group_name}/{player}/Ref{ref_idx}_Log.txt"))
+    # 导出 SRT (可同时导出多种模式)
+    if options.get('srt'):
+        for mode in srt_modes_of(options):
+            targets.append((mode, f"{group_name}/{player}/Ref{ref_idx}_{mode}.srt"))
+
+    writers = {kind: _SpoolWriter(to_disk) for kind, _ in targets}
+    try:
+        for kind, chunk in iter_export_text(events, list(writers)):
+            writers[kind].write(chunk)
+    except Exception:
+        _discard_outputs([(None, w.finish()) for w in writers.values()])
+        raise
+    return [(arcname, writers[kind].finish()) for kind, arcname in targets], parsed
+
+
+class _ZipStreamSink:
+    """ZipFile 的只写输出目标：收集压缩后的字节，由生成器分块取走 (不可 seek，zipfile 会使用数据描述符)"""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self.size += len(b)
+        return len(b)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
 
 
 class ExportManager:
-    def __init__(self, storage_mgr):
+    def __init__(self, storage_mgr, workers=0):
         self.storage = storage_mgr
+        # 导出进程数：0/1 表示在当前线程中串行生成
+        self.workers = workers
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def configure(self, workers=None):
+        if workers is not None and int(workers) != self.workers:
+            self.shutdown()
+            self.workers = int(workers)
+
+    def _pool_size(self):
+        # 不超过 CPU 核数：单核机器上进程池只会更慢
+        return min(self.workers, os.cpu_count() or 1)
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # 使用 spawn：避免在带有后台线程的服务进程中 fork (与 Windows 打包环境行为一致)
+                self._pool = ProcessPoolExecutor(max_workers=self._pool_size(),
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def has_data(self, group_name, players):
+        """导出前检查：所选选手中至少有一人有记录"""
+        # 确保后台写入线程中的数据已落盘
+        self.storage.flush()
+        files = self.storage.group_files(group_name)
+        return any(player in files for player in players)
+
+    def iter_zip(self, group_name, players, options):
+        """
+        流式生成 ZIP：每个 (选手, 裁判) 的 TXT/SRT 按顺序生成并压缩 (可由进程池并行生成)，
+        每累计 STREAM_CHUNK_SIZE 字节即产出一块，内存占用与组别大小无关
+        """
+        t0 = time.perf_counter()
+        self.storage.flush()
+        files = self.storage.group_files(group_name)
+        if not files: return
+
+        jobs = [(group_name, player, ref_idx, path, options)
+                for player in players if player in files
+                for ref_idx, path in files[player].items()]
+        sink = _ZipStreamSink()
+        with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for rendered in self._render_jobs(jobs):
+                try:
+                    for arcname, content in rendered:
+                        with zf.open(arcname, 'w') as dest, _open_output(content) as src:
+                            while True:
+                                block = src.read(WRITE_BLOCK_BYTES)
+                                if not block: break
+                                dest.write(block)
+                                if sink.size >= STREAM_CHUNK_SIZE:
+                                    yield sink.drain()
+                        if sink.size >= STREAM_CHUNK_SIZE:
+                            yield sink.drain()
+                finally:
+                    _discard_outputs(rendered)
+        # 剩余数据 + 中央目录
+        tail = sink.drain()
+        if tail: yield tail
+        # 只统计完整生成的导出 (客户端中途断开时生成器被关闭，不会执行到这里)
+        EXPORT_SECONDS.observe(time.perf_counter() - t0)
 
     def generate_zip(self, group_name, players, options):
+        """一次性生成完整 ZIP (BytesIO)，供脚本等非流式场景使用"""
+        if not self.has_data(group_name, players): return None
         mem_file = io.BytesIO()
-        group_dir = self.storage._get_group_dir(group_name)
-        if not os.path.exists(group_dir): return None
-
-        # 加载数据 (适配新文件名)
-        data_map = self._load_group_data(group_dir)
-
-        with zipfile.ZipFile(mem_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for player in players:
-                if player not in data_map: continue
-                player_refs = data_map[player]
-                for ref_idx, events in player_refs.items():
-                    # 导出 TXT
-                    if options.get('txt'):
-                        txt_content = self._generate_txt_content(events)
-                        zf.writestr(f"{group_name}/{player}/Ref{ref_idx}_Log.txt", txt_content)
-                    # 导出 SRT
-                    if options.get('srt'):
-                        srt_mode = options.get('srt_mode', 'TOTAL')
-                        srt_content = self._generate_srt_content(events, srt_mode)
-                        zf.writestr(f"{group_name}/{player}/Ref{ref_idx}_{srt_mode}.srt", srt_content)
+        for chunk in self.iter_zip(group_name, players, options):
+            mem_file.write(chunk)
         mem_file.seek(0)
         return mem_file
 
-    def _load_group_data(self, group_dir):
-        """读取该组所有 CSV 并按选手归类"""
-        data = {}
-
-        for f in os.listdir(group_dir):
-            if not f.endswith(".csv") or "_Ref" not in f: continue
-
-            # 解析文件名: Player_Ref1.csv
-            try:
-                base_name = f.replace(".csv", "")
-                player_part, ref_part = base_name.rsplit("_Ref", 1)
-                ref_idx = int(ref_part)
-                c_name = player_part
-            except:
-                continue
-
-            path = os.path.join(group_dir, f)
-            with open(path, 'r', encoding='utf-8-sig') as csvfile:
-                reader = csv.DictReader(csvfile)
-                for row in reader:
-                    # 现在CSV里没有 Contestant 列了，直接用文件名里的 c_name
-                    if c_name not in data: data[c_name] = {}
-                    if ref_idx not in data[c_name]: data[c_name][ref_idx] = []
-
-                    try:
-                        dt = parse_time(row["SystemTime"])
-                        data[c_name][ref_idx].append({
-                            "dt": dt,
-                            "plus": int(row.get("TotalPlus") or 0),
-                            "minus": int(row.get("TotalMinus") or 0),
-                            "total": int(row.get("CurrentTotal") or 0)
-                        })
-                    except: pass
-
-        # 排序
-        for p in data:
-            for r in data[p]:
-                data[p][r].sort(key=lambda x: x['dt'])
-        return data
-
-    def _generate_txt_content(self, events):
-        """生成 TXT: 时间戳 | 正分 | 总分 | 负分"""
-        lines = ["Timestamp\tPlus\tTotal\tMinus"]
-        if not events: return ""
-
-        start_time = events[0]['dt']
-        for e in events:
-            # 相对时间 (秒)
-            delta = (e['dt'] - start_time).total_seconds()
-            lines.append(f"{delta:.3f}\t{e['plus']}\t{e['total']}\t{e['minus']}")
-
-        return "\n".join(lines)
-
-    def _generate_srt_content(self, events, mode):
-      if not events: return ""
-
-      srt_entries = []
-      start_time_base = events[0]['dt']
-
-      if mode == 'REALTIME':
-        # 1. 阈值修正：与 OverlapView 保持一致 (300ms)
-        BURST_THRESHOLD = 0.3
-        DISPLAY_DURATION = 1.0
-
-        # 2. 智能基准修正：解决“导入显示+8”的问题
-        # 默认认为是从 0 开始（prev=0），这样第一下点击（+1）会被正确记录。
-        prev = {'plus': 0, 'minus': 0}
-
-        # 但如果第一条数据的绝对值大于 1（例如 +8），说明这是中途接入或重连的数据。
-        # 此时应将第一条数据设为“基准”，避免产生一个巨大的 "+8" 字幕。
-        if events:
-          first = events[0]
-          # 设定一个容错阈值（这里设为1），只有超过此值才视为“状态恢复”
-          if abs(first['plus']) > 1 or abs(first['minus']) > 1:
-            prev = {'plus': first['plus'], 'minus': first['minus']}
-
-        current_burst = None  # { start_dt, last_dt, val_plus, val_minus }
-
-        for e in events:
-          delta_p = e['plus'] - prev['plus']
-          delta_m = e['minus'] - prev['minus']
-
-          # 更新 prev 必须在计算 delta 之后，但在处理逻辑之前(如果是循环内更新)
-          # 但这里我们需要保留 prev 给下一次循环，所以 prev 的更新应放在循环末尾。
-          # 注意：为了让逻辑清晰，我们先暂存当前值为 next_prev
-          next_prev = {'plus': e['plus'], 'minus': e['minus']}
-
-          # 如果没有变化（重复数据），直接跳过更新 prev（其实更新也没关系，因为值一样）
-          # 但为了逻辑严谨，我们先判断 delta
-          if delta_p == 0 and delta_m == 0:
-            prev = next_prev
-            continue
-
-          now = e['dt']
-
-          # 判定是否属于当前连击
-          is_connected = False
-          if current_burst:
-            diff = (now - current_burst['last_dt']).total_seconds()
-            if diff < BURST_THRESHOLD:
-              is_connected = True
-
-          if is_connected:
-            # 累加
-            current_burst['val_plus'] += delta_p
-            current_burst['val_minus'] += delta_m
-            current_burst['last_dt'] = now
-          else:
-            # 结算上一个
-            if current_burst:
-              srt_entries.append(self._make_srt_entry(current_burst, start_time_base, DISPLAY_DURATION))
-
-            # 开启新连击
-            current_burst = {
-              'start_dt': now,
-              'last_dt': now,
-              'val_plus': delta_p,
-              'val_minus': delta_m
-            }
-
-          # 循环结束前更新 prev
-          prev = next_prev
-
-        # 结算最后一个
-        if current_burst:
-          srt_entries.append(self._make_srt_entry(current_burst, start_time_base, DISPLAY_DURATION))
-
-      else:
-        # TOTAL 或 SPLIT 模式 (保持原样)
-        prev_val = None
-        last_entry = None
-
-        for e in events:
-          val_str = ""
-          if mode == 'TOTAL':
-            val_str = str(e['total'])
-            curr_compare = e['total']
-          else:  # SPLIT
-            val_str = f"+{e['plus']} / -{e['minus']}"
-            curr_compare = (e['plus'], e['minus'])
-
-          if curr_compare != prev_val:
-            now = e['dt']
-            if last_entry:
-              time_since_prev = (now - last_entry['start_abs']).total_seconds()
-              if time_since_prev < 1.0:
-                last_entry['end_abs'] = now
-
-            entry = {
-              'start_abs': now,
-              'end_abs': now + timedelta(seconds=1),
-              'text': val_str
-            }
-            srt_entries.append(entry)
-            last_entry = entry
-            prev_val = curr_compare
-
-      # 生成最终字符串
-      output = []
-      for idx, entry in enumerate(srt_entries):
-        start_rel = entry['start_abs'] - start_time_base
-        end_rel = entry['end_abs'] - start_time_base
-        t1 = format_srt_time(start_rel)
-        t2 = format_srt_time(end_rel)
-
-        text = entry.get('text')
-        if mode == 'REALTIME' and not text:
-          p = entry['val_plus']
-          m = entry['val_minus']
-          parts = []
-          if p > 0: parts.append(f"+{p}")
-          if m > 0: parts.append(f"-{m}")
-          text = " ".join(parts)
-
-        if text:
-          output.append(f"{idx + 1}\n{t1} --> {t2}\n{text}\n")
-
-      return "\n".join(output)
-
-    def _make_srt_entry(self, burst, base, duration):
-        return {
-            'start_abs': burst['start_dt'],
-            'end_abs': burst['last_dt'] + timedelta(seconds=duration),  # 停留1秒
-            'val_plus': burst['val_plus'],
-            'val_minus': burst['val_minus']
-        }
+    def _render_jobs(self, jobs):
+        """
+        按提交顺序产出每个 (选手, 裁判) 的导出文件
+        事件列表取自 storage.get_events (CSV 后端为事件缓存，SQLite 后端为索引查询)；
+        进程池模式下缓存未命中的 CSV 交给工作进程解析，解析结果再写回缓存。
+        最多同时提交 workers * 2 个任务，按顺序取回结果，压缩包内容与串行完全一致
+        """
+        get_events = self.storage.get_events
+        if self._pool_size() <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                events = get_events(job[3])
+                if events: yield render_ref_files(*job[:3], events, job[4])[0]
+            return
+
+        pool = self._get_pool()
+        window = deque()
+        try:
+            for job in jobs:
+                # 缓存中已有的文件只需 (增量) 刷新，不再重新解析
+                events = get_events(job[3], parse_missing=False)
+                source = events if events is not None else job[3]
+                try:
+                    fut = pool.submit(render_ref_files, *job[:3], source, job[4], True)
+                except BrokenProcessPool:
+                    # 进程池已失效：剩余任务在当前线程生成
+                    self.shutdown()
+                    fut = None
+                window.append((job, fut))
+                if len(window) >= self._pool_size() * 2:
+                    yield self._job_result(*window.popleft())
+            while window:
+                yield self._job_result(*window.popleft())
+        finally:
+            # 客户端中途断开：取消尚未开始的任务，已在运行的任务完成后删除其临时文件
+            for _, fut in window:
+                if fut and not fut.cancel():
+                    fut.add_done_callback(_discard_future)
+
+    def _job_result(self, job, fut):
+        try:
+            if fut is None: raise BrokenProcessPool("process pool unavailable")
+            files, parsed = fut.result()
+        except Exception as e:
+            # 工作进程异常 (例如被杀掉导致进程池失效)：下次导出重建进程池，本任务改为在当前线程生成
+            print(f"[Export] Worker failed on {job[1]} Ref{job[2]}: {e!r}, rendering in-process")
+            if isinstance(e, BrokenProcessPool): self.shutdown()
+            events = self.storage.get_events(job[3])
+            return render_ref_files(*job[:3], events, job[4])[0] if events else []
+        if parsed is not None:
+            self.storage.events.store(job[3], parsed)
+        return files
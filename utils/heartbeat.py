@@ -0,0 +1,104 @@
+# utils/heartbeat.py
+"""
+连接保活 (心跳)
+
+收到通知本身就证明链路存活：只有在 quiet_period 秒内没有收到任何通知时才发起一次 GATT 读取。
+比赛进行中几乎不会产生额外的读请求，把空中时间留给分数通知。
+读取超时 read_timeout 秒算一次失败，连续失败 fail_threshold 次才判定链路断开；
+期间只要收到通知，失败计数就清零。
+"""
+import time
+
+
+class Liveness:
+  """单台设备的保活状态；last_rx 由通知回调直接更新"""
+  __slots__ = ("name", "last_rx", "notifications", "reads", "read_failures", "consecutive_failures",
+               "skipped", "last_read_ms", "max_read_ms", "dead", "last_error")
+
+  def __init__(self, name):
+    self.name = name
+    self.last_rx = time.monotonic()
+    self.notifications = 0
+    self.reads = 0
+    self.read_failures = 0
+    self.consecutive_failures = 0
+    self.skipped = 0        # 因为近期有通知而省掉的读取次数
+    self.last_read_ms = None
+    self.max_read_ms = 0.0
+    self.dead = 0           # 因心跳失败判定断开的次数
+    self.last_error = None
+
+  def on_notify(self):
+    self.last_rx = time.monotonic()
+    self.notifications += 1
+    self.consecutive_failures = 0
+
+  def to_dict(self, now):
+    return {
+      "name": self.name,
+      "notifications": self.notifications,
+      "idle_ms": round((now - self.last_rx) * 1000),
+      "reads": self.reads,
+      "read_failures": self.read_failures,
+      "consecutive_failures": self.consecutive_failures,
+      "skipped_reads": self.skipped,
+      "last_read_ms": self.last_read_ms,
+      "max_read_ms": round(self.max_read_ms, 1),
+      "dead": self.dead,
+      "last_error": self.last_error
+    }
+
+
+class HeartbeatMonitor:
+  def __init__(self, quiet_period=3.0, read_timeout=2.0, fail_threshold=2):
+    self.quiet_period = quiet_period
+    self.read_timeout = read_timeout
+    self.fail_threshold = fail_threshold
+    self._devices = {}  # address -> Liveness
+
+  def configure(self, quiet_period=None, read_timeout=None, fail_threshold=None):
+    if quiet_period is not None: self.quiet_period = max(0.1, float(quiet_period))
+    if read_timeout is not None: self.read_timeout = max(0.1, float(read_timeout))
+    if fail_threshold is not None: self.fail_threshold = max(1, int(fail_threshold))
+
+  def track(self, address, name):
+    """取得 (或创建) 设备的保活状态，重新连接时沿用原有统计"""
+    lv = self._devices.get(address)
+    if lv is None:
+      lv = Liveness(name)
+      self._devices[address] = lv
+    lv.last_rx = time.monotonic()
+    lv.consecutive_failures = 0
+    return lv
+
+  def next_probe_in(self, lv):
+    """距离需要主动读取还有多少秒 (<= 0 表示现在就该读)"""
+    return lv.last_rx + self.quiet_period - time.monotonic()
+
+  def record_read(self, lv, ms):
+    lv.reads += 1
+    lv.last_read_ms = round(ms, 1)
+    lv.max_read_ms = max(lv.max_read_ms, ms)
+    lv.consecutive_failures = 0
+    # 读取成功同样证明链路存活
+    lv.last_rx = time.monotonic()
+
+  def record_failure(self, lv, error):
+    """记录一次失败；返回是否达到阈值 (应判定链路断开)"""
+    lv.reads += 1
+    lv.read_failures += 1
+    lv.consecutive_failures += 1
+    lv.last_error = str(error) or type(error).__name__
+    if lv.consecutive_failures >= self.fail_threshold:
+      lv.dead += 1
+      return True
+    return False
+
+  def get_stats(self):
+    now = time.monotonic()
+    return {
+      "quiet_period": self.quiet_period,
+      "read_timeout": self.read_timeout,
+      "fail_threshold": self.fail_threshold,
+      "devices": {addr: lv.to_dict(now) for addr, lv in self._devices.items()}
+    }
@@ -0,0 +1,151 @@
+# utils/ingest.py
+"""
+BLE 通知摄取流水线
+
+bleak 回调中只给原始 17 字节数据包打上接收时间戳并入队 (微秒级)，
+消费任务再分阶段处理：decode (解析) -> fuse (分数融合) -> persist (写日志) -> publish (广播)。
+一次可处理多个积压的数据包，同一裁判在一批内只发布一次。
+BLE 工作进程中已解码的事件通过 submit_event 进入，跳过 decode 阶段。
+
+sink 需要实现:
+  fuse(role, evt)     更新分数状态
+  persist(role, evt)  记录日志 (使用 fuse 之后的分数)
+  publish(recv_ns)    发布最新状态 (recv_ns 为本批中该 sink 最早的数据包接收时间)
+"""
+import asyncio
+import struct
+import time
+from collections import deque
+
+STAGES = ("callback", "queue", "decode", "fuse", "persist", "publish")
+
+
+class IngestPipeline:
+  def __init__(self, decode, max_pending=8192, max_batch=512):
+    self.decode = decode
+    self.max_pending = max_pending
+    self.max_batch = max_batch
+    self._pending = deque()
+    self._wakeup = asyncio.Event()
+    self._task = None
+    self.stats = {
+      "received": 0,
+      "processed": 0,
+      "dropped": 0,
+      "malformed": 0,
+      "errors": 0,
+      "batches": 0,
+      "max_batch": 0,
+      "max_pending": 0
+    }
+    # 各阶段耗时 (ns): [累计, 最大, 次数]
+    self.timing = {s: [0, 0, 0] for s in STAGES}
+
+  def configure(self, max_pending=None, max_batch=None):
+    if max_pending is not None: self.max_pending = int(max_pending)
+    if max_batch is not None: self.max_batch = int(max_batch)
+
+  def _observe(self, stage, ns):
+    t = self.timing[stage]
+    t[0] += ns
+    t[2] += 1
+    if ns > t[1]: t[1] = ns
+
+  def submit(self, sink, role, data):
+    """在 BLE 回调中调用：只打时间戳并入队"""
+    recv_ns = time.perf_counter_ns()
+    self.stats["received"] += 1
+    if len(self._pending) >= self.max_pending:
+      self.stats["dropped"] += 1
+      return
+    self._pending.append((sink, role, bytes(data), recv_ns))
+    if self._task is None:
+      self._task = asyncio.create_task(self._run())
+    self._wakeup.set()
+    self._observe("callback", time.perf_counter_ns() - recv_ns)
+
+  def submit_event(self, sink, role, evt):
+    """提交已解码的事件 (来自 BLE 工作进程)"""
+    recv_ns = time.perf_counter_ns()
+    self.stats["received"] += 1
+    if len(self._pending) >= self.max_pending:
+      self.stats["dropped"] += 1
+      return
+    self._pending.append((sink, role, evt, recv_ns))
+    if self._task is None:
+      self._task = asyncio.create_task(self._run())
+    self._wakeup.set()
+
+  async def _run(self):
+    try:
+      while True:
+        await self._wakeup.wait()
+        self._wakeup.clear()
+        while self._pending:
+          self._process_batch()
+          # 积压较多时让出事件循环，避免饿死其它任务
+          if self._pending: await asyncio.sleep(0)
+    except asyncio.CancelledError:
+      pass
+
+  def _process_batch(self):
+    pending = self._pending
+    depth = len(pending)
+    if depth > self.stats["max_pending"]: self.stats["max_pending"] = depth
+    n = min(depth, self.max_batch)
+    batch = [pending.popleft() for _ in range(n)]
+    self.stats["batches"] += 1
+    if n > self.stats["max_batch"]: self.stats["max_batch"] = n
+
+    now = time.perf_counter_ns()
+    to_publish = {}
+    for sink, role, data, recv_ns in batch:
+      self._observe("queue", now - recv_ns)
+
+      t0 = time.perf_counter_ns()
+      if type(data) is bytes:
+        try:
+          evt = self.decode(data)
+        except (ValueError, struct.error):
+          self.stats["malformed"] += 1
+          continue
+        t1 = time.perf_counter_ns()
+        self._observe("decode", t1 - t0)
+      else:
+        evt, t1 = data, t0
+
+      try:
+        sink.fuse(role, evt)
+        t2 = time.perf_counter_ns()
+        self._observe("fuse", t2 - t1)
+        sink.persist(role, evt)
+        self._observe("persist", time.perf_counter_ns() - t2)
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Ingest] Error handling packet from {role}: {e!r}")
+        continue
+
+      self.stats["processed"] += 1
+      if id(sink) not in to_publish: to_publish[id(sink)] = (sink, recv_ns)
+
+    for sink, first_ns in to_publish.values():
+      t0 = time.perf_counter_ns()
+      try:
+        sink.publish(first_ns)
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Ingest] Publish error: {e!r}")
+      self._observe("publish", time.perf_counter_ns() - t0)
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["pending"] = len(self._pending)
+    s["stages_us"] = {
+      stage: {
+        "avg": round(total / count / 1000, 2) if count else 0.0,
+        "max": round(mx / 1000, 2),
+        "count": count
+      }
+      for stage, (total, mx, count) in self.timing.items()
+    }
+    return s
@@ -0,0 +1,146 @@
+# utils/project_catalog.py
+"""
+历史项目目录索引 (match_data/.catalog.json)
+
+缓存每个项目 config.json 的内容、项目目录的 mtime(ns) 以及 config.json 自身的 mtime(ns) 与大小。
+列出项目时只需 scandir + stat 各项目目录与其 config.json：都未变的项目直接复用缓存，
+变化或新增的项目才重新读取 config.json。原地改写 config.json 不会改变目录 mtime，由文件自身的 stat 识别。
+create_project / save_config / delete_project 会同步更新索引。
+"""
+import json
+import os
+import threading
+
+CATALOG_FILENAME = ".catalog.json"
+CATALOG_VERSION = 2
+
+
+class ProjectCatalog:
+  def __init__(self, base_dir):
+    self.base_dir = base_dir
+    self.path = os.path.join(base_dir, CATALOG_FILENAME)
+    # dir_name -> {"mtime": 目录 mtime_ns, "config_stat": [config.json 的 mtime_ns, 大小] 或 None,
+    #              "config": dict 或 None (config.json 无法解析)}
+    self._entries = {}
+    self._order = None  # 按 mtime 倒序排列的 dir_name 列表 (None 表示需要重新排序)
+    self._lock = threading.Lock()
+    self._save_lock = threading.Lock()
+    self._dirty = False
+    self.stats = {"lists": 0, "config_reads": 0}
+    self.load()
+
+  def load(self):
+    if not os.path.exists(self.path): return
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      if data.get("version") == CATALOG_VERSION:
+        self._entries = data.get("entries") or {}
+    except Exception as e:
+      print(f"[Catalog] Failed to load {self.path}, rebuilding: {e}")
+      self._entries = {}
+
+  def _read_config(self, dir_name):
+    self.stats["config_reads"] += 1
+    try:
+      with open(os.path.join(self.base_dir, dir_name, "config.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+    except Exception:
+      return None
+
+  def _dir_mtime(self, dir_name):
+    try:
+      return os.stat(os.path.join(self.base_dir, dir_name)).st_mtime_ns
+    except OSError:
+      return None
+
+  def _config_stat(self, dir_name):
+    # 保存为列表，与从索引文件读回的 JSON 数组可以直接比较
+    try:
+      st = os.stat(os.path.join(self.base_dir, dir_name, "config.json"))
+      return [st.st_mtime_ns, st.st_size]
+    except OSError:
+      return None
+
+  def _sync(self):
+    """与磁盘对比：新增/目录或 config.json 有变化的项目重新读取配置，已删除的项目移出索引 (持有锁时调用)"""
+    seen = set()
+    changed = False
+    with os.scandir(self.base_dir) as it:
+      for entry in it:
+        # 跳过 .index 等内部目录
+        if entry.name.startswith(".") or not entry.is_dir(): continue
+        try:
+          mtime = entry.stat().st_mtime_ns
+        except OSError:
+          continue
+        seen.add(entry.name)
+        config_stat = self._config_stat(entry.name)
+        cached = self._entries.get(entry.name)
+        if cached is not None and cached["mtime"] == mtime and cached["config_stat"] == config_stat: continue
+        self._entries[entry.name] = {"mtime": mtime, "config_stat": config_stat,
+                                     "config": self._read_config(entry.name)}
+        changed = True
+    for name in [n for n in self._entries if n not in seen]:
+      del self._entries[name]
+      changed = True
+    if changed or self._order is None:
+      self._dirty = self._dirty or changed
+      self._order = sorted((n for n, e in self._entries.items() if e["config"] is not None),
+                           key=lambda n: self._entries[n]["mtime"], reverse=True)
+
+  def list(self, offset=0, limit=None):
+    """
+    按目录修改时间倒序返回 (项目配置列表, 总数)，每项带 dir_name
+    offset / limit 用于分页 (limit 为 None 时返回 offset 之后的全部)
+    """
+    if not os.path.isdir(self.base_dir): return [], 0
+    with self._lock:
+      self.stats["lists"] += 1
+      self._sync()
+      total = len(self._order)
+      offset = max(0, int(offset or 0))
+      names = self._order[offset:] if limit is None else self._order[offset:offset + max(0, int(limit))]
+      page = [dict(self._entries[n]["config"], dir_name=n) for n in names]
+    self.save()
+    return page, total
+
+  def put(self, dir_name, config):
+    """config.json 写入后调用 (create_project / save_config)"""
+    mtime = self._dir_mtime(dir_name)
+    if mtime is None: return
+    config_stat = self._config_stat(dir_name)
+    with self._lock:
+      self._entries[dir_name] = {"mtime": mtime, "config_stat": config_stat, "config": dict(config)}
+      self._order = None
+      self._dirty = True
+
+  def remove(self, dir_name):
+    with self._lock:
+      if self._entries.pop(dir_name, None) is None: return
+      self._order = None
+      self._dirty = True
+    self.save()
+
+  def save(self):
+    """原子写入索引文件 (仅在有变化时)"""
+    with self._save_lock:
+      with self._lock:
+        if not self._dirty: return
+        payload = json.dumps({"version": CATALOG_VERSION, "entries": self._entries}, ensure_ascii=False)
+        self._dirty = False
+      tmp_path = self.path + ".tmp"
+      try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+          f.write(payload)
+        os.replace(tmp_path, self.path)
+      except Exception as e:
+        print(f"[Catalog] Save failed: {e}")
+        with self._lock:
+          self._dirty = True
+
+  def get_stats(self):
+    with self._lock:
+      s = dict(self.stats)
+      s["projects"] = sum(1 for e in self._entries.values() if e["config"] is not None)
+    return s
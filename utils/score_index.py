@@ -0,0 +1,150 @@
+# utils/score_index.py
+"""
+项目级分数摘要索引 (match_data/.index/<项目目录名>.json)
+
+记录每个 组别/选手/裁判 CSV 的最新 total/plus/minus/penalty，
+并附带对应文件的 size/mtime(ns)，用于判断条目是否过期。
+报表只需 stat 文件即可复用索引，过期条目只读取文件末尾一行刷新。
+索引文件放在项目目录之外：写入索引不会改变项目目录的 mtime (历史项目列表按它排序)。
+"""
+import os
+import csv
+import json
+import time
+import threading
+
+INDEX_DIRNAME = ".index"
+INDEX_VERSION = 1
+
+
+def index_path(project_path):
+  """项目对应的索引文件路径 (与项目目录同级的 .index 目录下)"""
+  project_path = os.path.normpath(project_path)
+  return os.path.join(os.path.dirname(project_path), INDEX_DIRNAME, os.path.basename(project_path) + ".json")
+
+
+def remove_index(project_path):
+  try:
+    os.remove(index_path(project_path))
+  except OSError:
+    pass
+
+
+def read_csv_tail(path, block_size=4096):
+  """只读取 CSV 的表头与最后一行数据，返回 dict；没有数据行时返回 None"""
+  with open(path, 'rb') as f:
+    header_line = f.readline()
+    header_end = f.tell()
+    f.seek(0, os.SEEK_END)
+    end = f.tell()
+    if end <= header_end: return None
+
+    # 从文件末尾向前按块读取，直到包含完整的最后一行
+    data = b""
+    pos = end
+    while pos > header_end:
+      step = min(block_size, pos - header_end)
+      pos -= step
+      f.seek(pos)
+      data = f.read(step) + data
+      if data.rstrip(b"\r\n").count(b"\n") >= 1: break
+
+  lines = [l for l in data.splitlines() if l.strip()]
+  if not lines: return None
+
+  header = next(csv.reader([header_line.decode('utf-8-sig')]))
+  values = next(csv.reader([lines[-1].decode('utf-8')]))
+  return dict(zip(header, values))
+
+
+def score_from_row(row):
+  """把 CSV 行 (dict) 转换为报表使用的分数结构"""
+  # 【修改】读取 MajorPenalty
+  p_val = row.get("MajorPenalty") or row.get("penalty") or 0
+  return {
+    "total": int(row.get("CurrentTotal") or 0),
+    "plus": int(row.get("TotalPlus") or 0),
+    "minus": int(row.get("TotalMinus") or 0),
+    "penalty": int(p_val)
+  }
+
+
+class ScoreIndex:
+  """单个项目的分数摘要索引 (线程安全：写入线程更新，报表接口读取)"""
+
+  def __init__(self, project_path):
+    self.project_path = project_path
+    self.path = index_path(project_path)
+    self._entries = {}  # group -> contestant -> str(ref) -> {score..., size, mtime}
+    self._lock = threading.Lock()
+    self._save_lock = threading.Lock()
+    self._dirty = False
+    self._last_save = 0.0
+    self.load()
+
+  def load(self):
+    if not os.path.exists(self.path): return
+    try:
+      with open(self.path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+      if data.get("version") == INDEX_VERSION:
+        self._entries = data.get("entries") or {}
+    except Exception as e:
+      # 索引损坏时直接重建
+      print(f"[ScoreIndex] Failed to load {self.path}, rebuilding: {e}")
+      self._entries = {}
+
+  def get(self, group, contestant, ref_idx):
+    with self._lock:
+      return self._entries.get(group, {}).get(contestant, {}).get(str(ref_idx))
+
+  def put(self, group, contestant, ref_idx, score, size, mtime):
+    """score 为 None 表示文件只有表头 (仍记录 size/mtime 以免重复读取)"""
+    with self._lock:
+      entry = dict(score) if score else {}
+      entry["size"] = size
+      entry["mtime"] = mtime
+      self._entries.setdefault(group, {}).setdefault(contestant, {})[str(ref_idx)] = entry
+      self._dirty = True
+
+  def prune(self, group, alive_keys):
+    """删除磁盘上已不存在的文件对应的条目; alive_keys 为 {(contestant, str(ref))}"""
+    with self._lock:
+      contestants = self._entries.get(group)
+      if not contestants: return
+      for c_name in list(contestants):
+        refs = contestants[c_name]
+        for ref in list(refs):
+          if (c_name, ref) not in alive_keys:
+            del refs[ref]
+            self._dirty = True
+        if not refs: del contestants[c_name]
+
+  def retain_groups(self, groups):
+    """删除已不存在的组别目录对应的条目"""
+    with self._lock:
+      for g in list(self._entries):
+        if g not in groups:
+          del self._entries[g]
+          self._dirty = True
+
+  def save(self, min_interval=0.0):
+    """原子写入索引文件；min_interval 用于写入线程中的节流"""
+    with self._save_lock:
+      with self._lock:
+        if not self._dirty: return
+        now = time.monotonic()
+        if now - self._last_save < min_interval: return
+        payload = json.dumps({"version": INDEX_VERSION, "entries": self._entries}, ensure_ascii=False)
+        self._dirty = False
+        self._last_save = now
+      tmp_path = self.path + ".tmp"
+      try:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+          f.write(payload)
+        os.replace(tmp_path, self.path)
+      except Exception as e:
+        print(f"[ScoreIndex] Save failed: {e}")
+        with self._lock:
+          self._dirty = True
@@ -0,0 +1,307 @@
+# utils/sqlite_store.py
+"""
+SQLite 事件存储 (可选后端，config.yaml 的 storage_backend: sqlite)
+
+每个项目一个 events.db (WAL 模式)，所有 组别/选手/裁判 的记录在同一张表中，
+按 (grp, contestant, ref, t_ms) 建索引：报表、已打分选手、导出都变成索引查询，不再列目录、扫描整个文件。
+
+其余代码仍以 "虚拟 CSV 路径" (<项目>/<组别>/<选手>_Ref<n>.csv，文件本身不存在) 标识一条记录流，
+写入线程与读取函数从路径中解析出 (项目库, 组别, 选手, 裁判)，因此 StorageManager 与导出逻辑两种后端共用。
+
+命令行:
+  python -m utils.sqlite_store migrate match_data/<项目目录>      # 把已有 CSV 导入 events.db (CSV 保留)
+  python -m utils.sqlite_store export-csv match_data/<项目目录> [输出目录]  # 按原 CSV 目录结构导出
+"""
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+import time
+
+from utils.event_cache import parse_time, to_ms
+from utils.storage import CSV_HEADER, CsvLogWriter, FLUSH_SECONDS, parse_contestant_filename
+
+DB_FILENAME = "events.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+  id INTEGER PRIMARY KEY,
+  grp TEXT NOT NULL,
+  contestant TEXT NOT NULL,
+  ref INTEGER NOT NULL,
+  system_time TEXT NOT NULL,
+  t_ms INTEGER NOT NULL,
+  ble_timestamp INTEGER,
+  role TEXT,
+  total INTEGER,
+  event_type INTEGER,
+  plus INTEGER,
+  minus INTEGER,
+  penalty INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_events_stream ON events (grp, contestant, ref, t_ms);
+"""
+
+INSERT_SQL = ("INSERT INTO events (grp, contestant, ref, system_time, t_ms, ble_timestamp, role, total, event_type, "
+              "plus, minus, penalty) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+def db_path_of(project_path):
+  return os.path.join(project_path, DB_FILENAME)
+
+
+def connect(db_path):
+  conn = sqlite3.connect(db_path, timeout=10.0, check_same_thread=False)
+  conn.execute("PRAGMA journal_mode=WAL")
+  conn.execute("PRAGMA synchronous=NORMAL")
+  conn.executescript(SCHEMA)
+  return conn
+
+
+def stream_of(path):
+  """虚拟 CSV 路径 -> (events.db 路径, 组别, 选手, 裁判)；不符合格式时返回 None"""
+  parsed = parse_contestant_filename(os.path.basename(path))
+  if not parsed: return None
+  group_dir = os.path.dirname(path)
+  return db_path_of(os.path.dirname(group_dir)), os.path.basename(group_dir), parsed[0], parsed[1]
+
+
+def _to_int(value):
+  try:
+    return int(value)
+  except (TypeError, ValueError):
+    return 0
+
+
+def _record(group, contestant, ref, row):
+  """CSV 行 (CSV_HEADER 顺序) -> INSERT 参数"""
+  system_time = row[0]
+  return (group, contestant, ref, system_time, to_ms(parse_time(system_time)), _to_int(row[1]), row[2],
+          _to_int(row[3]), _to_int(row[4]), _to_int(row[5]), _to_int(row[6]), _to_int(row[7]))
+
+
+class SqliteLogWriter(CsvLogWriter):
+  """
+  后台写入线程 (与 CsvLogWriter 相同的队列、批量与 flush 语义)
+  每批按项目库分组，在一个事务中 executemany 插入；max_open_files 为同时保持的数据库连接数
+  """
+  thread_name = "sqlite-log-writer"
+
+  def __init__(self, **kwargs):
+    super().__init__(**kwargs)
+    self._streams = {}  # 虚拟路径 -> stream_of(path)
+
+  def _get_handle(self, db_path):
+    conn = self._handles.get(db_path)
+    if conn is not None:
+      self._handles.move_to_end(db_path)
+      return conn
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = self._handles[db_path] = connect(db_path)
+    while len(self._handles) > self.max_open_files:
+      _, old = self._handles.popitem(last=False)
+      try:
+        old.close()
+      except Exception:
+        pass
+    return conn
+
+  def _write_batch(self, rows):
+    if not rows: return
+    t0 = time.perf_counter()
+    by_db = {}
+    for filepath, row in rows:
+      stream = self._streams.get(filepath)
+      if stream is None:
+        stream = self._streams[filepath] = stream_of(filepath)
+      if stream is None:
+        self.stats["errors"] += 1
+        continue
+      db_path, group, contestant, ref = stream
+      try:
+        by_db.setdefault(db_path, []).append(_record(group, contestant, ref, row))
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Storage Log Error] {e}")
+    for db_path, records in by_db.items():
+      try:
+        conn = self._get_handle(db_path)
+        with conn:
+          conn.executemany(INSERT_SQL, records)
+        self.stats["rows_written"] += len(records)
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Storage Log Error] {e}")
+
+    elapsed = time.perf_counter() - t0
+    FLUSH_SECONDS.observe(elapsed)
+    cost = elapsed * 1000
+    self.stats["batches"] += 1
+    self.stats["last_flush_ms"] = cost
+    self.stats["total_flush_ms"] += cost
+    if cost > self.stats["max_flush_ms"]:
+      self.stats["max_flush_ms"] = cost
+
+  def _close_all(self):
+    while self._handles:
+      _, conn = self._handles.popitem(last=False)
+      try:
+        conn.close()
+      except Exception:
+        pass
+
+
+# ==========================================================
+# 读取 (每次查询使用独立连接，可在任意线程中调用；WAL 下与写入线程互不阻塞)
+# ==========================================================
+def _query(project_path, sql, params=()):
+  db_path = db_path_of(project_path)
+  if not os.path.exists(db_path): return []
+  conn = connect(db_path)
+  try:
+    return conn.execute(sql, params).fetchall()
+  finally:
+    conn.close()
+
+
+def latest_scores(project_path):
+  """每个 组别/选手/裁判 的最后一条记录 -> {组别: {选手: {裁判: score}}}"""
+  rows = _query(project_path,
+                "SELECT grp, contestant, ref, total, plus, minus, penalty FROM events "
+                "WHERE id IN (SELECT MAX(id) FROM events GROUP BY grp, contestant, ref)")
+  report = {}
+  for grp, contestant, ref, total, plus, minus, penalty in rows:
+    report.setdefault(grp, {}).setdefault(contestant, {})[ref] = {
+      "total": total or 0, "plus": plus or 0, "minus": minus or 0, "penalty": penalty or 0
+    }
+  return report
+
+
+def scored_groups(project_path):
+  """有记录的选手 -> {组别: set(选手)}"""
+  groups = {}
+  for grp, contestant in _query(project_path, "SELECT DISTINCT grp, contestant FROM events"):
+    groups.setdefault(grp, set()).add(contestant)
+  return groups
+
+
+def group_streams(project_path, group):
+  """组内有记录的 {选手: {裁判: 虚拟路径}}"""
+  streams = {}
+  group_dir = os.path.join(project_path, group)
+  for contestant, ref in _query(project_path, "SELECT DISTINCT contestant, ref FROM events WHERE grp = ?", (group,)):
+    streams.setdefault(contestant, {})[ref] = os.path.join(group_dir, f"{contestant}_Ref{ref}.csv")
+  return streams
+
+
+def load_events(path):
+  """虚拟路径对应的事件列表 (与 ParsedCsv.events 结构、排序一致)"""
+  stream = stream_of(path)
+  if stream is None: return []
+  db_path, group, contestant, ref = stream
+  rows = _query(os.path.dirname(db_path),
+                "SELECT system_time, plus, minus, total, penalty FROM events WHERE grp = ? AND contestant = ? AND ref = ? "
+                "ORDER BY t_ms, id", (group, contestant, ref))
+  return [{"dt": parse_time(t), "plus": p or 0, "minus": m or 0, "total": total or 0, "penalty": pen or 0}
+          for t, p, m, total, pen in rows]
+
+
+def has_events(project_path):
+  return bool(_query(project_path, "SELECT 1 FROM events LIMIT 1"))
+
+
+# ==========================================================
+# CSV <-> SQLite
+# ==========================================================
+def _iter_csv_files(project_path):
+  for group in sorted(os.listdir(project_path)):
+    group_dir = os.path.join(project_path, group)
+    if not os.path.isdir(group_dir): continue
+    for f in sorted(os.listdir(group_dir)):
+      parsed = parse_contestant_filename(f)
+      if parsed: yield group, parsed[0], parsed[1], os.path.join(group_dir, f)
+
+
+def migrate_csv_project(project_path, force=False):
+  """
+  把项目中已有的 CSV 导入 events.db (一次性，CSV 文件保留)
+  events.db 中已有记录时不重复导入 (force=True 时清空后重新导入)；返回导入的行数
+  """
+  conn = connect(db_path_of(project_path))
+  try:
+    if conn.execute("SELECT 1 FROM events LIMIT 1").fetchone():
+      if not force: return 0
+      with conn:
+        conn.execute("DELETE FROM events")
+    rows = 0
+    for group, contestant, ref, path in _iter_csv_files(project_path):
+      records = []
+      with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None) or CSV_HEADER
+        idx = {name: i for i, name in enumerate(header)}
+        for line in reader:
+          if not line: continue
+          # 按表头取列 (兼容缺少 MajorPenalty 列的旧文件)
+          row = [line[idx[name]] if name in idx and idx[name] < len(line) else "" for name in CSV_HEADER]
+          records.append(_record(group, contestant, ref, row))
+      with conn:
+        conn.executemany(INSERT_SQL, records)
+      rows += len(records)
+    return rows
+  finally:
+    conn.close()
+
+
+def export_csv(project_path, out_dir=None):
+  """按原 CSV 目录结构 (<组别>/<选手>_Ref<n>.csv) 导出 events.db，返回写出的文件数"""
+  out_dir = out_dir or project_path
+  rows = _query(project_path,
+                "SELECT grp, contestant, ref, system_time, ble_timestamp, role, total, event_type, plus, minus, penalty "
+                "FROM events ORDER BY grp, contestant, ref, id")
+  files = 0
+  current, f, writer = None, None, None
+  try:
+    for grp, contestant, ref, *values in rows:
+      key = (grp, contestant, ref)
+      if key != current:
+        if f: f.close()
+        group_dir = os.path.join(out_dir, grp)
+        os.makedirs(group_dir, exist_ok=True)
+        f = open(os.path.join(group_dir, f"{contestant}_Ref{ref}.csv"), 'w', newline='', encoding='utf-8-sig')
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER)
+        current = key
+        files += 1
+      writer.writerow(values)
+  finally:
+    if f: f.close()
+  return files
+
+
+def main():
+  parser = argparse.ArgumentParser(description="SQLite event store tools")
+  sub = parser.add_subparsers(dest="cmd", required=True)
+  p_migrate = sub.add_parser("migrate", help="import a project's CSV files into events.db")
+  p_migrate.add_argument("project")
+  p_migrate.add_argument("--force", action="store_true", help="re-import even if events.db already has rows")
+  p_export = sub.add_parser("export-csv", help="write events.db back out as per-contestant CSV files")
+  p_export.add_argument("project")
+  p_export.add_argument("out_dir", nargs="?")
+  args = parser.parse_args()
+
+  if not os.path.isdir(args.project):
+    print(f"Project directory not found: {args.project}")
+    sys.exit(1)
+  t0 = time.perf_counter()
+  if args.cmd == "migrate":
+    rows = migrate_csv_project(args.project, args.force)
+    print(f"[SQLite] Imported {rows} rows into {db_path_of(args.project)} in {time.perf_counter() - t0:.2f}s")
+  else:
+    files = export_csv(args.project, args.out_dir)
+    print(f"[SQLite] Wrote {files} CSV files to {args.out_dir or args.project} in {time.perf_counter() - t0:.2f}s")
+
+
+if __name__ == "__main__":
+  main()
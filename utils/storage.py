@@ -2,9 +2,19 @@ import os
 import csv
 import json
 import sys
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime
 import shutil
 
+from utils.score_index import ScoreIndex, read_csv_tail, remove_index, score_from_row
+from utils.event_cache import EventCache, to_ms
+from utils.waveform import WaveformStore
+from utils.project_catalog import ProjectCatalog
+from utils.metrics import metrics
+
 # --- 1. 路径定义逻辑 (支持开发环境和打包后的 EXE 环境) ---
 if getattr(sys, 'frozen', False):
   # 打包后：数据存在 EXE 同级目录
@@ -19,6 +29,248 @@ else:
 # 基础数据存储路径
 BASE_DIR = os.path.join(PROJECT_ROOT, "match_data")
 
+LOG_DATA_SECONDS = metrics.histogram("ft_storage_log_data_seconds", "Time spent in StorageManager.log_data")
+FLUSH_SECONDS = metrics.histogram("ft_storage_flush_seconds", "Time to write and flush one CSV writer batch")
+
+# 选手 CSV 表头
+CSV_HEADER = [
+  "SystemTime", "BLE_Timestamp", "DeviceRole",
+  "CurrentTotal", "EventType", "TotalPlus", "TotalMinus", "MajorPenalty"
+]
+
+
+def safe_name(name, default):
+  """清洗组别/选手名用作目录或文件名 (对已清洗的名称幂等)"""
+  cleaned = "".join([c for c in (name or "") if c.isalnum() or c in (' ', '_', '-')]).strip()
+  return cleaned or default
+
+
+def parse_contestant_filename(filename):
+  """解析文件名 Player_Ref1.csv -> ("Player", 1)，不符合格式时返回 None"""
+  if not filename.endswith(".csv") or "_Ref" not in filename: return None
+  try:
+    base_name = filename.replace(".csv", "")
+    player_part, ref_part = base_name.rsplit("_Ref", 1)
+    ref_idx = int(ref_part)
+  except:
+    return None
+  if not player_part: return None
+  return player_part, ref_idx
+
+
+class CsvLogWriter:
+  """
+  后台 CSV 写入线程
+  log_data 只把行放入有界队列，磁盘 I/O (建目录、打开文件、写入) 全部在该线程完成，
+  按时间间隔或行数批量刷新，并以 LRU 方式保持每个选手/裁判文件的句柄。
+  队列满时 (磁盘过慢) 行暂存在溢出区，由写入线程按顺序取回，事件循环永不阻塞；
+  溢出区也有上限 (max_overflow)，再满时丢弃新行并计数 (dropped_rows)，内存占用始终有界。
+  """
+  thread_name = "csv-log-writer"
+
+  def __init__(self, max_queue=10000, flush_interval=0.2, flush_rows=256, max_open_files=32, max_overflow=100000,
+               on_batch=None):
+    self._queue = queue.Queue(maxsize=max_queue)
+    self.max_overflow = max_overflow
+    # 每批写盘后回调 on_batch([(filepath, last_row, size, mtime_ns), ...])，用于维护摘要索引
+    self.on_batch = on_batch
+    self.flush_interval = flush_interval
+    self.flush_rows = flush_rows
+    self.max_open_files = max_open_files
+    self._handles = OrderedDict()  # filepath -> (file, csv.writer)
+    self._thread = None
+    self._lock = threading.Lock()
+    # 队列满时的溢出区 (非空时新数据也进入溢出区，保持顺序)
+    self._overflow = deque()
+    self._overflow_lock = threading.Lock()
+    self.stats = {
+      "rows_written": 0,
+      "batches": 0,
+      "blocked_puts": 0,     # 入队时队列已满的次数 (不再阻塞，该行转入溢出区)
+      "overflow_rows": 0,    # 进入溢出区的行数
+      "max_overflow_depth": 0,
+      "dropped_rows": 0,     # 溢出区也已满时丢弃的行数
+      "errors": 0,
+      "max_queue_depth": 0,
+      "last_flush_ms": 0.0,
+      "max_flush_ms": 0.0,
+      "total_flush_ms": 0.0
+    }
+
+  def configure(self, max_queue=None, flush_interval=None, flush_rows=None, max_open_files=None, max_overflow=None):
+    if max_queue is not None: self._queue.maxsize = int(max_queue)
+    if max_overflow is not None: self.max_overflow = int(max_overflow)
+    if flush_interval is not None: self.flush_interval = float(flush_interval)
+    if flush_rows is not None: self.flush_rows = int(flush_rows)
+    if max_open_files is not None: self.max_open_files = int(max_open_files)
+
+  def _ensure_thread(self):
+    if self._thread and self._thread.is_alive(): return
+    with self._lock:
+      if self._thread and self._thread.is_alive(): return
+      self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+      self._thread.start()
+
+  def _put(self, item, droppable=True):
+    """
+    不阻塞地入队；队列已满或溢出区非空时放入溢出区
+    返回 None (已入队)、"overflow" (进入溢出区) 或 "dropped" (溢出区已满被丢弃，droppable=False 时不丢弃)
+    """
+    with self._overflow_lock:
+      if not self._overflow:
+        try:
+          self._queue.put_nowait(item)
+          return None
+        except queue.Full:
+          pass
+      if droppable and len(self._overflow) >= self.max_overflow:
+        return "dropped"
+      self._overflow.append(item)
+      if len(self._overflow) > self.stats["max_overflow_depth"]:
+        self.stats["max_overflow_depth"] = len(self._overflow)
+      return "overflow"
+
+  def _refill(self):
+    """写入线程中调用：把溢出区的数据按顺序移回队列"""
+    with self._overflow_lock:
+      while self._overflow:
+        try:
+          self._queue.put_nowait(self._overflow[0])
+        except queue.Full:
+          break
+        self._overflow.popleft()
+
+  def submit(self, filepath, row):
+    """入队一行数据 (在事件循环中调用，不触碰磁盘，也不会阻塞)"""
+    self._ensure_thread()
+    result = self._put((filepath, row))
+    if result is not None:
+      # 队列已满：写入线程跟不上，记录背压 (该行在溢出区中等待写入，溢出区也满时丢弃)
+      self.stats["blocked_puts"] += 1
+      if result == "overflow":
+        self.stats["overflow_rows"] += 1
+      else:
+        if not self.stats["dropped_rows"]:
+          print(f"[Storage] Writer overflow full ({self.max_overflow} rows), dropping rows; see dropped_rows")
+        self.stats["dropped_rows"] += 1
+    depth = self._queue.qsize()
+    if depth > self.stats["max_queue_depth"]:
+      self.stats["max_queue_depth"] = depth
+
+  def flush(self, close=False, timeout=10.0):
+    """阻塞直到此前入队的数据全部落盘；close=True 时同时关闭所有文件句柄"""
+    if not self._thread or not self._thread.is_alive():
+      if close: self._close_all()
+      return True
+    done = threading.Event()
+    # flush 标记不受溢出区上限限制，否则调用方会一直等到超时
+    self._put(("__flush__", (done, close)), droppable=False)
+    return done.wait(timeout)
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["queue_depth"] = self._queue.qsize()
+    s["overflow_depth"] = len(self._overflow)
+    s["open_files"] = len(self._handles)
+    s["avg_flush_ms"] = (s["total_flush_ms"] / s["batches"]) if s["batches"] else 0.0
+    return s
+
+  def _run(self):
+    pending = []
+    deadline = None
+    while True:
+      timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+      try:
+        filepath, row = self._queue.get(timeout=timeout)
+      except queue.Empty:
+        filepath, row = None, None
+      if self._overflow: self._refill()
+
+      if filepath == "__flush__":
+        done, close = row
+        self._write_batch(pending)
+        pending, deadline = [], None
+        if close: self._close_all()
+        done.set()
+        continue
+
+      if filepath is not None:
+        pending.append((filepath, row))
+        if deadline is None:
+          deadline = time.monotonic() + self.flush_interval
+
+      if pending and (len(pending) >= self.flush_rows or time.monotonic() >= deadline):
+        self._write_batch(pending)
+        pending, deadline = [], None
+
+  def _get_handle(self, filepath):
+    entry = self._handles.get(filepath)
+    if entry:
+      self._handles.move_to_end(filepath)
+      return entry
+
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    is_new = not os.path.exists(filepath) or os.path.getsize(filepath) == 0
+    f = open(filepath, 'a', newline='', encoding='utf-8-sig')
+    writer = csv.writer(f)
+    # 如果文件不存在，写入表头
+    if is_new: writer.writerow(CSV_HEADER)
+    entry = (f, writer)
+    self._handles[filepath] = entry
+
+    while len(self._handles) > self.max_open_files:
+      _, (old_f, _) = self._handles.popitem(last=False)
+      try:
+        old_f.close()
+      except Exception:
+        pass
+    return entry
+
+  def _write_batch(self, rows):
+    if not rows: return
+    t0 = time.perf_counter()
+    touched = {}
+    for filepath, row in rows:
+      try:
+        f, writer = self._get_handle(filepath)
+        writer.writerow(row)
+        touched[filepath] = (f, row)
+        self.stats["rows_written"] += 1
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Storage Log Error] {e}")
+    flushed = []
+    for filepath, (f, row) in touched.items():
+      try:
+        f.flush()
+        st = os.fstat(f.fileno())
+        flushed.append((filepath, row, st.st_size, st.st_mtime_ns))
+      except Exception as e:
+        self.stats["errors"] += 1
+        print(f"[Storage Flush Error] {e}")
+    if self.on_batch and flushed:
+      try:
+        self.on_batch(flushed)
+      except Exception as e:
+        print(f"[Storage Index Error] {e}")
+
+    elapsed = time.perf_counter() - t0
+    FLUSH_SECONDS.observe(elapsed)
+    cost = elapsed * 1000
+    self.stats["batches"] += 1
+    self.stats["last_flush_ms"] = cost
+    self.stats["total_flush_ms"] += cost
+    if cost > self.stats["max_flush_ms"]:
+      self.stats["max_flush_ms"] = cost
+
+  def _close_all(self):
+    while self._handles:
+      _, (f, _) = self._handles.popitem(last=False)
+      try:
+        f.close()
+      except Exception:
+        pass
+
 
 class StorageManager:
   def __init__(self):
@@ -28,15 +280,125 @@ class StorageManager:
     if not os.path.exists(BASE_DIR):
       os.makedirs(BASE_DIR)
     self.current_project_path = None
+    self.writer = CsvLogWriter(on_batch=self._on_rows_flushed)
+    self._indexes = {}  # project_path -> ScoreIndex
+    self._index_lock = threading.Lock()
+    # 已解析事件缓存 (导出与报表共用)
+    self.events = EventCache()
+    # 多分辨率分数曲线 (log_data 时增量构建)
+    self.waveforms = WaveformStore()
+    # 历史项目目录索引 (/api/projects/list)
+    self.catalog = ProjectCatalog(BASE_DIR)
+    # 已打分选手 (有记录的选手)：project_path -> {组别目录名: set(选手)}，每个项目只从磁盘加载一次，之后由 log_data 维护
+    self._scored = {}
+    self._scored_lock = threading.Lock()
+    self._logged_paths = set()  # log_data 已写过的记录路径 (只在首次写入时更新已打分集合)
+    # 出现新的已打分选手时回调 on_scored(group_name, contestant_name) (服务端用于 WebSocket 推送)
+    self.on_scored = None
+    # 存储后端：csv (每个 选手/裁判 一个文件) 或 sqlite (每个项目一个 events.db，见 utils/sqlite_store.py)
+    self.backend = "csv"
+    self._sqlite = None
+    self._migrated = set()
+
+  def set_backend(self, backend):
+    """切换存储后端 (启动时、配置写入线程之前调用)"""
+    backend = (backend or "csv").lower()
+    if backend == self.backend: return
+    if backend != "sqlite":
+      print(f"[Storage] Unknown storage backend '{backend}', keeping {self.backend}")
+      return
+    from utils import sqlite_store
+    self.flush(close=True)
+    self._sqlite = sqlite_store
+    self.writer = sqlite_store.SqliteLogWriter()
+    self.backend = "sqlite"
+    print(f"[Storage] Backend: sqlite ({sqlite_store.DB_FILENAME} per project)")
+
+  def _ensure_migrated(self, project_path):
+    """SQLite 后端打开旧项目时，把已有 CSV 一次性导入 events.db"""
+    if self._sqlite is None or project_path in self._migrated: return
+    self._migrated.add(project_path)
+    if self._sqlite.has_events(project_path): return
+    try:
+      rows = self._sqlite.migrate_csv_project(project_path)
+      if rows: print(f"[Storage] Imported {rows} CSV rows into {self._sqlite.db_path_of(project_path)}")
+    except Exception as e:
+      print(f"[Storage] CSV import failed for {project_path}: {e}")
+
+  def group_files(self, group_name, project_path=None):
+    """
+    组内有记录的 {选手: {裁判序号: 路径}} (默认当前项目)
+    CSV 后端列出目录；SQLite 后端查询索引，路径为虚拟 CSV 路径 (配合 get_events 使用)
+    """
+    project_path = project_path or self.current_project_path
+    if not project_path: return {}
+    group = safe_name(group_name, "Default_Group")
+    if self._sqlite is not None:
+      self._ensure_migrated(project_path)
+      return self._sqlite.group_streams(project_path, group)
+    group_dir = os.path.join(project_path, group)
+    files = {}
+    if not os.path.isdir(group_dir): return files
+    for f in os.listdir(group_dir):
+      parsed = parse_contestant_filename(f)
+      if parsed: files.setdefault(parsed[0], {})[parsed[1]] = os.path.join(group_dir, f)
+    return files
+
+  def get_events(self, path, parse_missing=True):
+    """
+    按时间排序的事件列表 [{dt, plus, minus, total}]
+    CSV 后端经事件缓存 (parse_missing=False 时缓存未命中返回 None)；SQLite 后端直接按索引查询
+    """
+    if self._sqlite is not None:
+      return self._sqlite.load_events(path)
+    parsed = self.events.get(path, parse_missing=parse_missing)
+    return parsed.events if parsed else None
+
+  def flush(self, close=False):
+    """等待后台写入线程落盘 (切换选手/项目、停止比赛前调用)"""
+    ok = self.writer.flush(close=close)
+    with self._index_lock:
+      indexes = list(self._indexes.values())
+    for index in indexes:
+      index.save()
+    return ok
+
+  def _get_index(self, project_path):
+    with self._index_lock:
+      index = self._indexes.get(project_path)
+      if index is None:
+        index = ScoreIndex(project_path)
+        self._indexes[project_path] = index
+      return index
+
+  def _on_rows_flushed(self, items):
+    """写入线程回调：用每个文件刚写入的最后一行增量更新摘要索引"""
+    touched = set()
+    for filepath, row, size, mtime_ns in items:
+      parsed = parse_contestant_filename(os.path.basename(filepath))
+      if not parsed: continue
+      group_path = os.path.dirname(filepath)
+      index = self._get_index(os.path.dirname(group_path))
+      index.put(os.path.basename(group_path), parsed[0], parsed[1],
+                score_from_row(dict(zip(CSV_HEADER, row))), size, mtime_ns)
+      touched.add(index)
+    # 比赛进行中节流保存，flush() 时再完整落盘
+    for index in touched:
+      index.save(min_interval=2.0)
 
   def create_project(self, project_name, mode):
     """创建项目文件夹"""
+    self.flush(close=True)
     timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     safe_name = "".join([c for c in project_name if c.isalnum() or c in (' ', '_', '-')]).strip()
     folder_name = f"{timestamp}_{safe_name}"
 
     self.current_project_path = os.path.join(BASE_DIR, folder_name)
     os.makedirs(self.current_project_path, exist_ok=True)
+    # 新项目没有需要导入的 CSV，也没有已打分选手
+    self._migrated.add(self.current_project_path)
+    with self._scored_lock:
+      self._scored[self.current_project_path] = {}
 
     config = {
       "project_name": project_name,
@@ -52,105 +414,88 @@ class StorageManager:
     path = os.path.join(self.current_project_path, "config.json")
     with open(path, 'w', encoding='utf-8') as f:
       json.dump(config_data, f, ensure_ascii=False, indent=2)
+    self.catalog.put(os.path.basename(self.current_project_path), config_data)
 
-  def _get_group_dir(self, group_name):
-    """获取(并创建)组别子文件夹"""
+  def _group_path(self, group_name):
+    """计算组别子文件夹路径 (不触碰磁盘)"""
     if not self.current_project_path: return None
-    safe_group = "".join([c for c in group_name if c.isalnum() or c in (' ', '_', '-')]).strip()
-    if not safe_group: safe_group = "Default_Group"
-
-    group_path = os.path.join(self.current_project_path, safe_group)
-    if not os.path.exists(group_path):
-      os.makedirs(group_path)
-    return group_path
+    return os.path.join(self.current_project_path, safe_name(group_name, "Default_Group"))
 
   def _get_contestant_filepath(self, group_name, contestant_name, ref_index):
-    """生成文件路径: Group/选手名_RefX.csv"""
-    group_dir = self._get_group_dir(group_name)
+    """生成文件路径: Group/选手名_RefX.csv (目录由写入线程创建)"""
+    group_dir = self._group_path(group_name)
     if not group_dir: return None
 
     # 清洗选手名
-    safe_c_name = "".join([c for c in contestant_name if c.isalnum() or c in (' ', '_', '-')]).strip()
-    if not safe_c_name: safe_c_name = "Unknown_Player"
+    safe_c_name = safe_name(contestant_name, "Unknown_Player")
 
     # 文件名格式：PlayerName_Ref1.csv
     filename = f"{safe_c_name}_Ref{ref_index}.csv"
     return os.path.join(group_dir, filename)
 
-  def log_data(self, group_name, ref_index, contestant_name, score_data, event_details):
+  def log_data(self, group_name, ref_index, contestant_name, score_data, event_details, now=None):
     """
-    记录数据到单独的 CSV
+    记录数据到单独的 CSV 或 events.db (仅入队，由后台线程批量写入)
+    now: 事件时间 (默认当前时间)，实时连击检测使用同一时间戳
+    返回是否写入 (未加载项目等情况下丢弃时为 False)
     """
-    if not self.current_project_path: return
+    if not self.current_project_path: return False
+    t0 = time.perf_counter()
 
     filepath = self._get_contestant_filepath(group_name, contestant_name, ref_index)
-    if not filepath: return
-
-    # 如果文件不存在，写入表头
-    if not os.path.exists(filepath):
-      try:
-        with open(filepath, 'w', newline='', encoding='utf-8-sig') as f:
-          writer = csv.writer(f)
-          # 【修改】增加 MajorPenalty 列
-          writer.writerow([
-            "SystemTime", "BLE_Timestamp", "DeviceRole",
-            "CurrentTotal", "EventType", "TotalPlus", "TotalMinus", "MajorPenalty"
-          ])
-      except Exception as e:
-        print(f"[Storage Init Error] {e}")
-        return
-
-    system_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
-
-    # 追加写入数据
-    try:
-      with open(filepath, 'a', newline='', encoding='utf-8-sig') as f:
-        writer = csv.writer(f)
-        writer.writerow([
-          system_time,
-          event_details.get('timestamp', 0),
-          event_details.get('role', 'UNKNOWN'),
-          score_data.get('total', 0),
-          event_details.get('type', 0),
-          score_data.get('plus', 0),
-          score_data.get('minus', 0),
-          score_data.get('penalty', 0)  # 【新增】写入 penalty 数据
-        ])
-    except Exception as e:
-      print(f"[Storage Log Error] {e}")
-
-  def list_projects(self):
-    """列出所有历史项目"""
-    projects = []
-    if not os.path.exists(BASE_DIR): return []
-    dirs = sorted(os.listdir(BASE_DIR), key=lambda x: os.path.getmtime(os.path.join(BASE_DIR, x)), reverse=True)
-    for d in dirs:
-      path = os.path.join(BASE_DIR, d)
-      config_path = os.path.join(path, "config.json")
-      if os.path.isdir(path) and os.path.exists(config_path):
-        try:
-          with open(config_path, 'r', encoding='utf-8') as f:
-            cfg = json.load(f)
-            cfg['dir_name'] = d
-            projects.append(cfg)
-        except:
-          pass
-    return projects
+    if not filepath: return False
+
+    if filepath not in self._logged_paths:
+      self._logged_paths.add(filepath)
+      self._add_scored(filepath, group_name, contestant_name)
+
+    if now is None: now = datetime.now()
+    system_time = now.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+    self.writer.submit(filepath, [
+      system_time,
+      event_details.get('timestamp', 0),
+      event_details.get('role', 'UNKNOWN'),
+      score_data.get('total', 0),
+      event_details.get('type', 0),
+      score_data.get('plus', 0),
+      score_data.get('minus', 0),
+      score_data.get('penalty', 0)  # 【新增】写入 penalty 数据
+    ])
+    self.waveforms.add(filepath, to_ms(now), score_data.get('total', 0))
+    LOG_DATA_SECONDS.observe(time.perf_counter() - t0)
+    return True
+
+  def list_projects(self, offset=0, limit=None):
+    """列出历史项目 (按修改时间倒序)，返回 (当前页, 总数)；配置取自目录索引，只重新读取有变化的项目"""
+    return self.catalog.list(offset, limit)
 
   def load_project_config(self, dir_name):
     path = os.path.join(BASE_DIR, dir_name)
     config_path = os.path.join(path, "config.json")
     if os.path.exists(config_path):
+      if path != self.current_project_path:
+        self.flush(close=True)
       self.current_project_path = path
+      self._ensure_migrated(path)
+      self._scored_groups(path)
       with open(config_path, 'r', encoding='utf-8') as f:
         return json.load(f)
     return None
 
   def load_report_data(self, dir_name):
-    """解析 CSV 生成报表数据"""
+    """
+    生成报表数据 (每个 组别/选手/裁判 的最新分数)
+    优先使用摘要索引；size/mtime 不一致的条目优先用事件缓存增量刷新，否则只读取文件末尾一行
+    """
     project_path = os.path.join(BASE_DIR, dir_name)
     if not os.path.exists(project_path): return {}
+    self.flush()
+    if self._sqlite is not None:
+      self._ensure_migrated(project_path)
+      return self._sqlite.latest_scores(project_path)
 
+    index = self._get_index(project_path)
     report = {}
 
     for group_name in os.listdir(project_path):
@@ -158,76 +503,160 @@ class StorageManager:
       if not os.path.isdir(group_path): continue
 
       report[group_name] = {}
+      alive = set()
 
       for file in os.listdir(group_path):
-        if not file.endswith(".csv"): continue
-
-        if "_Ref" not in file: continue
+        parsed = parse_contestant_filename(file)
+        if not parsed: continue
+        c_name, ref_idx = parsed
 
+        path = os.path.join(group_path, file)
         try:
-          base_name = file.replace(".csv", "")
-          player_part, ref_part = base_name.rsplit("_Ref", 1)
-          ref_idx = int(ref_part)
-          c_name = player_part
-        except:
+          st = os.stat(path)
+        except OSError:
           continue
+        alive.add((c_name, str(ref_idx)))
 
-        if not c_name: continue
-
-        last_row = None
-        try:
-          with open(os.path.join(group_path, file), 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-              last_row = row
-        except Exception as e:
-          print(f"Error reading {file}: {e}")
-          continue
-
-        if last_row:
+        entry = index.get(group_name, c_name, ref_idx)
+        if entry is None or entry.get("size") != st.st_size or entry.get("mtime") != st.st_mtime_ns:
+          try:
+            cached = self.events.get(path, parse_missing=False)
+            last_row = cached.last_row if cached else read_csv_tail(path)
+            score = score_from_row(last_row) if last_row else None
+          except Exception as e:
+            print(f"Error reading {file}: {e}")
+            continue
+          index.put(group_name, c_name, ref_idx, score, st.st_size, st.st_mtime_ns)
+        elif "total" in entry:
+          score = {k: entry[k] for k in ("total", "plus", "minus", "penalty")}
+        else:
+          score = None
+
+        if score:
           if c_name not in report[group_name]:
             report[group_name][c_name] = {}
+          report[group_name][c_name][ref_idx] = score
 
-          # 【修改】读取 MajorPenalty
-          p_val = last_row.get("MajorPenalty") or last_row.get("penalty") or 0
-
-          report[group_name][c_name][ref_idx] = {
-            "total": int(last_row.get("CurrentTotal") or 0),
-            "plus": int(last_row.get("TotalPlus") or 0),
-            "minus": int(last_row.get("TotalMinus") or 0),
-            "penalty": int(p_val)  # 【新增】存入内存
-          }
+      index.prune(group_name, alive)
 
+    index.retain_groups(report)
+    index.save()
     return report
 
-  def get_scored_players(self, group_name):
-    """获取已打分选手"""
-    if not self.current_project_path: return []
-    group_dir = self._get_group_dir(group_name)
-    if not os.path.exists(group_dir): return []
-
-    scored_contestants = set()
+  def load_waveform(self, dir_name, group_name, contestant_name, start=None, end=None, last=None, width=800):
+    """
+    某个选手各裁判的降采样分数曲线
+    dir_name 为空时使用当前项目；start / end 为相对返回的 t0 的毫秒数，last 表示只取最后 last 毫秒
+    返回 {"t0": 毫秒时间戳, "end": 最后一个点, "series": {ref: {"resolution", "points": [[t, min, max, last], ...]}}}，t 相对 t0
+    """
+    if dir_name:
+      project_path = os.path.join(BASE_DIR, os.path.basename(dir_name))
+    else:
+      project_path = self.current_project_path
+    if not project_path: return None
+    group_dir = os.path.join(project_path, safe_name(group_name, "Default_Group"))
+    c_name = safe_name(contestant_name, "Unknown_Player")
+
+    # 已落盘的记录 + 内存中尚未落盘的记录
+    paths = dict(self.group_files(group_name, project_path).get(c_name, {}))
+    for path in self.waveforms.paths_under(group_dir):
+      parsed = parse_contestant_filename(os.path.basename(path))
+      if parsed and parsed[0] == c_name: paths[parsed[1]] = path
+
+    def load_events(path):
+      # 内存中的序列被淘汰后重建：先让写入线程落盘，保证记录完整
+      self.writer.flush()
+      return self.get_events(path)
+
+    # 先取各裁判的时间范围，统一 t0，再按相同的时间窗口查询
+    bounds = {}
+    for ref_idx, path in paths.items():
+      rng = self.waveforms.time_range(path, load_events)
+      if rng: bounds[ref_idx] = rng
+    if not bounds: return {"t0": None, "end": None, "series": {}}
+    t0 = min(b[0] for b in bounds.values())
+    t_end = max(b[1] for b in bounds.values())
+
+    abs_start = t0 + int(start) if start is not None else None
+    abs_end = t0 + int(end) if end is not None else None
+    if last is not None: abs_start = max(t0, t_end - int(last))
+
+    series = {}
+    for ref_idx in sorted(bounds):
+      res = self.waveforms.query(paths[ref_idx], load_events, abs_start, abs_end, width)
+      if not res: continue
+      shift = res["t0"] - t0
+      series[ref_idx] = {
+        "resolution": res["resolution"],
+        "points": [[p[0] + shift, p[1], p[2], p[3]] for p in res["points"]]
+      }
+    return {"t0": t0, "end": t_end - t0, "series": series}
+
+  def _scored_groups(self, project_path):
+    """项目的 {组别目录名: set(选手)}；首次访问时扫描组别目录 (SQLite 后端查询 events.db)"""
+    with self._scored_lock:
+      groups = self._scored.get(project_path)
+    if groups is not None: return groups
+
+    groups = {}
     try:
-      for file in os.listdir(group_dir):
-        if file.endswith(".csv") and "_Ref" in file:
-          base_name = file.replace(".csv", "")
-          try:
-            c_name, _ = base_name.rsplit("_Ref", 1)
-            if c_name: scored_contestants.add(c_name)
-          except:
-            pass
+      if self._sqlite is not None:
+        self._ensure_migrated(project_path)
+        groups = self._sqlite.scored_groups(project_path)
+      elif os.path.isdir(project_path):
+        for group in os.listdir(project_path):
+          group_dir = os.path.join(project_path, group)
+          if not os.path.isdir(group_dir): continue
+          for f in os.listdir(group_dir):
+            parsed = parse_contestant_filename(f)
+            if parsed: groups.setdefault(group, set()).add(parsed[0])
     except Exception as e:
       print(f"Error scanning scored players: {e}")
+    with self._scored_lock:
+      return self._scored.setdefault(project_path, groups)
+
+  def _add_scored(self, filepath, group_name, contestant_name):
+    """某个 选手/裁判 的第一条记录：选手加入已打分集合，新增时回调 on_scored"""
+    group_dir = os.path.dirname(filepath)
+    c_name = parse_contestant_filename(os.path.basename(filepath))[0]
+    groups = self._scored_groups(os.path.dirname(group_dir))
+    with self._scored_lock:
+      scored = groups.setdefault(os.path.basename(group_dir), set())
+      if c_name in scored: return
+      scored.add(c_name)
+    if self.on_scored:
+      try:
+        self.on_scored(group_name, contestant_name)
+      except Exception as e:
+        print(f"[Storage] on_scored callback failed: {e}")
 
-    return list(scored_contestants)
+  def get_scored_players(self, group_name):
+    """获取已打分选手 (内存集合，不访问磁盘；名称为清洗后的选手名，与文件名一致)"""
+    if not self.current_project_path: return []
+    groups = self._scored_groups(self.current_project_path)
+    with self._scored_lock:
+      return sorted(groups.get(safe_name(group_name, "Default_Group"), ()))
 
   def delete_project(self, dir_name):
     if not dir_name: return False
     safe_name = os.path.basename(dir_name)
     project_path = os.path.join(BASE_DIR, safe_name)
     if os.path.exists(project_path) and os.path.isdir(project_path):
+      # 先关闭写入线程持有的文件句柄 (Windows 下被占用的文件无法删除)
+      self.flush(close=True)
       try:
         shutil.rmtree(project_path)
+        with self._index_lock:
+          self._indexes.pop(project_path, None)
+        remove_index(project_path)
+        self.events.invalidate_prefix(project_path)
+        self.waveforms.invalidate_prefix(project_path)
+        self._migrated.discard(project_path)
+        self.catalog.remove(safe_name)
+        with self._scored_lock:
+          self._scored.pop(project_path, None)
+        prefix = os.path.join(project_path, "")
+        self._logged_paths = {p for p in self._logged_paths if not p.startswith(prefix)}
         return True
       except:
         return False
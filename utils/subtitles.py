@@ -0,0 +1,155 @@
+# utils/subtitles.py
+"""
+单次遍历的字幕/日志生成引擎
+
+iter_export_text 逐个读取事件，同时驱动 TXT 与任意多个 SRT 模式 (TOTAL / SPLIT / REALTIME)，
+每个条目一经确定就产出对应文本片段。每种输出只保留一个未结束的条目，内存占用与比赛时长无关。
+输出与旧版逐模式生成完全一致 (条目编号包含 REALTIME 中被跳过的空条目)。
+"""
+from datetime import timedelta
+
+from utils.bursts import BurstDetector, DISPLAY_DURATION_MS
+from utils.event_cache import to_ms
+
+SRT_MODES = ("TOTAL", "SPLIT", "REALTIME")
+
+# REALTIME 模式连击结束后字幕停留时间 (秒)，与实时推送的 burst_end.until 一致
+DISPLAY_DURATION = DISPLAY_DURATION_MS / 1000
+# TOTAL/SPLIT 模式字幕默认显示时间 (秒)，下一次变化更早到来时提前结束
+VALUE_DURATION = 1.0
+
+
+def format_srt_time(td):
+    total_seconds = int(td.total_seconds())
+    hours = total_seconds // 3600
+    minutes = (total_seconds % 3600) // 60
+    seconds = total_seconds % 60
+    millis = int(td.microseconds / 1000)
+    return f"{hours:02}:{minutes:02}:{seconds:02},{millis:03}"
+
+
+class _TxtTrack:
+    """TXT: 时间戳 | 正分 | 总分 | 负分"""
+
+    def __init__(self):
+        self.start_time = None
+
+    def feed(self, e):
+        if self.start_time is None:
+            self.start_time = e['dt']
+            prefix = "Timestamp\tPlus\tTotal\tMinus\n"
+        else:
+            prefix = "\n"
+        # 相对时间 (秒)
+        delta = (e['dt'] - self.start_time).total_seconds()
+        return f"{prefix}{delta:.3f}\t{e['plus']}\t{e['total']}\t{e['minus']}"
+
+    def close(self):
+        return None
+
+
+class _SrtTrack:
+    def __init__(self):
+        self.base = None
+        self.count = 0    # 已编号的条目数 (包括没有文本被跳过的条目)
+        self.written = 0
+
+    def _emit(self, start_abs, end_abs, text):
+        self.count += 1
+        if not text: return None
+        t1 = format_srt_time(start_abs - self.base)
+        t2 = format_srt_time(end_abs - self.base)
+        # 条目之间以空行分隔 (最后一条之后没有)
+        prefix = "\n" if self.written else ""
+        self.written += 1
+        return f"{prefix}{self.count}\n{t1} --> {t2}\n{text}\n"
+
+
+class _ValueTrack(_SrtTrack):
+    """TOTAL / SPLIT：数值变化时开始新字幕，1 秒内再次变化则上一条提前结束"""
+
+    def __init__(self, mode):
+        super().__init__()
+        self.mode = mode
+        self.prev_val = None
+        self.pending = None  # [start_abs, end_abs, text]
+
+    def feed(self, e):
+        if self.base is None: self.base = e['dt']
+        if self.mode == 'TOTAL':
+            val = e['total']
+            text = str(val)
+        else:  # SPLIT
+            val = (e['plus'], e['minus'])
+            text = f"+{e['plus']} / -{e['minus']}"
+        if val == self.prev_val: return None
+
+        now = e['dt']
+        out = None
+        if self.pending:
+            if (now - self.pending[0]).total_seconds() < VALUE_DURATION:
+                self.pending[1] = now
+            out = self._emit(*self.pending)
+        self.pending = [now, now + timedelta(seconds=VALUE_DURATION), text]
+        self.prev_val = val
+        return out
+
+    def close(self):
+        if not self.pending: return None
+        out = self._emit(*self.pending)
+        self.pending = None
+        return out
+
+
+class _BurstTrack(_SrtTrack):
+    """REALTIME：连击划分与实时推送共用 BurstDetector (间隔小于 300ms 的加减分合并)，显示本次连击的增量"""
+
+    def __init__(self):
+        super().__init__()
+        self.detector = BurstDetector()
+        self.base_ms = None
+
+    def feed(self, e):
+        if self.base is None:
+            self.base = e['dt']
+            self.base_ms = to_ms(e['dt'])
+        out = None
+        for kind, burst in self.detector.feed(to_ms(e['dt']), e):
+            # 新连击开始时结算上一个连击
+            if kind == "burst_end": out = self._render(burst)
+        return out
+
+    def _render(self, burst):
+        p, m = burst["plus"], burst["minus"]
+        parts = []
+        if p > 0: parts.append(f"+{p}")
+        if m > 0: parts.append(f"-{m}")
+        start_dt = self.base + timedelta(milliseconds=burst["start"] - self.base_ms)
+        last_dt = self.base + timedelta(milliseconds=burst["last"] - self.base_ms)
+        return self._emit(start_dt, last_dt + timedelta(seconds=DISPLAY_DURATION), " ".join(parts))
+
+    def close(self):
+        burst = self.detector.close()
+        return self._render(burst) if burst else None
+
+
+def _make_track(kind):
+    if kind == 'TXT': return _TxtTrack()
+    if kind == 'REALTIME': return _BurstTrack()
+    return _ValueTrack(kind)
+
+
+def iter_export_text(events, kinds):
+    """
+    单次遍历事件 (按时间排序的 [{dt, plus, minus, total, penalty}]，可以是任意迭代器)，
+    同时生成多种输出，产出 (kind, 文本片段)
+    kinds: 'TXT' 或 SRT 模式名的序列；同一 kind 的片段按顺序拼接即为完整文件
+    """
+    tracks = [(kind, _make_track(kind)) for kind in kinds]
+    for e in events:
+        for kind, track in tracks:
+            chunk = track.feed(e)
+            if chunk: yield kind, chunk
+    for kind, track in tracks:
+        chunk = track.close()
+        if chunk: yield kind, chunk
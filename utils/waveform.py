@@ -0,0 +1,222 @@
+# utils/waveform.py
+"""
+多分辨率分数曲线 (服务端降采样)
+
+每个 选手/裁判 CSV 对应一条 WaveformSeries：在若干分辨率 (默认 10ms / 100ms / 1s / 10s / 60s) 上
+按时间桶保存 min / max / last，log_data 时增量追加 (每个分辨率 O(1))。
+查询时按像素宽度选择桶数不超过 width 的最细分辨率，仍超出时再按 width 合并相邻桶，
+返回的点数与比赛时长无关，前端绘制成本恒定。
+
+历史项目 (内存中没有) 从 CSV (经事件缓存) 重建一次；log_data 新建的序列不判断文件是否已有记录
+(热路径不访问文件系统)，首次查询时用 CSV 中早于内存第一个点的事件补齐 (服务重启后继续写入已有文件的情况)。
+"""
+import bisect
+import os
+import threading
+from array import array
+from collections import OrderedDict
+
+from utils.event_cache import to_ms
+
+DEFAULT_RESOLUTIONS = (10, 100, 1000, 10000, 60000)  # 毫秒
+
+
+class _Level:
+  """单个分辨率：按桶序号递增保存 min / max / last"""
+  __slots__ = ("res", "keys", "mins", "maxs", "lasts")
+
+  def __init__(self, res):
+    self.res = res
+    self.keys = array("q")
+    self.mins = array("q")
+    self.maxs = array("q")
+    self.lasts = array("q")
+
+  def add(self, t, value):
+    k = t // self.res
+    keys = self.keys
+    # 同一个桶 (或系统时间回拨)：并入最后一个桶
+    if keys and k <= keys[-1]:
+      if value < self.mins[-1]: self.mins[-1] = value
+      if value > self.maxs[-1]: self.maxs[-1] = value
+      self.lasts[-1] = value
+      return
+    keys.append(k)
+    self.mins.append(value)
+    self.maxs.append(value)
+    self.lasts.append(value)
+
+  def points(self, lo, hi, width):
+    """[lo, hi) 范围内的桶，超过 width 个时按步长合并；返回 [[t, min, max, last], ...] (t 为相对 t0 的毫秒)"""
+    n = hi - lo
+    res = self.res
+    if n <= width:
+      return [[self.keys[i] * res, self.mins[i], self.maxs[i], self.lasts[i]] for i in range(lo, hi)]
+    step = -(-n // width)
+    out = []
+    for start in range(lo, hi, step):
+      end = min(start + step, hi)
+      out.append([self.keys[start] * res, min(self.mins[start:end]), max(self.maxs[start:end]), self.lasts[end - 1]])
+    return out
+
+
+class WaveformSeries:
+  def __init__(self, resolutions=DEFAULT_RESOLUTIONS):
+    self.t0 = None        # 第一个事件的毫秒时间戳，桶从这里开始计算
+    self.last_t = None
+    self.levels = [_Level(r) for r in sorted(resolutions)]
+    # 内存中的事件之前 CSV 里可能还有更早的事件 (服务重启后继续写入同一文件)，查询前需要补齐
+    self.needs_base = False
+
+  def add(self, t_ms, value):
+    if self.t0 is None: self.t0 = t_ms
+    t = t_ms - self.t0
+    for level in self.levels:
+      level.add(t, value)
+    self.last_t = t_ms
+
+  def merge(self, other):
+    """把 other 追加到本序列之后：按 other 最细分辨率的桶回放 min / max / last (各级的 min / max / last 保持一致)"""
+    fine = other.levels[0]
+    for i in range(len(fine.keys)):
+      t = other.t0 + fine.keys[i] * fine.res
+      self.add(t, fine.mins[i])
+      self.add(t, fine.maxs[i])
+      self.add(t, fine.lasts[i])
+    if other.last_t is not None: self.last_t = other.last_t
+
+  def query(self, start=None, end=None, width=800):
+    """
+    start / end 为毫秒时间戳 (默认整条曲线)，最多返回约 width 个点 (另加左边界前的一个点，保证曲线从正确的值开始)
+    """
+    if self.t0 is None: return None
+    width = max(1, int(width))
+    start = self.t0 if start is None else max(start, self.t0)
+    end = self.last_t if end is None else end
+    span = max(1, end - start)
+
+    # 桶数不超过 width 的最细分辨率；都超过时用最粗的一级再合并
+    level = self.levels[-1]
+    for lv in self.levels:
+      if span // lv.res <= width:
+        level = lv
+        break
+    rel_start, rel_end = start - self.t0, end - self.t0
+    lo = bisect.bisect_left(level.keys, rel_start // level.res)
+    hi = bisect.bisect_right(level.keys, rel_end // level.res)
+    if lo > 0: lo -= 1
+    return {"t0": self.t0, "resolution": level.res, "points": level.points(lo, hi, width)}
+
+  @property
+  def nbytes(self):
+    return sum(len(lv.keys) for lv in self.levels) * 32 + 256
+
+
+class WaveformStore:
+  """按 CSV 路径保存 WaveformSeries (线程安全，LRU)"""
+
+  def __init__(self, resolutions=DEFAULT_RESOLUTIONS, max_series=256):
+    self.resolutions = tuple(sorted(resolutions))
+    self.max_series = max_series
+    self._series = OrderedDict()  # path -> WaveformSeries
+    self._lock = threading.Lock()
+    self.stats = {"appends": 0, "queries": 0, "rebuilds": 0, "evictions": 0}
+
+  def configure(self, resolutions_ms=None, max_series=None):
+    with self._lock:
+      if resolutions_ms:
+        self.resolutions = tuple(sorted(int(r) for r in resolutions_ms))
+        self._series.clear()
+      if max_series is not None:
+        self.max_series = max(1, int(max_series))
+        self._evict()
+
+  def add(self, path, t_ms, value):
+    """log_data 中调用：追加一个分数点"""
+    with self._lock:
+      s = self._series.get(path)
+      if s is None:
+        s = self._series[path] = WaveformSeries(self.resolutions)
+        # 文件中可能已有更早的记录：留到首次查询时从 CSV (或 events.db) 补齐，这里不访问文件系统
+        s.needs_base = True
+        self._evict()
+      else:
+        self._series.move_to_end(path)
+      s.add(t_ms, value)
+      self.stats["appends"] += 1
+
+  def _complete(self, path, load_events):
+    """
+    取得完整的序列：内存中没有或缺少早期事件时，用 load_events(path) (按时间排序的 [{dt, total, ...}]) 重建
+    没有数据时返回 None
+    """
+    with self._lock:
+      s = self._series.get(path)
+      if s is not None and not s.needs_base:
+        self._series.move_to_end(path)
+        return s
+
+    # 在锁外解析 CSV (可能较慢)，再在锁内合并
+    try:
+      events = load_events(path) or []
+    except Exception as e:
+      print(f"[Waveform] Failed to load {path}: {e}")
+      events = []
+
+    with self._lock:
+      live = self._series.get(path)
+      if live is not None and not live.needs_base: return live
+      self.stats["rebuilds"] += 1
+      # 只取内存中第一个点之前的事件 (之后的事件都已在内存中)
+      cutoff = live.t0 if live is not None else None
+      base = WaveformSeries(self.resolutions)
+      for e in events:
+        t = to_ms(e["dt"])
+        if cutoff is not None and t >= cutoff: continue
+        base.add(t, e["total"])
+      if live is not None: base.merge(live)
+      if base.t0 is None: return None
+      self._series[path] = base
+      self._evict()
+      return base
+
+  def time_range(self, path, load_events):
+    """(第一个点, 最后一个点) 的毫秒时间戳；没有数据时返回 None"""
+    s = self._complete(path, load_events)
+    if s is None: return None
+    with self._lock:
+      return s.t0, s.last_t
+
+  def query(self, path, load_events, start=None, end=None, width=800):
+    """返回 WaveformSeries.query 的结果 (start / end 为毫秒时间戳)，没有数据时返回 None"""
+    s = self._complete(path, load_events)
+    if s is None: return None
+    with self._lock:
+      self.stats["queries"] += 1
+      return s.query(start, end, width)
+
+  def paths_under(self, prefix):
+    """内存中位于某个目录下的序列 (写入线程尚未落盘的文件也包含在内)"""
+    prefix = os.path.join(prefix, "")
+    with self._lock:
+      return [p for p in self._series if p.startswith(prefix)]
+
+  def invalidate_prefix(self, prefix):
+    prefix = os.path.join(prefix, "")
+    with self._lock:
+      for path in [p for p in self._series if p.startswith(prefix)]:
+        del self._series[path]
+
+  def _evict(self):
+    while len(self._series) > self.max_series:
+      self._series.popitem(last=False)
+      self.stats["evictions"] += 1
+
+  def get_stats(self):
+    with self._lock:
+      s = dict(self.stats)
+      s["series"] = len(self._series)
+      s["max_series"] = self.max_series
+      s["resolutions_ms"] = list(self.resolutions)
+      s["mb"] = round(sum(x.nbytes for x in self._series.values()) / 1024 / 1024, 2)
+    return s
@@ -0,0 +1,172 @@
+# utils/window_tracker.py
+"""
+共享窗口跟踪服务 (悬浮窗贴靠目标窗口)
+
+同一个窗口标题只有一个轮询任务，所有订阅者共享结果；只有位置/大小变化时才推送。
+窗口移动中按最短间隔轮询，静止后间隔逐步放大到上限，有变化时立即恢复。
+窗口标题列表与单次坐标查询带短时缓存，避免界面反复刷新时重复枚举系统窗口。
+"""
+import asyncio
+import time
+
+try:
+  import pygetwindow as gw
+except Exception:
+  # 非 Windows 环境无法加载，所有查询返回 not found
+  gw = None
+
+
+def _lookup_bounds(title):
+  """返回 (x, y, width, height)；找不到窗口时返回 None"""
+  if gw is None or not title: return None
+  wins = gw.getWindowsWithTitle(title)
+  if not wins: return None
+  w = wins[0]
+  return (w.left, w.top, w.width, w.height)
+
+
+def _list_titles():
+  if gw is None: return []
+  # 过滤掉空标题和 default IME 等系统窗口
+  return [t for t in gw.getAllTitles() if t.strip()]
+
+
+def bounds_message(bounds):
+  if bounds is None: return {"found": False}
+  x, y, width, height = bounds
+  return {"found": True, "x": x, "y": y, "width": width, "height": height}
+
+
+class _Subscriber:
+  """只保留最新状态：发送跟不上时中间的位置直接被覆盖"""
+
+  def __init__(self):
+    self.latest = None
+    self.event = asyncio.Event()
+
+  def push(self, bounds):
+    self.latest = bounds
+    self.event.set()
+
+  async def next(self):
+    await self.event.wait()
+    self.event.clear()
+    return self.latest
+
+
+class _TitleTracker:
+  def __init__(self, service, title):
+    self.service = service
+    self.title = title
+    self.subscribers = set()
+    self.bounds = None
+    self.known = False
+    self.interval = service.min_interval
+    self.polls = 0
+    self.changes = 0
+    self._task = asyncio.create_task(self._run())
+
+  async def _run(self):
+    svc = self.service
+    try:
+      while self.subscribers:
+        self.polls += 1
+        try:
+          bounds = await asyncio.to_thread(_lookup_bounds, self.title)
+        except Exception:
+          # 枚举窗口偶发失败：视为没有变化
+          bounds = self.bounds if self.known else None
+
+        if not self.known or bounds != self.bounds:
+          self.bounds = bounds
+          self.known = True
+          self.changes += 1
+          for sub in self.subscribers:
+            sub.push(bounds)
+          # 正在移动/缩放：保持最短间隔
+          self.interval = svc.min_interval
+        else:
+          self.interval = min(svc.max_interval, self.interval * svc.backoff)
+        await asyncio.sleep(self.interval)
+    except asyncio.CancelledError:
+      pass
+    finally:
+      if svc._trackers.get(self.title) is self:
+        svc._trackers.pop(self.title, None)
+
+  def add(self, sub):
+    self.subscribers.add(sub)
+    if self.known: sub.push(self.bounds)
+
+  def get_stats(self):
+    return {
+      "title": self.title,
+      "subscribers": len(self.subscribers),
+      "found": self.bounds is not None,
+      "interval_ms": round(self.interval * 1000),
+      "polls": self.polls,
+      "changes": self.changes
+    }
+
+
+class WindowTrackerService:
+  def __init__(self, min_interval=0.05, max_interval=0.5, backoff=1.5, titles_ttl=2.0, bounds_ttl=0.2):
+    self.min_interval = min_interval
+    self.max_interval = max_interval
+    self.backoff = backoff
+    self.titles_ttl = titles_ttl
+    self.bounds_ttl = bounds_ttl
+    self._trackers = {}  # title -> _TitleTracker
+    self._titles = (0.0, [])
+    self._bounds_cache = {}  # title -> (查询时间, bounds)
+
+  def configure(self, min_interval=None, max_interval=None, backoff=None, titles_ttl=None, bounds_ttl=None):
+    if min_interval is not None: self.min_interval = float(min_interval)
+    if max_interval is not None: self.max_interval = float(max_interval)
+    if backoff is not None: self.backoff = max(1.0, float(backoff))
+    if titles_ttl is not None: self.titles_ttl = float(titles_ttl)
+    if bounds_ttl is not None: self.bounds_ttl = float(bounds_ttl)
+
+  def subscribe(self, title):
+    """订阅某个窗口标题；返回的订阅者用 await sub.next() 获取变化后的坐标 (None 表示找不到)"""
+    sub = _Subscriber()
+    tracker = self._trackers.get(title)
+    if tracker is None:
+      tracker = _TitleTracker(self, title)
+      self._trackers[title] = tracker
+    tracker.add(sub)
+    return sub
+
+  def unsubscribe(self, title, sub):
+    tracker = self._trackers.get(title)
+    if tracker is None: return
+    tracker.subscribers.discard(sub)
+    if not tracker.subscribers:
+      # 最后一个订阅者离开：停止轮询
+      self._trackers.pop(title, None)
+      tracker._task.cancel()
+
+  async def get_bounds(self, title):
+    """单次查询：优先使用正在跟踪的结果，其次使用短时缓存"""
+    now = time.monotonic()
+    tracker = self._trackers.get(title)
+    if tracker is not None and tracker.known:
+      return tracker.bounds
+    cached = self._bounds_cache.get(title)
+    if cached and now - cached[0] < self.bounds_ttl:
+      return cached[1]
+    bounds = await asyncio.to_thread(_lookup_bounds, title)
+    if len(self._bounds_cache) > 64: self._bounds_cache.clear()
+    self._bounds_cache[title] = (time.monotonic(), bounds)
+    return bounds
+
+  async def list_titles(self):
+    fetched_at, titles = self._titles
+    if time.monotonic() - fetched_at < self.titles_ttl:
+      return titles
+    titles = await asyncio.to_thread(_list_titles)
+    self._titles = (time.monotonic(), titles)
+    return titles
+
+  def get_stats(self):
+    return [t.get_stats() for t in self._trackers.values()]
@@ -0,0 +1,84 @@
+# utils/ws_binary.py
+"""
+紧凑二进制 WebSocket 分数帧 (可选，客户端连接 /ws?format=binary 时启用)
+
+高频的 score_update / status_update / score_batch 每条都重复 index、name、score、status 的键名，
+二进制帧改为每个裁判一条定长记录，名称只在变化时发送一次。其它消息 (快照、上下文等) 仍为 JSON 文本帧，
+二进制客户端连接时先收到一条 JSON 快照，作为名称等状态的基准。
+
+帧布局 (小端):
+  帧头   <BBHI  magic (0xF7), 消息类型, 记录数, 全局序号 seq (见 utils/ws_hub.py 的 ResumeLog)
+  记录   <HiiiiBBB  index, total, plus, minus, penalty, 主机状态, 副机状态, 名称字节数
+         名称字节数 > 0 时紧跟 UTF-8 名称；为 0 表示名称与上次相同
+"""
+import struct
+
+MAGIC = 0xF7
+HEADER = struct.Struct("<BBHI")
+RECORD = struct.Struct("<HiiiiBBB")
+MAX_NAME_BYTES = 255
+
+MESSAGE_TYPES = {"score_update": 1, "status_update": 2, "score_batch": 3}
+MESSAGE_NAMES = {v: k for k, v in MESSAGE_TYPES.items()}
+STATUS_CODES = {"disconnected": 0, "connecting": 1, "connected": 2, "error": 3, "n/a": 4}
+STATUS_NAMES = {v: k for k, v in STATUS_CODES.items()}
+
+
+class BinaryScoreEncoder:
+  """所有二进制客户端共用一个编码器：每帧只编码一次，名称变化后只在下一帧中携带"""
+
+  def __init__(self):
+    self._names = {}  # index -> 上次发送的名称
+
+  def reset_names(self):
+    self._names.clear()
+
+  def encode(self, message):
+    """把 score_update / status_update / score_batch 编码为 bytes；其它消息返回 None"""
+    kind = MESSAGE_TYPES.get(message.get("type"))
+    if kind is None: return None
+    payloads = message["payload"] if kind == 3 else (message["payload"],)
+
+    parts = [HEADER.pack(MAGIC, kind, len(payloads), message.get("seq", 0))]
+    names = self._names
+    for p in payloads:
+      index = p["index"]
+      score = p["score"]
+      status = p.get("status") or {}
+      name = p.get("name") or ""
+      if name and names.get(index) != name:
+        raw = name.encode("utf-8")[:MAX_NAME_BYTES]
+        names[index] = name
+      else:
+        raw = b""
+      parts.append(RECORD.pack(index, score["total"], score["plus"], score["minus"], score.get("penalty", 0),
+                               STATUS_CODES.get(status.get("pri"), 0), STATUS_CODES.get(status.get("sec"), 4),
+                               len(raw)))
+      if raw: parts.append(raw)
+    return b"".join(parts)
+
+
+def decode_frame(data, names=None):
+  """
+  解码二进制帧为与 JSON 相同结构的 dict (用于测试与压测)
+  names: index -> 名称 的字典，跨帧保存已知名称 (会被更新)
+  """
+  names = {} if names is None else names
+  magic, kind, count, seq = HEADER.unpack_from(data, 0)
+  if magic != MAGIC: raise ValueError("Bad frame magic")
+  offset = HEADER.size
+  payloads = []
+  for _ in range(count):
+    index, total, plus, minus, penalty, pri, sec, name_len = RECORD.unpack_from(data, offset)
+    offset += RECORD.size
+    if name_len:
+      names[index] = bytes(data[offset:offset + name_len]).decode("utf-8", errors="replace")
+      offset += name_len
+    payloads.append({
+      "index": index,
+      "name": names.get(index),
+      "score": {"total": total, "plus": plus, "minus": minus, "penalty": penalty},
+      "status": {"pri": STATUS_NAMES.get(pri, "disconnected"), "sec": STATUS_NAMES.get(sec, "n/a")}
+    })
+  msg_type = MESSAGE_NAMES[kind]
+  return {"type": msg_type, "seq": seq, "payload": payloads if kind == 3 else payloads[0]}
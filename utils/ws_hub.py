@@ -0,0 +1,225 @@
+# utils/ws_hub.py
+"""
+WebSocket 并发扇出
+
+每个客户端拥有独立的有界发送队列和发送任务，广播只负责入队，不等待任何一个客户端。
+客户端跟不上时 (队列已满) 先把队列折叠成一条最新状态快照；
+短时间内反复折叠则判定为慢消费者并断开，避免一个卡住的 OBS 浏览器源拖慢主计分板。
+请求了二进制分数帧的客户端 (binary=True) 在广播附带二进制帧时收到 bytes，其余消息仍为文本。
+
+每条广播消息带全局递增序号 seq，最近的消息保存在 ResumeLog 环形缓冲中：
+重连的客户端带上最后收到的 seq (与服务端 epoch)，缺口在缓冲范围内则补发缺失的消息，否则下发一条快照。
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+
+class ClientConnection:
+  def __init__(self, websocket, hub, client_id, binary=False):
+    self.ws = websocket
+    self.hub = hub
+    self.id = client_id
+    self.binary = binary
+    self.queue = deque()
+    self._wakeup = asyncio.Event()
+    self._task = None
+    self._collapse_times = deque()
+    self.closed = False
+    self.connected_at = time.time()
+    self.stats = {
+      "sent": 0,
+      "errors": 0,
+      "collapses": 0,
+      "dropped": 0,
+      "max_queue": 0,
+      "last_lag_ms": 0.0,
+      "max_lag_ms": 0.0,
+      "total_lag_ms": 0.0
+    }
+
+  def start(self):
+    self._task = asyncio.create_task(self._sender_loop())
+
+  def enqueue(self, text):
+    """非阻塞入队 (str 以文本帧发送，bytes 以二进制帧发送)；队列已满时折叠为快照或断开"""
+    if self.closed: return
+    if len(self.queue) >= self.hub.max_queue:
+      self._collapse()
+      if self.closed: return
+    self.queue.append((text, time.perf_counter()))
+    if len(self.queue) > self.stats["max_queue"]:
+      self.stats["max_queue"] = len(self.queue)
+    self._wakeup.set()
+
+  def _collapse(self):
+    now = time.monotonic()
+    while self._collapse_times and now - self._collapse_times[0] > self.hub.collapse_window:
+      self._collapse_times.popleft()
+    self._collapse_times.append(now)
+    self.stats["collapses"] += 1
+    self.stats["dropped"] += len(self.queue)
+    self.queue.clear()
+
+    if len(self._collapse_times) > self.hub.max_collapses:
+      print(f"[WS] Client #{self.id} is too slow, disconnecting")
+      self.close()
+      return
+
+    # 丢弃积压的增量，用一条完整快照代替
+    if self.hub.snapshot_func:
+      self.queue.append((self.hub.snapshot_func(), time.perf_counter()))
+
+  async def _sender_loop(self):
+    try:
+      while not self.closed:
+        if not self.queue:
+          self._wakeup.clear()
+          await self._wakeup.wait()
+          continue
+        text, enqueued_at = self.queue.popleft()
+        if type(text) is bytes:
+          await self.ws.send_bytes(text)
+        else:
+          await self.ws.send_text(text)
+        lag = (time.perf_counter() - enqueued_at) * 1000
+        self.stats["sent"] += 1
+        self.stats["last_lag_ms"] = lag
+        self.stats["total_lag_ms"] += lag
+        if lag > self.stats["max_lag_ms"]:
+          self.stats["max_lag_ms"] = lag
+    except asyncio.CancelledError:
+      pass
+    except Exception:
+      # 发送失败：连接已失效，移出列表
+      self.stats["errors"] += 1
+      self.close()
+
+  def close(self):
+    if self.closed: return
+    self.closed = True
+    self.queue.clear()
+    self.hub.remove(self)
+    if self._task and self._task is not asyncio.current_task():
+      self._task.cancel()
+    asyncio.create_task(self._close_socket())
+
+  async def _close_socket(self):
+    try:
+      await self.ws.close(code=1013)
+    except Exception:
+      pass
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["id"] = self.id
+    s["binary"] = self.binary
+    s["queue_depth"] = len(self.queue)
+    s["avg_lag_ms"] = (s["total_lag_ms"] / s["sent"]) if s["sent"] else 0.0
+    s["connected_for"] = round(time.time() - self.connected_at, 1)
+    return s
+
+
+class ResumeLog:
+  """
+  最近广播消息的环形缓冲 (全局序号)
+  每条记录为 (seq, text, frame)：广播时编码好的 JSON 文本与二进制帧 (当时没有二进制客户端则 frame 为 None，补发时由文本再编码)
+  """
+
+  def __init__(self, capacity=1024, max_replay=200):
+    # 服务端每次启动生成新的 epoch：客户端带着旧 epoch 的 seq 重连时直接下发快照
+    self.epoch = os.urandom(4).hex()
+    self.seq = 0
+    self.max_replay = max_replay
+    self._entries = deque(maxlen=capacity)
+    self.stats = {"resumes": 0, "replays": 0, "replayed_messages": 0, "snapshots": 0}
+
+  def configure(self, capacity=None, max_replay=None):
+    if capacity is not None and int(capacity) != self._entries.maxlen:
+      self._entries = deque(self._entries, maxlen=max(1, int(capacity)))
+    if max_replay is not None: self.max_replay = int(max_replay)
+
+  def next_seq(self):
+    self.seq += 1
+    return self.seq
+
+  def append(self, seq, text, frame=None):
+    self._entries.append((seq, text, frame))
+
+  def since(self, seq, epoch=None):
+    """seq 之后的全部记录；无法补发 (epoch 不同、缺口超出缓冲或超过 max_replay) 时返回 None"""
+    if seq is None: return None  # 新连接
+    self.stats["resumes"] += 1
+    if epoch != self.epoch or seq > self.seq or self.seq - seq > self.max_replay:
+      self.stats["snapshots"] += 1
+      return None
+    if seq == self.seq: return []
+    entries = self._entries
+    if not entries or entries[0][0] > seq + 1:
+      self.stats["snapshots"] += 1
+      return None
+    # 序号连续，直接按偏移定位
+    start = seq + 1 - entries[0][0]
+    result = [entries[i] for i in range(start, len(entries))]
+    self.stats["replays"] += 1
+    self.stats["replayed_messages"] += len(result)
+    return result
+
+  def get_stats(self):
+    s = dict(self.stats)
+    s["epoch"] = self.epoch
+    s["seq"] = self.seq
+    s["buffered"] = len(self._entries)
+    s["capacity"] = self._entries.maxlen
+    s["max_replay"] = self.max_replay
+    return s
+
+
+class WebSocketHub:
+  def __init__(self, max_queue=256, max_collapses=5, collapse_window=10.0, snapshot_func=None):
+    self.max_queue = max_queue
+    self.max_collapses = max_collapses
+    self.collapse_window = collapse_window
+    self.snapshot_func = snapshot_func  # () -> str，返回序列化后的全量状态
+    self.clients = []
+    self.binary_clients = 0  # 请求二进制分数帧的客户端数
+    self.resume_log = ResumeLog()
+    self._next_id = 1
+
+  def configure(self, max_queue=None, max_collapses=None, collapse_window=None, resume_buffer=None, max_replay=None):
+    if max_queue is not None: self.max_queue = int(max_queue)
+    if max_collapses is not None: self.max_collapses = int(max_collapses)
+    if collapse_window is not None: self.collapse_window = float(collapse_window)
+    self.resume_log.configure(resume_buffer, max_replay)
+
+  def add(self, websocket, binary=False):
+    client = ClientConnection(websocket, self, self._next_id, binary)
+    self._next_id += 1
+    self.clients.append(client)
+    if binary: self.binary_clients += 1
+    client.start()
+    return client
+
+  def remove(self, client):
+    if client in self.clients:
+      self.clients.remove(client)
+      if client.binary: self.binary_clients -= 1
+    if not client.closed:
+      client.close()
+
+  @property
+  def text_clients(self):
+    return len(self.clients) - self.binary_clients
+
+  def broadcast_text(self, text, frame=None):
+    """frame 不为空时，二进制客户端收到 frame，其余客户端收到 text"""
+    if frame is None:
+      for client in list(self.clients):
+        client.enqueue(text)
+      return
+    for client in list(self.clients):
+      client.enqueue(frame if client.binary else text)
+
+  def get_stats(self):
+    return [c.get_stats() for c in self.clients]